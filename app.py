@@ -1,11 +1,17 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import subprocess
-import psycopg2
 from copy import deepcopy
 import os
 from dotenv import load_dotenv
-import re
+
+from medifacil_backend.cache import PharmaCache, SearchCache, normalize_names
+from medifacil_backend.db import PostgresConnectionPool
+from medifacil_backend.freshness import SearchPopularity, SearchPopularityRecorder
+from medifacil_backend.refresh import RefreshQueue, StaleRefreshEnqueuer
+from medifacil_backend.jobs import JobStore
+from medifacil_backend.spiders.CrawlerCruzAzul import CrawlCruzAzul
+from medifacil_backend.spiders.CrawlerFybeca import CrawlFybeca
+from medifacil_backend.spiders.CrawlerMedicity import CrawlMedicity
 
 # load_dotenv(): Carga las variables de entorno desde un archivo .env. En este caso, se asegura de que las variables se carguen desde el archivo especificado.
 assert load_dotenv(f"{os.getcwd()}/medifacil_backend/.env", override=True)
@@ -13,6 +19,9 @@ assert load_dotenv(f"{os.getcwd()}/medifacil_backend/.env", override=True)
 app = Flask(__name__)
 CORS(app)  # Esto habilita CORS para todas las rutas
 
+# Spiders que se pueden pedir en /scraper (las de SPIDERS en app_scraper.py)
+SPIDER_NAMES = {spider.__name__ for spider in (CrawlFybeca, CrawlMedicity, CrawlCruzAzul)}
+
 
 # Configuración de la conexión a la base de datos PostgreSQL
 hostname = os.environ["DB_HOSTNAME"]
@@ -21,21 +30,152 @@ password = os.environ["DB_PASSWORD"]  # La contraseña del usuario
 database = os.environ["DB_DATABASE"]  # La base de datos a la que te conectas
 port = os.environ["DB_PORT"]  # Puerto de PostgreSQL (el valor por defecto es 5432)
 
-def get_db_connection():
+# Pool de conexiones por worker: evita abrir una conexión (TCP + autenticación) por cada consulta
+db_pool = PostgresConnectionPool(
+    minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+    maxconn=int(os.environ.get("DB_POOL_MAX", 5)),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 5)),
+    health_check_interval=float(os.environ.get("DB_POOL_HEALTH_CHECK_INTERVAL", 30)),
+    host=hostname,
+    user=username,
+    password=password,
+    dbname=database,
+    port=port
+)
+
+def load_pharmas():
+    """
+    Lee la metadata de todas las farmacias desde la base de datos.
+
+    Returns:
+        dict: Farmacias indexadas por nombre con su location, link_logo y link.
+    """
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pharma, location, link_logo, link FROM public.pharmas")
+            results = cur.fetchall()
+
+    return {
+        row[0]: {
+            "location": row[1],
+            "link_logo": row[2],
+            "link": row[3]
+        }
+        for row in results
+    }
+
+# Caché por worker de la tabla public.pharmas: se carga al iniciar y se recarga al vencer el TTL
+pharma_cache = PharmaCache(load_pharmas, ttl=float(os.environ.get("PHARMAS_CACHE_TTL", 3600)))
+
+try:
+    pharma_cache.refresh()
+except Exception as e:
+    # Si la base de datos no está disponible al iniciar, la caché se carga en la primera búsqueda
+    app.logger.warning(f"Could not preload pharmas cache: {e}")
+
+def load_catalog_generation():
     """
-    Establece una conexión a la base de datos PostgreSQL.
+    Lee la generación actual del catálogo. El pipeline la incrementa cada vez que termina una ejecución del scraper.
 
     Returns:
-        conn (psycopg2.extensions.connection): Objeto de conexión a la base de datos.
+        int: Generación actual del catálogo.
+    """
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT generation FROM public.catalog_generation")
+            row = cur.fetchone()
+    return row[0] if row else 0
+
+# Caché de resultados de /search compartida por los workers mediante un archivo SQLite local.
+# Se invalida sola cuando el scraper termina una ejecución (cambia la generación del catálogo)
+search_cache = SearchCache(
+    os.environ.get("SEARCH_CACHE_PATH", f"{os.getcwd()}/temp/search_cache.sqlite3"),
+    load_catalog_generation,
+    max_entries=int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 5000)),
+    ttl=float(os.environ.get("SEARCH_CACHE_TTL", 21600)),
+    generation_check_interval=float(os.environ.get("CATALOG_GENERATION_CHECK_INTERVAL", 10))
+)
+search_cache.on_generation_change(pharma_cache.invalidate)
+
+# Cola de trabajos de /scraper, compartida con el daemon del scraper mediante un archivo SQLite local
+job_store = JobStore.from_env()
+
+# Búsquedas por producto: el recorrido por frescura del scraper (--discovery freshness) rastrea primero los más buscados
+# Se registran en segundo plano para no escribir en SQLite durante cada búsqueda
+popularity_recorder = SearchPopularityRecorder(
+    SearchPopularity.from_env(),
+    max_buffered=int(os.environ.get("SEARCH_POPULARITY_BUFFER", 1000))
+)
+
+# Productos desactualizados devueltos por /search: se encolan en segundo plano y los actualiza el daemon del scraper
+refresh_enqueuer = StaleRefreshEnqueuer(
+    RefreshQueue.from_env(),
+    stale_days=float(os.environ.get("SEARCH_REFRESH_STALE_DAYS", 2)),
+    max_buffered=int(os.environ.get("SEARCH_REFRESH_BUFFER", 1000))
+)
+
+# Esta instrucción SQL realiza una consulta para seleccionar medicamentos de la tabla public.medicines.
+# En alto nivel lo que hace es buscar por CADA farmacia CADA producto en una sola consulta (un solo viaje
+# a la base de datos sin importar cuántos nombres tenga la lista). Y elije el producto que mejor match de TEXTO haga
+
+# unnest(%s::text[]) WITH ORDINALITY AS terms(term, idx): Convierte el arreglo de nombres en filas, conservando
+#   la posición (idx) de cada nombre en la lista original para poder reconstruir el orden de la respuesta.
+# CROSS JOIN LATERAL ( ... ) m: Para cada nombre ejecuta la búsqueda de texto completo (to_tsquery) contra la
+#   columna almacenada name_tsv (indexada con GIN) y calcula su relevancia con ts_rank_cd sin recalcular el
+#   tsvector de cada fila. LATERAL permite que la subconsulta use terms.term.
+# SELECT DISTINCT ON (terms.idx, m.pharma): Devuelve una sola fila por (nombre, farmacia): la primera según el
+#   ORDER BY, es decir, la de mayor relevancia (m.rank DESC).
+# coalesce(m.base_name, m.name), coalesce(m.unit_price, m.price): Nombre base y precio unitario calculados al
+#   ingerir; las filas que aún no pasaron por el backfill usan el nombre y precio originales.
+SEARCH_QUERY = """
+SELECT DISTINCT ON (terms.idx, m.pharma)
+    terms.idx, m.pharma, m.name, m.price, m.url, m.url_image, m.availability,
+    coalesce(m.base_name, m.name), coalesce(m.unit_price, m.price), m.ingest_date
+FROM unnest(%s::text[]) WITH ORDINALITY AS terms(term, idx)
+CROSS JOIN LATERAL (
+    SELECT
+        pharma, name, price, url, url_image, availability, base_name, unit_price, ingest_date,
+        ts_rank_cd(name_tsv, query) AS rank
+    FROM public.medicines, to_tsquery('spanish', terms.term) query
+    WHERE name_tsv @@ query
+) m
+ORDER BY terms.idx, m.pharma, m.rank DESC;
+"""
+
+def fetch_best_matches(medicine_names):
     """
-    conn = psycopg2.connect(
-        host=hostname,
-        user=username,
-        password=password,
-        dbname=database,
-        port=port
-    )
-    return conn
+    Busca el producto que mejor coincide con cada nombre en cada farmacia, con una sola consulta.
+
+    Args:
+        medicine_names (list): Nombres de los medicamentos a buscar.
+
+    Returns:
+        list: Una lista por cada nombre (en el mismo orden) con un diccionario por farmacia encontrada.
+    """
+    # Convierte cada nombre del medicamento en un formato adecuado para la consulta
+    terms = ["|".join(medicine_name.split()) for medicine_name in medicine_names]
+
+    # Toma una conexión del pool y ejecuta la consulta
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SEARCH_QUERY, (terms, ))
+            results = cur.fetchall()
+
+    # Agrupa los resultados por la posición del nombre en la lista original
+    medicines = [[] for _ in medicine_names]
+    for row in results:
+        medicines[row[0] - 1].append({
+            'pharma': row[1],
+            'name': row[2],
+            'price': row[3],
+            'url': row[4],
+            'url_image': row[5],
+            'availability': row[6],
+            'base_name': row[7],
+            'unit_price': row[8],
+            'ingest_date': row[9].isoformat() if row[9] is not None else None
+        })
+    return medicines
 
 @app.route('/search', methods=['GET'])
 def search_medicine():
@@ -59,62 +199,29 @@ def search_medicine():
     if not isinstance(medicine_names, list):
         medicine_names = [medicine_names]
 
-    # Esta instrucción SQL realiza una consulta para seleccionar medicamentos de la tabla public.medicines.
-    # En alto nivel lo que hace es buscar por CADA farmacia CADA producto (son multiples consultas). Y elije
-    # el producto que mejor match de TEXTO haga
-
-
-    # Utiliza técnicas avanzadas de SQL como DISTINCT ON, subconsultas, funciones de texto completo (to_tsvector, to_tsquery), y 
-    # la función de ventana ROW_NUMBER() para organizar y filtrar los resultados.
-    # SELECT DISTINCT ON (pharma): Selecciona filas únicas basadas en la columna pharma. Para cada pharma, devuelve solo la primera fila encontrada en el orden especificado.
-    #   FROM ( ... ) subquery: Utiliza una subconsulta para generar un conjunto de resultados intermedio que se referirá como subquery. La subconsulta contiene la lógica principal para calcular las filas y asignar números de fila.
-    # ROW_NUMBER() OVER ( ... ) as rn:
-    #   ROW_NUMBER(): Función de ventana que asigna un número único a cada fila en el conjunto de resultados.
-    #   OVER ( ... ): Define la partición y el orden de las filas. PARTITION BY pharma: Divide las filas en particiones por el valor de pharma. 
-    #      ORDER BY ts_rank_cd(to_tsvector('spanish', name), query) DESC: Ordena las filas dentro de cada partición según la relevancia calculada por ts_rank_cd. ts_rank_cd evalúa la similitud de to_tsvector('spanish', name) con query y devuelve un valor de relevancia en orden descendente (de más relevante a menos relevante).
-    # as rn: Asigna el resultado de ROW_NUMBER() a la columna rn.
-
-
-    query = """
-    SELECT DISTINCT ON (pharma) pharma, name, price, url, url_image, availability, rn
-    FROM (
-        SELECT
-            pharma, name, price, url, url_image, availability,
-            ROW_NUMBER() OVER (
-                PARTITION BY pharma ORDER BY ts_rank_cd(to_tsvector('spanish', name), query) DESC
-            ) as rn 
-        FROM public.medicines, to_tsquery('spanish', %s) query
-        WHERE to_tsvector('spanish', name) @@ query
-    ) subquery
-    WHERE rn = 1;
-    """
-
     try:
-        medicines = []
-        for medicine_name in medicine_names:
-            # Convierte el nombre del medicamento en un formato adecuado para la consulta
-            medicine_name_or = "|".join(medicine_name.split())
-
-            # Establece una conexión con la base de datos y ejecuta la consulta
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute(query, (medicine_name_or, ))
-            results = cur.fetchall()
-            cur.close()
-            conn.close()
-
-            # Almacena los resultados en la lista de medicamentos
-            medicines.append([
-                {
-                    'pharma': row[0],
-                    'name': row[1],
-                    'price': row[2],
-                    'url': row[3],
-                    'url_image': row[4],
-                    'availability': row[5]
-                }
-                for row in results
-            ])
+        # Obtiene el mejor producto de cada farmacia para cada nombre, primero desde la caché
+        # y si no está, con una sola consulta a la base de datos
+        normalized_names = normalize_names(medicine_names)
+        try:
+            medicines = search_cache.get(normalized_names)
+        except Exception as e:
+            # Un fallo de la caché no debe impedir la búsqueda
+            app.logger.warning(f"Search cache unavailable: {e}")
+            medicines = None
+
+        if medicines is None:
+            medicines = fetch_best_matches(normalized_names)
+            try:
+                search_cache.set(normalized_names, medicines)
+            except Exception as e:
+                app.logger.warning(f"Could not store search result in cache: {e}")
+
+        # Los productos desactualizados se encolan para actualizarlos sin esperar (ver StaleRefreshEnqueuer)
+        refresh_enqueuer.submit(medicine for medicine_group in medicines for medicine in medicine_group)
+
+        # La popularidad se registra en segundo plano (ver SearchPopularityRecorder)
+        popularity_recorder.submit(medicine['url'] for medicine_group in medicines for medicine in medicine_group)
 
         pharmas = []
         pharmas_map_index = dict()
@@ -139,68 +246,23 @@ def search_medicine():
                     pharmas_map_index[pharma] = index
                     index += 1
 
-                    # Obtiene información adicional sobre la farmacia desde la base de datos
-                    conn = get_db_connection()
-                    cur = conn.cursor()
-                    cur.execute(
-                        """SELECT pharma, location, link_logo, link
-                        FROM public.pharmas
-                        WHERE pharma = %s
-                        """,
-                        (pharma, )
-                    )
-                    results_pharma = cur.fetchone()
-                    cur.close()
-                    conn.close()
+                    # Obtiene información adicional sobre la farmacia desde la caché
+                    results_pharma = pharma_cache.get(pharma) or {}
 
                     # Agrega la farmacia a la lista de farmacias
                     pharmas.append({
                         "name": pharma,
-                        "location": results_pharma[1],
-                        "link_logo": results_pharma[2],
-                        "link": results_pharma[3],
+                        "location": results_pharma.get("location"),
+                        "link_logo": results_pharma.get("link_logo"),
+                        "link": results_pharma.get("link"),
                         "products": deepcopy(products_default)
                     })
 
                 index_pharma = pharmas_map_index[pharma]
 
-                def parse_medication_prices(medications):
-                    """
-                    Analiza y ajusta los precios de los medicamentos en función de la cantidad.
-
-                    Args:
-                        medications (list): Lista de medicamentos y sus precios.
-
-                    Returns:
-                        list: Lista de medicamentos con precios ajustados por unidad.
-                    """
-                    parsed_medications = []
-                    pattern = re.compile(r'(.+?)(?:\s*x(\d+)|\s*(\d+)\s*(?:unidad?e?s?))(.+)', re.IGNORECASE)
-
-                    for med_name, price in medications:
-                        match = pattern.search(med_name)
-                        if match:
-                            base_name = match.group(1).strip()
-                            if 'unidad' in med_name.lower():
-                                quantity = int(match.group(3))
-                            else:
-                                quantity = int(match.group(2))
-
-                            if match.group(4):
-                                base_name = f"{base_name} unidad {match.groups()[-1]}".strip()
-                            else:
-                                base_name = f"{base_name} x1 {match.groups()[-1]}".strip()
-
-                            unit_price = price / quantity
-                            parsed_medications.append((base_name, unit_price))
-                        else:
-                            parsed_medications.append((med_name, price))
-
-                    return parsed_medications
-
-                # Analiza y ajusta el precio del medicamento actual. Reemplazando los que tienen 'x 100' o 'n unidades' para tratar de obtener su precio unitario
-                name_price_parsed = parse_medication_prices([[medicine["name"], float(medicine["price"])]])[0]
-                name, price = name_price_parsed[0], name_price_parsed[1]
+                # El nombre base y el precio unitario (para los que tienen 'x 100' o 'n unidades') ya vienen calculados desde la ingesta
+                price = medicine["unit_price"]
+                name, price = medicine["base_name"], float(price) if price is not None else None
 
                 # Actualiza la lista de productos de la farmacia con el medicamento encontrado
                 pharmas[index_pharma]['products'][i] = {
@@ -214,20 +276,119 @@ def search_medicine():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Serie de precios de los productos indicados, en orden cronológico. Usa el índice (url, changed_at) de price_history
+HISTORY_QUERY = """
+SELECT m.url, m.pharma, m.name, h.price, h.availability, h.changed_at
+FROM public.medicines m
+JOIN public.price_history h ON h.url = m.url
+WHERE m.url = ANY(%s)
+ORDER BY m.url, h.changed_at;
+"""
+
+@app.route('/history', methods=['GET'])
+def price_history():
+    """
+    Ruta de la API para consultar el historial de precios de un producto.
+
+    Se puede consultar por la URL del producto (`url`) o por un nombre (`name`); con el nombre se
+    usa el mismo criterio que /search y se devuelve el historial del mejor producto de cada farmacia.
+
+    Returns:
+        json: Lista de productos con su serie de precios o un error.
+    """
+
+    token = request.args.get('token')
+    if token != os.environ["SECRET_TOKEN"]:
+        return jsonify({"error": "Unauthorized access"}), 401
+
+    url = request.args.get('url')
+    name = request.args.get('name')
+    if not url and not name:
+        return jsonify({'error': 'No product url or name provided'}), 400
+
+    try:
+        if url:
+            urls = [url]
+        else:
+            urls = [medicine['url'] for medicine in fetch_best_matches(normalize_names([name]))[0]]
+
+        with db_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(HISTORY_QUERY, (urls, ))
+                results = cur.fetchall()
+
+        # Agrupa las filas por producto conservando el orden cronológico
+        products = {}
+        for row in results:
+            product = products.setdefault(row[0], {
+                "url": row[0],
+                "pharma": row[1],
+                "name": row[2],
+                "history": []
+            })
+            product["history"].append({
+                "price": float(row[3]) if row[3] is not None else None,
+                "availability": row[4],
+                "changed_at": row[5].isoformat()
+            })
+
+        return jsonify(list(products.values()))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/pharmas/invalidate', methods=['POST'])
+def invalidate_pharmas():
+    """
+    Ruta de la API para invalidar la caché de farmacias del worker que atiende la solicitud.
+
+    Para recargar la caché en todos los workers se puede reiniciar gunicorn con `kill -HUP <pid del master>`.
+
+    Returns:
+        json: Confirmación de la invalidación o un error.
+    """
+
+    data = request.json or {}
+    token = data.get('token', None)
+    if token != os.environ["SECRET_TOKEN"]:
+        return jsonify({"error": "Unauthorized access"}), 401
+
+    pharma_cache.invalidate()
+    return jsonify({'invalidated': True})
+
+@app.route('/pool', methods=['GET'])
+def pool_stats():
+    """
+    Ruta de la API para consultar las métricas del pool de conexiones del worker que atiende la solicitud.
+
+    Returns:
+        json: Contadores del pool (conexiones creadas, descartadas, en uso, esperas agotadas, etc.).
+    """
+
+    token = request.args.get('token')
+    if token != os.environ["SECRET_TOKEN"]:
+        return jsonify({"error": "Unauthorized access"}), 401
+
+    try:
+        return jsonify(db_pool.stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/scraper', methods=['POST'])
 def run_spiders():
     """
-    Ruta de la API para ejecutar spiders de scraping.
+    Ruta de la API para encolar un trabajo de scraping.
 
     La ruta espera una solicitud POST con un JSON que contiene una lista de nombres de spiders
-    a ejecutar. Ejecuta un script externo que corre los spiders y devuelve la salida.
+    a ejecutar. No espera a que el scraper termine: encola el trabajo, que ejecuta el daemon
+    del scraper (scraper_daemon.py), y devuelve su id para consultarlo en /scraper/<id>. Si ya
+    hay un trabajo idéntico en cola o en ejecución, devuelve ese trabajo.
 
     Returns:
-        json: Resultado de la ejecución del script incluyendo stdout, stderr y el código de retorno.
+        json: Id y estado del trabajo, y si ya existía (duplicate).
     """
     
     # Obtiene los datos JSON de la solicitud
-    data = request.json
+    data = request.json or {}
     # Obtiene la lista de nombres de spiders desde los datos JSON
     spider_names = data.get('spiders', [])
 
@@ -238,23 +399,67 @@ def run_spiders():
     if not spider_names:
         # Devuelve un error si no se proporcionaron nombres de spiders
         return jsonify({'error': 'No spider names provided'}), 400
+    # Los nombres pasan a la línea de comandos de app_scraper.py: solo se aceptan spiders conocidas
+    if not isinstance(spider_names, list) or not all(isinstance(name, str) and name in SPIDER_NAMES for name in spider_names):
+        return jsonify({'error': f"spiders must be a list of spider names: {', '.join(sorted(SPIDER_NAMES))}"}), 400
+
+    # Opciones de app_scraper.py que se pueden pedir para el trabajo
+    options = {}
+    if data.get('discovery'):
+        if data['discovery'] not in ('links', 'sitemap', 'api', 'freshness'):
+            return jsonify({'error': 'Invalid discovery mode'}), 400
+        options['discovery'] = data['discovery']
+    if data.get('max_requests') is not None:
+        if type(data['max_requests']) is not int or data['max_requests'] <= 0:
+            return jsonify({'error': 'Invalid max_requests'}), 400
+        options['max_requests'] = data['max_requests']
+    if data.get('time_budget') is not None:
+        if type(data['time_budget']) not in (int, float) or data['time_budget'] <= 0:
+            return jsonify({'error': 'Invalid time_budget'}), 400
+        options['time_budget'] = data['time_budget']
+    if data.get('incremental'):
+        options['incremental'] = True
+    if data.get('low_memory'):
+        options['low_memory'] = True
+    if data.get('refresh'):
+        if 'discovery' in options:
+            return jsonify({'error': 'refresh and discovery cannot be used together'}), 400
+        options['refresh'] = True
 
     try:
-        # Convierte la lista de nombres de spiders a una cadena de argumentos para el script
-        args = ['python', 'app_scraper.py'] + spider_names
-        # Ejecuta el script en un nuevo proceso
-        result = subprocess.run(args, capture_output=True, text=True)
-        print(args, result)
-
-        # Devuelve la salida del script, incluyendo stdout, stderr y el código de retorno
-        return jsonify({
-            'stdout': result.stdout,
-            'stderr': result.stderr,
-            'returncode': result.returncode
-        })
+        job_id, created = job_store.enqueue(spider_names, options)
+        job = job_store.get(job_id)
+        return jsonify({'id': job_id, 'status': job['status'], 'duplicate': not created}), 202
     except Exception as e:
         # Captura cualquier excepción y devuelve un mensaje de error
         return jsonify({'error': str(e)}), 500
 
+@app.route('/scraper/<job_id>', methods=['GET'])
+def scraper_job(job_id):
+    """
+    Ruta de la API para consultar un trabajo de scraping.
+
+    Returns:
+        json: Estado del trabajo, items y respuestas por proceso del scraper y las últimas líneas de su log.
+    """
+
+    token = request.args.get('token')
+    if token != os.environ["SECRET_TOKEN"]:
+        return jsonify({"error": "Unauthorized access"}), 401
+
+    try:
+        log_lines = min(max(int(request.args.get('lines', 50)), 0), 1000)
+    except ValueError:
+        return jsonify({'error': 'Invalid lines'}), 400
+
+    try:
+        job = job_store.get(job_id, log_lines=log_lines)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 if __name__ == '__main__':
     app.run(debug=True)
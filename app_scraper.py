@@ -6,11 +6,20 @@ import sys
 from scrapy import signals
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
+from twisted.internet import task, threads
+from dotenv import load_dotenv
+from medifacil_backend.jobs import JobStore
 from medifacil_backend.spiders.CrawlerFybeca import CrawlFybeca
 from medifacil_backend.spiders.CrawlerMedicity import CrawlMedicity
 from medifacil_backend.spiders.CrawlerCruzAzul import CrawlCruzAzul
 import threading
 import argparse
+import json
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
 
 # python app_scraper.py CrawlFybeca CrawlMedicity CrawlCruzAzul
 
@@ -18,6 +27,9 @@ import argparse
 # asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 asyncioreactor.install()
 
+# Credenciales de la base de datos, para las spiders que leen los productos conocidos
+load_dotenv(f"{os.getcwd()}/medifacil_backend/.env", override=True)
+
 # Inicializa el proceso del crawler con la configuración del proyecto
 settings = get_project_settings()
 settings.set('LOG_LEVEL', 'WARNING')  # Ajusta el nivel de logging a WARNING
@@ -34,14 +46,76 @@ SPIDERS = {
     # 'OtroSpider': OtroSpider
 }
 
-def run_spiders_in_thread(spider_names):
+# Estadísticas finales de cada spider ejecutada en este proceso, por nombre
+RESULTS = {}
+
+# Segundos entre reportes de progreso de un trabajo encolado desde /scraper
+PROGRESS_INTERVAL = 10
+
+
+def crawl_completed(stats):
+    """
+    Indica si una spider terminó su rastreo y no queda nada que reanudar.
+
+    Un recorrido por frescura (`--discovery freshness`) o una actualización (`--refresh`) que se
+    detiene al agotar `--time-budget` también terminó: la siguiente ejecución vuelve a leer los
+    productos de la base de datos en vez de reanudar una cola vieja.
+
+    Args:
+        stats (dict): Estadísticas finales de la spider.
+
+    Returns:
+        bool: True si terminó.
+    """
+    reason = stats.get('finish_reason')
+    known_products = 'freshness/scheduled' in stats or 'refresh/urls' in stats
+    return reason == 'finished' or (reason == 'closespider_timeout' and known_products)
+
+
+def run_spiders_in_thread(spider_names, fresh=False, shard=None, stats_file=None, job_id=None):
     """
     Ejecuta las spiders especificadas en un hilo separado.
 
+    Cada spider usa su propio JOBDIR (cola de solicitudes en disco y URLs vistas) dentro de
+    CRAWL_JOBS_DIR. Si un rastreo anterior se interrumpió (por ejemplo, el sistema operativo
+    lo terminó por falta de memoria), se reanuda donde quedó. Al terminar bien, el JOBDIR se
+    borra para que la siguiente ejecución empiece desde cero.
+
     Args:
         spider_names (list): Lista de nombres de spiders a ejecutar.
+        fresh (bool): Si es True descarta el estado de un rastreo interrumpido y empieza desde cero.
+        shard (str): Parte del trabajo a procesar ("i/n"), cuando run_workers reparte una spider en varios procesos.
+        stats_file (str): Archivo donde se guardan las estadísticas finales en JSON (lo usa run_workers).
+        job_id (str): Trabajo de la cola de /scraper al que se reporta el progreso (lo usa scraper_daemon.py).
     """
     process = CrawlerProcess(settings)
+    crawlers = {}
+    job_store = JobStore.from_env() if job_id else None
+
+    def current_progress():
+        """
+        Copia las estadísticas actuales de cada spider, por nombre de proceso.
+        """
+        return [
+            (f"{spider_name} {shard}" if shard else spider_name, dict(RESULTS.get(spider_name) or crawler.stats.get_stats()))
+            for spider_name, crawler in crawlers.items()
+        ]
+
+    def save_progress(progress):
+        """
+        Guarda en la cola de trabajos el progreso de cada spider.
+        """
+        for worker, stats in progress:
+            job_store.report_progress(job_id, worker, stats)
+
+    def report_progress():
+        """
+        Reporta el progreso durante el rastreo. Las estadísticas se copian en el hilo del reactor y
+        la escritura en SQLite se hace en un hilo aparte, para no detener las descargas mientras espera.
+        """
+        deferred = threads.deferToThread(save_progress, current_progress())
+        deferred.addErrback(lambda failure: logging.warning(f"Could not report progress: {failure.getErrorMessage()}"))
+        return deferred
 
     def handle_spider_opened(spider):
         """
@@ -61,30 +135,187 @@ def run_spiders_in_thread(spider_names):
         """
         pass
 
-    def handle_spider_closed(spider):
+    def handle_spider_closed(spider, reason):
         """
         Maneja la señal de cierre de una spider.
 
         Args:
             spider (Spider): La spider que se ha cerrado.
+            reason (str): Motivo del cierre ('finished' si terminó normalmente).
         """
-        print(f"Spider {spider.name} is closed.")
+        print(f"Spider {spider.name} is closed ({reason}).")
 
     for spider_name in spider_names:
         if spider_name in SPIDERS:
             # Crea un crawler para la spider especificada
             crawler = process.create_crawler(SPIDERS[spider_name])
+            # Estado persistente del rastreo de esta spider, para poder reanudarlo. Los lotes de --urls-file
+            # no lo usan: si se interrumpen, scraper_daemon.py devuelve sus URLs a la cola de actualización
+            if not settings.get('REFRESH_URLS_FILE'):
+                job_name = f"{spider_name}.{shard.replace('/', 'of')}" if shard else spider_name
+                if settings.get('DISCOVERY_MODE') == 'refresh':
+                    # Una actualización no reanuda la cola de un rastreo completo interrumpido, ni al revés
+                    job_name += '.refresh'
+                job_dir = os.path.join(settings.get('CRAWL_JOBS_DIR'), job_name)
+                if fresh:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                elif os.path.isdir(job_dir):
+                    print(f"Resuming {spider_name} from {job_dir}")
+                crawler.settings.set('JOBDIR', job_dir, priority='cmdline')
             # Conecta las señales a los manejadores correspondientes
             crawler.signals.connect(handle_spider_opened, signal=signals.spider_opened)
             crawler.signals.connect(handle_item_scraped, signal=signals.item_scraped)
             crawler.signals.connect(handle_spider_closed, signal=signals.spider_closed)
             # Inicia el proceso de rastreo
-            process.crawl(crawler, tag=spider_name)
+            spider_kwargs = {'shard': shard} if shard else {}
+            process.crawl(crawler, tag=spider_name, **spider_kwargs)
+            crawlers[spider_name] = crawler
         else:
             print(f"Spider {spider_name} not found")
+            RESULTS[spider_name] = {'finish_reason': 'not_found'}
+
+    if job_store:
+        task.LoopingCall(report_progress).start(PROGRESS_INTERVAL, now=False)
 
     process.start(install_signal_handlers=False, stop_after_crawl=True)
 
+    for spider_name, crawler in crawlers.items():
+        RESULTS[spider_name] = crawler.stats.get_stats()
+        if crawl_completed(RESULTS[spider_name]) and crawler.settings.get('JOBDIR'):
+            # El rastreo terminó: no hay nada que reanudar. Se borra cuando el proceso ya terminó,
+            # porque las extensiones todavía escriben en JOBDIR durante la señal spider_closed
+            shutil.rmtree(crawler.settings.get('JOBDIR'), ignore_errors=True)
+    if job_store:
+        save_progress(current_progress())
+    if stats_file:
+        with open(stats_file, 'w') as f:
+            json.dump(RESULTS, f, default=str)
+
+
+def exit_code(results):
+    """
+    Código de salida del proceso: 0 si todas las spiders terminaron normalmente (ver crawl_completed).
+
+    Args:
+        results (dict): Estadísticas finales por spider.
+
+    Returns:
+        int: 0 o 1.
+    """
+    if results and all(crawl_completed(stats) for stats in results.values()):
+        return 0
+    return 1
+
+
+def _limit_memory(memory_limit):
+    """
+    Devuelve la función que limita el espacio de direcciones de un worker antes de ejecutarlo.
+
+    El límite real de cada worker es MEMUSAGE_LIMIT_MB (memoria residente), que cierra las spiders
+    de forma ordenada. RLIMIT_AS es solo un tope de seguridad contra un proceso desbocado; deja
+    margen porque los hilos y las arenas de malloc reservan espacio virtual que no llegan a usar.
+    """
+    def preexec():
+        import resource
+        limit = (memory_limit * 2 + 1024) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return preexec
+
+
+def run_workers(spider_names, workers, shards=1, memory_limit=0, worker_args=()):
+    """
+    Ejecuta cada spider, o cada parte de una spider, en su propio proceso.
+
+    Como mucho `workers` procesos corren a la vez; cada uno es una ejecución de este mismo
+    script con una sola spider (y `--shard i/n` si se reparte en partes). Al terminar se
+    muestra un resumen con el código de salida y las estadísticas de cada proceso.
+
+    Args:
+        spider_names (list): Lista de nombres de spiders a ejecutar.
+        workers (int): Máximo de procesos simultáneos.
+        shards (int): Partes en que se reparte cada spider.
+        memory_limit (int): Límite de memoria por proceso en MB (0 sin límite).
+        worker_args (list): Argumentos adicionales para cada worker (--fresh, --incremental...).
+
+    Returns:
+        int: 0 si todos los procesos terminaron bien, 1 si alguno falló.
+    """
+    jobs = [
+        (spider_name, f"{index}/{shards}" if shards > 1 else None)
+        for spider_name in spider_names
+        for index in range(shards)
+    ]
+    preexec = _limit_memory(memory_limit) if memory_limit and os.name == 'posix' else None
+
+    # Si el runner recibe SIGTERM (por ejemplo, del cron o de systemd) también se detienen los workers
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+    with tempfile.TemporaryDirectory() as stats_dir:
+        pending = list(enumerate(jobs))
+        running = {}
+        finished = {}
+        try:
+            _supervise(jobs, pending, running, finished, workers, stats_dir, preexec, worker_args)
+        finally:
+            for worker, _, _ in running.values():
+                worker.terminate()
+
+    print_summary(jobs, finished)
+    return 0 if all(returncode == 0 for returncode, _, _ in finished.values()) else 1
+
+
+def _supervise(jobs, pending, running, finished, workers, stats_dir, preexec, worker_args):
+    """
+    Lanza los workers pendientes sin superar `workers` simultáneos y espera a que terminen todos.
+    """
+    while pending or running:
+        while pending and len(running) < workers:
+            job_id, (spider_name, shard) = pending.pop(0)
+            stats_file = os.path.join(stats_dir, f"{job_id}.json")
+            args = [sys.executable, os.path.abspath(__file__), spider_name, '--stats-file', stats_file]
+            if shard:
+                args += ['--shard', shard]
+            args += list(worker_args)
+            running[job_id] = (subprocess.Popen(args, preexec_fn=preexec), stats_file, time.monotonic())
+
+        time.sleep(0.5)
+        for job_id, (worker, stats_file, started_at) in list(running.items()):
+            if worker.poll() is None:
+                continue
+            del running[job_id]
+            stats = {}
+            if os.path.exists(stats_file):
+                with open(stats_file) as f:
+                    stats = json.load(f).get(jobs[job_id][0], {})
+            finished[job_id] = (worker.returncode, stats, time.monotonic() - started_at)
+
+
+def print_summary(jobs, finished):
+    """
+    Muestra el resultado de cada worker y los totales.
+
+    Args:
+        jobs (list): (spider, shard) de cada worker.
+        finished (dict): (código de salida, estadísticas, segundos) por índice de worker.
+    """
+    header = f"{'job':<22}{'exit':>5}  {'reason':<20}{'items':>8}{'responses':>11}{'peak MB':>9}{'seconds':>9}"
+    print(header)
+    print('-' * len(header))
+    totals = {'items': 0, 'responses': 0}
+    for job_id, (spider_name, shard) in enumerate(jobs):
+        returncode, stats, elapsed = finished[job_id]
+        items = stats.get('item_scraped_count', 0)
+        responses = stats.get('response_received_count', 0)
+        peak = stats.get('memusage/max', 0) / 1024 / 1024
+        reason = stats.get('finish_reason', 'killed' if returncode < 0 else 'no stats')
+        totals['items'] += items
+        totals['responses'] += responses
+        job = f"{spider_name} {shard}" if shard else spider_name
+        print(f"{job:<22}{returncode:>5}  {reason:<20}{items:>8}{responses:>11}{peak:>9.0f}{elapsed:>9.0f}")
+    failed = sum(1 for returncode, _, _ in finished.values() if returncode != 0)
+    print('-' * len(header))
+    print(f"{'total':<22}{failed:>5}  {f'{failed} of {len(jobs)} failed':<20}{totals['items']:>8}{totals['responses']:>11}")
+
 # Configuración del parser de argumentos para recibir nombres de spiders desde la línea de comandos
 parser = argparse.ArgumentParser(description="Run Scrapy spiders.")
 parser.add_argument(
@@ -95,13 +326,139 @@ parser.add_argument(
     help='Names of the spiders to run'
 )
 
+parser.add_argument(
+    '--workers',
+    type=int,
+    default=1,
+    help='Run each spider (or shard) in its own process, with at most this many processes at a time'
+)
+parser.add_argument(
+    '--shards',
+    type=int,
+    default=1,
+    help='Split each spider into this many processes (implies one process per shard)'
+)
+parser.add_argument(
+    '--memory-limit',
+    type=int,
+    default=0,
+    help='Memory limit per process in MB; spiders above it are closed (0 means no limit)'
+)
+parser.add_argument('--shard', help=argparse.SUPPRESS)
+parser.add_argument('--stats-file', help=argparse.SUPPRESS)
+parser.add_argument('--job-id', help=argparse.SUPPRESS)
+parser.add_argument(
+    '--fresh',
+    action='store_true',
+    help='Discard the state of an interrupted crawl instead of resuming it'
+)
+parser.add_argument(
+    '--discovery',
+    choices=['links', 'sitemap', 'api', 'freshness'],
+    help='How to discover product pages: following links from listings, reading the store sitemap, '
+         'paging through the catalog API (CrawlMedicity only) or recrawling the known products, '
+         'most likely to have changed first'
+)
+parser.add_argument(
+    '--refresh',
+    action='store_true',
+    help='Refresh the prices of the products already in the database (REFRESH_SETTINGS): their pages are '
+         'requested directly, with high concurrency and without following links'
+)
+parser.add_argument(
+    '--urls-file',
+    help='With --refresh, refresh only the products listed in this file (one JSON object with url and pharma per line)'
+)
+parser.add_argument(
+    '--max-requests',
+    type=int,
+    default=0,
+    help='With --discovery freshness, recrawl only this many products per spider, the highest scored (0 means all)'
+)
+parser.add_argument(
+    '--time-budget',
+    type=float,
+    default=0,
+    help='Stop each spider after this many minutes (0 means no limit)'
+)
+parser.add_argument(
+    '--low-memory',
+    action='store_true',
+    help='Bounded-memory profile for small servers (LOW_MEMORY_SETTINGS): lower concurrency, fewer responses '
+         'in memory at once and a memory watchdog that pauses the crawl instead of killing it'
+)
+parser.add_argument(
+    '--incremental',
+    action='store_true',
+    help='Send conditional requests and skip product pages that did not change since the previous run'
+)
+
 # Parseo de los argumentos proporcionados
 args = parser.parse_args()
 spider_names = args.spider_names
 
+if args.refresh and args.discovery:
+    parser.error('--refresh and --discovery cannot be used together')
+if args.urls_file and not args.refresh:
+    parser.error('--urls-file requires --refresh')
+
+if args.discovery:
+    settings.set('DISCOVERY_MODE', args.discovery)
+
+if args.incremental:
+    settings.set('INCREMENTAL_CRAWL_ENABLED', True)
+
+if args.max_requests:
+    settings.set('FRESHNESS_MAX_REQUESTS', args.max_requests, priority='cmdline')
+
+if args.time_budget:
+    # CloseSpider de Scrapy cierra la spider de forma ordenada al vencer el plazo
+    settings.set('CLOSESPIDER_TIMEOUT', args.time_budget * 60, priority='cmdline')
+
+if args.refresh:
+    settings.setdict(settings.getdict('REFRESH_SETTINGS'), priority='cmdline')
+    if args.urls_file:
+        settings.set('REFRESH_URLS_FILE', os.path.abspath(args.urls_file), priority='cmdline')
+
+if args.low_memory:
+    settings.setdict(settings.getdict('LOW_MEMORY_SETTINGS'), priority='cmdline')
+
+if args.memory_limit:
+    # MemoryUsage de Scrapy cierra las spiders de forma ordenada al superar el límite
+    settings.set('MEMUSAGE_ENABLED', True, priority='cmdline')
+    settings.set('MEMUSAGE_LIMIT_MB', args.memory_limit, priority='cmdline')
+
 # Agrega el directorio actual al path de búsqueda de módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+if args.workers > 1 or args.shards > 1:
+    # Argumentos que se pasan igual a cada worker
+    worker_args = [
+        flag for flag, enabled in (
+            ('--fresh', args.fresh), ('--incremental', args.incremental), ('--low-memory', args.low_memory),
+            ('--refresh', args.refresh)
+        )
+        if enabled
+    ]
+    if args.discovery:
+        worker_args += ['--discovery', args.discovery]
+    if args.memory_limit:
+        worker_args += ['--memory-limit', str(args.memory_limit)]
+    if args.max_requests:
+        worker_args += ['--max-requests', str(args.max_requests)]
+    if args.time_budget:
+        worker_args += ['--time-budget', str(args.time_budget)]
+    if args.urls_file:
+        worker_args += ['--urls-file', os.path.abspath(args.urls_file)]
+    if args.job_id:
+        worker_args += ['--job-id', args.job_id]
+    sys.exit(run_workers(spider_names, max(args.workers, 1), max(args.shards, 1), args.memory_limit, worker_args))
+
 # Crea y comienza un hilo para ejecutar las spiders
-spider_thread = threading.Thread(target=run_spiders_in_thread, args=(spider_names,))
+spider_thread = threading.Thread(
+    target=run_spiders_in_thread,
+    args=(spider_names, args.fresh, args.shard, args.stats_file, args.job_id)
+)
 spider_thread.start()
+spider_thread.join()
+sys.exit(exit_code(RESULTS))
@@ -0,0 +1,189 @@
+"""
+Benchmark del control adaptativo de concurrencia (AdaptiveConcurrencyMiddleware) contra un servidor local.
+
+Levanta un servidor HTTP local que imita una tienda con capacidad limitada: atiende hasta
+`--capacity` solicitudes a la vez, su latencia crece con la carga (`--latency` segundos más
+`--latency-per-request` por cada solicitud en curso) y responde 429 con Retry-After a las que
+superan la capacidad. Rastrea `--pages` páginas con concurrencia fija (`--fixed-concurrency`, sin
+el middleware) y con el control adaptativo, cada ejecución en un proceso nuevo, y compara la
+duración, los 429, las páginas perdidas (sin respuesta 200 después de los reintentos) y la
+concurrencia final. No necesita acceso a las tiendas ni a la base de datos.
+
+Uso:
+    python benchmarks/adaptive_concurrency_benchmark.py [--pages 600] [--capacity 6] [--fixed-concurrency 16]
+"""
+import argparse
+import http.server
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROFILES = ('fixed', 'adaptive')
+
+
+class StoreStandIn(http.server.ThreadingHTTPServer):
+    """
+    Servidor local con capacidad limitada y latencia que crece con la carga.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, capacity, latency, latency_per_request, retry_after=1):
+        super().__init__(('127.0.0.1', 0), StoreHandler)
+        self.capacity = capacity
+        self.latency = latency
+        self.latency_per_request = latency_per_request
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.throttled = 0
+            self.served = 0
+
+
+class StoreHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            load = server.in_flight
+            server.max_in_flight = max(server.max_in_flight, load)
+            if load > server.capacity:
+                server.throttled += 1
+        try:
+            if load > server.capacity:
+                self.send_response(429)
+                self.send_header('Retry-After', str(server.retry_after))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            time.sleep(server.latency + server.latency_per_request * load)
+            body = b'<html><body>ok</body></html>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            with server.lock:
+                server.served += 1
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def run_child(profile, base_url, pages, fixed_concurrency):
+    """
+    Rastrea las páginas del servidor local en este proceso y muestra sus resultados en JSON.
+    """
+    import scrapy
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    class StandInSpider(scrapy.Spider):
+        name = 'stand_in'
+
+        def start_requests(self):
+            for page in range(pages):
+                yield scrapy.Request(f'{base_url}/p/{page}', callback=self.parse)
+
+        def parse(self, response):
+            pass
+
+    settings = get_project_settings()
+    settings.set('ITEM_PIPELINES', {}, priority='cmdline')
+    settings.set('HTTPCACHE_ENABLED', False, priority='cmdline')
+    settings.set('ROBOTSTXT_OBEY', False, priority='cmdline')
+    settings.set('LOG_LEVEL', 'WARNING', priority='cmdline')
+    if profile == 'fixed':
+        settings.set('ADAPTIVE_CONCURRENCY_ENABLED', False, priority='cmdline')
+        settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', fixed_concurrency, priority='cmdline')
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(StandInSpider)
+    process.crawl(crawler)
+    started = time.monotonic()
+    process.start()
+    elapsed = time.monotonic() - started
+
+    stats = crawler.stats.get_stats()
+    concurrency = [value for key, value in stats.items() if key.startswith('adaptive/') and key.endswith('/concurrency')]
+    print(json.dumps({
+        'ok': stats.get('downloader/response_status_count/200', 0),
+        'retries': stats.get('retry/count', 0),
+        'decisions': stats.get('adaptive/decisions', 0),
+        'concurrency': concurrency[0] if concurrency else fixed_concurrency,
+        'seconds': elapsed,
+    }))
+
+
+def run(profile, server, pages, fixed_concurrency):
+    """
+    Ejecuta un perfil en un proceso nuevo contra el servidor local.
+
+    Returns:
+        dict: Resultados del proceso y del servidor, o None si falló.
+    """
+    server.reset()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    args = [
+        sys.executable, os.path.abspath(__file__), '--child', profile, '--base-url', base_url,
+        '--pages', str(pages), '--fixed-concurrency', str(fixed_concurrency),
+    ]
+    result = subprocess.run(args, capture_output=True, text=True)
+    try:
+        results = json.loads(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        sys.stderr.write(result.stderr)
+        return None
+    return dict(results, throttled=server.throttled, max_in_flight=server.max_in_flight)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark adaptive vs fixed concurrency against a local stand-in store.")
+    parser.add_argument('--pages', type=int, default=600, help='Pages per crawl')
+    parser.add_argument('--capacity', type=int, default=6, help='Concurrent requests the stand-in serves before answering 429')
+    parser.add_argument('--latency', type=float, default=0.05, help='Base latency of the stand-in (seconds)')
+    parser.add_argument('--latency-per-request', type=float, default=0.02, help='Extra latency per request in flight (seconds)')
+    parser.add_argument('--fixed-concurrency', type=int, default=16, help='Per-domain concurrency without the adaptive controller')
+    parser.add_argument('--child', choices=PROFILES, help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # El directorio del proyecto, para que get_project_settings encuentre scrapy.cfg
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    if args.child:
+        run_child(args.child, args.base_url, args.pages, args.fixed_concurrency)
+        return
+
+    server = StoreStandIn(args.capacity, args.latency, args.latency_per_request)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"{'profile':<10}{'ok':>6}{'lost':>6}{'429':>6}{'retries':>8}{'max in flight':>14}{'concurrency':>12}{'seconds':>9}")
+    for profile in PROFILES:
+        result = run(profile, server, args.pages, args.fixed_concurrency)
+        if result is None:
+            print(f"{profile:<10}{'failed':>6}")
+            continue
+        print(
+            f"{profile:<10}{result['ok']:>6}{args.pages - result['ok']:>6}{result['throttled']:>6}{result['retries']:>8}"
+            f"{result['max_in_flight']:>14}{result['concurrency']:>12}{result['seconds']:>9.1f}"
+        )
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
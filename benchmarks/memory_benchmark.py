@@ -0,0 +1,118 @@
+"""
+Benchmark de memoria del scraper: pico de memoria residente (RSS) por spider.
+
+Rastrea cada farmacia hasta `--pages` respuestas con la configuración normal y con el perfil de
+memoria acotada (LOW_MEMORY_SETTINGS, `app_scraper.py --low-memory`), cada ejecución en un proceso
+nuevo para que el pico de una no afecte a la otra. Los items no se escriben en la base de datos.
+Necesita acceso a las tiendas.
+
+Uso:
+    python benchmarks/memory_benchmark.py [--pages 1000] [--discovery links] [CrawlFybeca CrawlMedicity ...]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROFILES = ('default', 'low-memory')
+
+
+def run_child(spider_name, profile, pages, discovery):
+    """
+    Ejecuta una spider en este proceso y muestra sus resultados en JSON.
+    """
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    from medifacil_backend.spiders.CrawlerCruzAzul import CrawlCruzAzul
+    from medifacil_backend.spiders.CrawlerFybeca import CrawlFybeca
+    from medifacil_backend.spiders.CrawlerMedicity import CrawlMedicity
+
+    spiders = {'CrawlFybeca': CrawlFybeca, 'CrawlMedicity': CrawlMedicity, 'CrawlCruzAzul': CrawlCruzAzul}
+
+    settings = get_project_settings()
+    if profile == 'low-memory':
+        settings.setdict(settings.getdict('LOW_MEMORY_SETTINGS'), priority='cmdline')
+    settings.set('ITEM_PIPELINES', {}, priority='cmdline')
+    settings.set('CLOSESPIDER_PAGECOUNT', pages, priority='cmdline')
+    settings.set('DISCOVERY_MODE', discovery, priority='cmdline')
+    settings.set('LOG_LEVEL', 'WARNING', priority='cmdline')
+
+    with tempfile.TemporaryDirectory() as job_dir:
+        # Igual que app_scraper.py: la cola de solicitudes en disco
+        settings.set('JOBDIR', job_dir, priority='cmdline')
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(spiders[spider_name])
+        process.crawl(crawler)
+        started = time.monotonic()
+        process.start()
+        elapsed = time.monotonic() - started
+
+    stats = crawler.stats.get_stats()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak *= 1024  # ru_maxrss está en KB en Linux y en bytes en macOS
+    print(json.dumps({
+        'peak_rss': peak,
+        'responses': stats.get('response_received_count', 0),
+        'items': stats.get('item_scraped_count', 0),
+        'pauses': stats.get('memwatchdog/pauses', 0),
+        'seconds': elapsed,
+    }))
+
+
+def run(spider_name, profile, pages, discovery):
+    """
+    Ejecuta una spider en un proceso nuevo.
+
+    Returns:
+        dict: Resultados del proceso, o None si falló.
+    """
+    args = [
+        sys.executable, os.path.abspath(__file__), spider_name,
+        '--child', profile, '--pages', str(pages), '--discovery', discovery,
+    ]
+    result = subprocess.run(args, capture_output=True, text=True)
+    try:
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        sys.stderr.write(result.stderr)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark peak RSS per spider (default vs low-memory profile).")
+    parser.add_argument('spider_names', nargs='*', default=['CrawlFybeca', 'CrawlMedicity', 'CrawlCruzAzul'])
+    parser.add_argument('--pages', type=int, default=1000, help='Responses per crawl')
+    parser.add_argument('--discovery', choices=['links', 'sitemap', 'api'], default='links')
+    parser.add_argument('--child', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # El directorio del proyecto, para que get_project_settings encuentre scrapy.cfg
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    if args.child:
+        run_child(args.spider_names[0], args.child, args.pages, args.discovery)
+        return
+
+    print(f"{'spider':<15}{'profile':<12}{'responses':>10}{'items':>8}{'peak MB':>9}{'pauses':>8}{'seconds':>9}")
+    for spider_name in args.spider_names:
+        for profile in PROFILES:
+            result = run(spider_name, profile, args.pages, args.discovery)
+            if result is None:
+                print(f"{spider_name:<15}{profile:<12}{'failed':>10}")
+                continue
+            print(
+                f"{spider_name:<15}{profile:<12}{result['responses']:>10}{result['items']:>8}"
+                f"{result['peak_rss'] / 1048576:>9.0f}{result['pauses']:>8}{result['seconds']:>9.0f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
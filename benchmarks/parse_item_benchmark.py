@@ -0,0 +1,174 @@
+"""
+Micro-benchmark de parse_item: páginas por segundo en un solo núcleo.
+
+Compara la construcción de items con ItemLoader (la implementación anterior de las spiders,
+reproducida abajo) contra la ruta actual con FieldExtractor y build_item, sobre páginas de
+producto sintéticas de cada farmacia. Cada iteración crea una respuesta nueva, así que el
+tiempo incluye el parseo del HTML.
+
+Uso:
+    python benchmarks/parse_item_benchmark.py [--pages 2000] [--padding 60]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from itemloaders.processors import TakeFirst
+from scrapy.http import HtmlResponse, Request
+from scrapy.loader import ItemLoader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medifacil_backend.items import MedicineItem  # noqa: E402
+from medifacil_backend.spiders.CrawlerCruzAzul import CrawlCruzAzul  # noqa: E402
+from medifacil_backend.spiders.CrawlerFybeca import CrawlFybeca  # noqa: E402
+from medifacil_backend.spiders.CrawlerMedicity import CrawlMedicity  # noqa: E402
+
+
+def filler(padding):
+    """
+    Marcado de relleno (menú, categorías, pie de página) para que las páginas tengan un tamaño realista.
+    """
+    return "".join(
+        f'<div class="menu-item"><a href="/categoria-{i}">Categoría {i}</a><span class="badge">{i}</span></div>'
+        for i in range(padding * 10)
+    )
+
+
+def fybeca_page(padding):
+    product = {
+        "@type": "Product",
+        "name": "Paracetamol 500mg x 100 tabletas",
+        "image": ["https://www.fybeca.com/images/paracetamol.jpg"],
+        "offers": {"price": "4.35", "availability": "http://schema.org/InStock"},
+    }
+    return (
+        f'<html><head><script type="application/ld+json">{json.dumps(product)}</script></head>'
+        f'<body>{filler(padding)}<h1>Paracetamol 500mg x 100 tabletas</h1>'
+        f'<div class="price"><span class="value" content="4.35">$4.35</span></div></body></html>'
+    )
+
+
+def medicity_page(padding):
+    return (
+        f'<html><body>{filler(padding)}'
+        '<div class="vtex-flex-layout-0-x-flexCol--right-col"><h1 class="vtex-store-components-3-x-productNameContainer">'
+        '<span class="vtex-store-components-3-x-productBrand">Ibuprofeno 400mg x 20 tabletas</span></h1></div>'
+        '<span class="vtex-product-price-1-x-currencyCode">$</span>'
+        '<span class="vtex-product-price-1-x-currencyInteger">3</span>'
+        '<span class="vtex-product-price-1-x-currencyDecimal">,</span>'
+        '<span class="vtex-product-price-1-x-currencyFraction">15</span>'
+        '<img class="vtex-store-components-3-x-imageElement" src="https://medicity.vteximg.com.br/ibuprofeno.jpg">'
+        '<div class="vtex-product-availability-0-x-container">'
+        '<span class="vtex-product-availability-0-x-highStockText">Disponible</span></div>'
+        '</body></html>'
+    )
+
+
+def cruz_azul_page(padding):
+    return (
+        f'<html><body>{filler(padding)}'
+        '<div class="ps-product__title"><a href="#">Loratadina 10mg x 10 tabletas</a></div>'
+        '<div class="ps-product__meta"><span class="ps-product__price">$2.80</span></div>'
+        '<div class="ps-product__thumbnail"><img src="https://farmaciascruzazul.ec/loratadina.jpg"></div>'
+        '<div class="ps-product__badge"><span class="ps-badge--instock">En stock</span></div>'
+        '</body></html>'
+    )
+
+
+def legacy_item(response, data_from_response):
+    """
+    Construcción del item como lo hacían las spiders antes de FieldExtractor: ItemLoader con TakeFirst.
+    """
+    item_loader = ItemLoader(item=MedicineItem(), selector=response)
+    item_loader.default_output_processor = TakeFirst()
+    for key, value in data_from_response(response).items():
+        item_loader.add_value(key, value)
+    return item_loader.load_item()
+
+
+def legacy_fybeca(response):
+    product_data = response.xpath('//script[@type="application/ld+json"]/text()').get()
+    product_json = json.loads(product_data) if product_data else {}
+    return {
+        'url': response.url,
+        'pharma': 'Fybeca',
+        'name': product_json.get('name') or response.xpath('//h1/text()').get(),
+        'price': product_json.get('offers', {}).get('price') or response.css('.price .value::attr(content)').get(),
+        'url_image': str(product_json.get('image', [])[0] if product_json.get('image') else response.css('img.product-image::attr(src)').get() or ''),
+        'availability': product_json.get('offers', {}).get('availability') or response.css('.availability::text').get() or '',
+        'ingest_date': '2024-01-01',
+    }
+
+
+def legacy_medicity(response):
+    name = response.css('div.vtex-flex-layout-0-x-flexCol--right-col h1.vtex-store-components-3-x-productNameContainer span.vtex-store-components-3-x-productBrand::text').get()
+    response.css('span.vtex-product-price-1-x-currencyCode::text').get()
+    currency_integer = response.css('span.vtex-product-price-1-x-currencyInteger::text').get()
+    currency_decimal = response.css('span.vtex-product-price-1-x-currencyDecimal::text').get()
+    currency_fraction = response.css('span.vtex-product-price-1-x-currencyFraction::text').get()
+    return {
+        'url': response.url,
+        'pharma': 'Medicity',
+        'name': name,
+        'price': f"{currency_integer}{currency_decimal}{currency_fraction}",
+        'url_image': str(response.css('img.vtex-store-components-3-x-imageElement::attr(src)').get() or ''),
+        'availability': response.css('div.vtex-product-availability-0-x-container span.vtex-product-availability-0-x-highStockText::text').get() or '',
+        'ingest_date': '2024-01-01',
+    }
+
+
+def legacy_cruz_azul(response):
+    return {
+        'url': response.url,
+        'pharma': 'CruzAzul',
+        'name': response.css('div.ps-product__title a::text').get(),
+        'price': response.css('div.ps-product__meta span.ps-product__price::text').get(),
+        'url_image': str(response.css('div.ps-product__thumbnail img::attr(src)').get() or ''),
+        'availability': 'Available' if response.css('div.ps-product__badge span.ps-badge--instock::text').get() is not None else 'No available',
+        'ingest_date': '2024-01-01',
+    }
+
+
+def pages_per_second(parse, body, url, pages):
+    start = time.perf_counter()
+    for _ in range(pages):
+        response = HtmlResponse(url=url, body=body, encoding='utf-8', request=Request(url))
+        for _ in parse(response):
+            pass
+    return pages / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse_item (pages/sec per core).")
+    parser.add_argument('--pages', type=int, default=2000, help='Pages parsed per measurement')
+    parser.add_argument('--padding', type=int, default=60, help='Size of the filler markup of each page')
+    args = parser.parse_args()
+
+    cases = [
+        ('CrawlFybeca', CrawlFybeca, legacy_fybeca, fybeca_page, 'https://www.fybeca.com/paracetamol/MED_123.html'),
+        ('CrawlMedicity', CrawlMedicity, legacy_medicity, medicity_page, 'https://www.farmaciasmedicity.com/ibuprofeno/p'),
+        ('CrawlCruzAzul', CrawlCruzAzul, legacy_cruz_azul, cruz_azul_page, 'https://farmaciascruzazul.ec/loratadina-10'),
+    ]
+
+    print(f"{'spider':<15}{'page KB':>9}{'before p/s':>12}{'after p/s':>12}{'speedup':>9}")
+    for name, spider_class, legacy, page, url in cases:
+        spider = spider_class()
+        body = page(args.padding).encode('utf-8')
+
+        # Verifica que ambas rutas construyan el mismo item (salvo la fecha de ingesta)
+        response = HtmlResponse(url=url, body=body, encoding='utf-8', request=Request(url))
+        before_item = dict(legacy_item(response, legacy))
+        after_item = dict(next(spider.parse_item(response)))
+        before_item.pop('ingest_date'), after_item.pop('ingest_date')
+        assert before_item == after_item, (before_item, after_item)
+
+        before = pages_per_second(lambda r: [legacy_item(r, legacy)], body, url, args.pages)
+        after = pages_per_second(spider.parse_item, body, url, args.pages)
+        print(f"{name:<15}{len(body) / 1024:>9.1f}{before:>12.0f}{after:>12.0f}{after / before:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,13 @@
 bind = "0.0.0.0:8000"
 workers = 2
-timeout = 10800
\ No newline at end of file
+# /scraper ya no ejecuta el scraper dentro del worker (lo hace scraper_daemon.py),
+# así que ninguna solicitud debería tardar más que una búsqueda
+timeout = 60
+
+
+def worker_exit(server, worker):
+    """
+    Cierra el pool de conexiones a PostgreSQL del worker que termina.
+    """
+    from app import db_pool
+    db_pool.closeall()
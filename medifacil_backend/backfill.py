@@ -0,0 +1,75 @@
+import argparse
+import logging
+import os
+
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from medifacil_backend.db import connection_params
+from medifacil_backend.items import parse_presentation
+
+# python -m medifacil_backend.backfill [--all] [--batch-size 1000]
+
+
+def backfill_presentations(connection, only_missing=True, batch_size=1000):
+    """
+    Calcula base_name, pack_quantity y unit_price para las filas existentes de public.medicines.
+
+    Las filas se leen con un cursor del lado del servidor y se actualizan por lotes.
+
+    Args:
+        connection (psycopg2.extensions.connection): Conexión a la base de datos.
+        only_missing (bool): Si es True solo procesa las filas que no tienen base_name.
+        batch_size (int): Cantidad de filas por lote de actualización.
+
+    Returns:
+        int: Cantidad de filas actualizadas.
+    """
+    condition = "WHERE base_name IS NULL" if only_missing else ""
+    read_cursor = connection.cursor(name="backfill_presentations")
+    read_cursor.itersize = batch_size
+    read_cursor.execute(f"SELECT url, name, price FROM public.medicines {condition}")
+
+    updated = 0
+    with connection.cursor() as write_cursor:
+        while True:
+            rows = read_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+
+            values = [(url, *parse_presentation(name, price)) for url, name, price in rows]
+            execute_values(
+                write_cursor,
+                """
+                UPDATE public.medicines AS m
+                SET base_name = v.base_name, pack_quantity = v.pack_quantity, unit_price = v.unit_price
+                FROM (VALUES %s) AS v (url, base_name, pack_quantity, unit_price)
+                WHERE m.url = v.url
+                """,
+                values,
+                template="(%s, %s, %s::integer, %s::decimal)"
+            )
+            updated += len(values)
+            logging.info(f"{updated} rows backfilled")
+
+    read_cursor.close()
+    connection.commit()
+    return updated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill base_name, pack_quantity and unit_price in public.medicines.")
+    parser.add_argument('--all', action='store_true', help='Recalculate every row, not only the ones without base_name')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows per update batch')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    assert load_dotenv(f"{os.getcwd()}/medifacil_backend/.env", override=True)
+
+    connection = psycopg2.connect(**connection_params())
+    try:
+        total = backfill_presentations(connection, only_missing=not args.all, batch_size=args.batch_size)
+        print(f"{total} rows backfilled")
+    finally:
+        connection.close()
@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+
+from medifacil_backend import localstore
+
+
+class PharmaCache:
+    """
+    Caché en memoria (por proceso) de la metadata de las farmacias de la tabla public.pharmas.
+
+    La tabla tiene muy pocas filas y casi nunca cambia, así que se carga completa y se
+    mantiene en memoria hasta que vence su TTL o hasta que se invalida explícitamente.
+    Las farmacias que no existen también se recuerdan hasta que vence el TTL, para no
+    consultar la base de datos en cada solicitud que las pida.
+    """
+
+    def __init__(self, loader, ttl=3600):
+        """
+        Args:
+            loader (callable): Función sin argumentos que devuelve un dict {pharma: {location, link_logo, link}}.
+            ttl (float): Segundos que los datos se consideran vigentes.
+        """
+        self.loader = loader
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._pharmas = {}
+        self._missing = set()
+        self._expires_at = 0.0
+        self._loads = 0
+
+    def refresh(self, seen_loads=None):
+        """
+        Recarga todas las farmacias desde la base de datos.
+
+        Args:
+            seen_loads (int): Número de cargas que vio quien pide la recarga; si otro hilo recargó
+                mientras se esperaba el lock, se devuelven esos datos sin volver a consultar.
+
+        Returns:
+            dict: Farmacias cargadas, indexadas por nombre.
+        """
+        with self._lock:
+            if seen_loads is not None and self._loads != seen_loads:
+                return self._pharmas
+            pharmas = self.loader()
+            self._pharmas = pharmas
+            self._missing = set()
+            self._expires_at = time.monotonic() + self.ttl
+            self._loads += 1
+            logging.info(f"Pharmas cache loaded with {len(pharmas)} rows")
+            return pharmas
+
+    def invalidate(self):
+        """
+        Marca los datos como vencidos; la siguiente lectura los vuelve a cargar.
+        """
+        self._expires_at = 0.0
+
+    def all(self):
+        """
+        Devuelve todas las farmacias, recargándolas si el TTL venció.
+
+        Returns:
+            dict: Farmacias indexadas por nombre.
+        """
+        loads = self._loads
+        if time.monotonic() >= self._expires_at:
+            return self.refresh(seen_loads=loads)
+        return self._pharmas
+
+    def get(self, pharma):
+        """
+        Devuelve la metadata de una farmacia.
+
+        Si la farmacia no está en caché se recarga una vez, por si fue agregada después de la última
+        carga; si sigue sin aparecer no se vuelve a recargar por ella hasta que vence el TTL.
+
+        Args:
+            pharma (str): Nombre de la farmacia.
+
+        Returns:
+            dict: Metadata de la farmacia (location, link_logo, link) o None si no existe.
+        """
+        loads = self._loads
+        pharmas = self.all()
+        if pharma in pharmas or pharma in self._missing:
+            return pharmas.get(pharma)
+
+        # Si all() acaba de recargar, no se vuelve a consultar
+        pharmas = self.refresh(seen_loads=loads)
+        if pharma not in pharmas:
+            with self._lock:
+                if pharma not in self._pharmas:
+                    self._missing.add(pharma)
+        return pharmas.get(pharma)
+
+
+def normalize_names(names):
+    """
+    Normaliza una lista de nombres para usarla como llave de caché.
+
+    Args:
+        names (list): Nombres tal como llegan en la solicitud.
+
+    Returns:
+        list: Nombres en minúsculas, sin espacios repetidos ni al inicio/final.
+    """
+    return [" ".join(name.lower().split()) for name in names]
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class SearchCache:
+    """
+    Caché de resultados de /search compartida por todos los workers del servidor.
+
+    Los resultados se guardan en un archivo SQLite local, indexados por la lista normalizada
+    de nombres. Las entradas vencen por TTL, se desalojan por LRU cuando se supera
+    `max_entries` y se invalidan cuando cambia la generación del catálogo, un contador que
+    el pipeline incrementa al terminar cada ejecución del scraper.
+    """
+
+    def __init__(self, path, generation_loader, max_entries=5000, ttl=21600, generation_check_interval=10):
+        """
+        Args:
+            path (str): Ruta del archivo SQLite de la caché.
+            generation_loader (callable): Función sin argumentos que devuelve la generación actual del catálogo.
+            max_entries (int): Máximo de entradas antes de desalojar las menos usadas.
+            ttl (float): Segundos de vigencia de cada entrada.
+            generation_check_interval (float): Segundos entre consultas de la generación del catálogo.
+        """
+        self.path = path
+        self.generation_loader = generation_loader
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self.generation_check_interval = float(generation_check_interval)
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._generation = None
+        self._generation_checked_at = 0.0
+        self._listeners = []
+
+    def on_generation_change(self, callback):
+        """
+        Registra una función que se llama cuando se detecta una nueva generación del catálogo.
+
+        Args:
+            callback (callable): Función sin argumentos.
+        """
+        self._listeners.append(callback)
+
+    def _connection(self):
+        pid = os.getpid()
+        if self._conn is None or self._pid != pid:
+            self._conn = localstore.connect(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_search_cache_accessed_at ON search_cache (accessed_at)"
+            )
+            self._pid = pid
+        return self._conn
+
+    def generation(self):
+        """
+        Devuelve la generación actual del catálogo, consultándola como máximo cada `generation_check_interval` segundos.
+
+        Cuando la generación cambia se eliminan las entradas de generaciones anteriores y se
+        notifica a los listeners registrados.
+
+        Returns:
+            int: Generación actual del catálogo.
+        """
+        now = time.monotonic()
+        if self._generation is not None and now - self._generation_checked_at < self.generation_check_interval:
+            return self._generation
+
+        generation = self.generation_loader()
+        self._generation_checked_at = now
+        if generation != self._generation:
+            previous = self._generation
+            self._generation = generation
+            with self._lock:
+                self._connection().execute("DELETE FROM search_cache WHERE generation != ?", (generation, ))
+            if previous is not None:
+                logging.info(f"Catalog generation changed {previous} -> {generation}, search cache invalidated")
+                for callback in self._listeners:
+                    callback()
+        return generation
+
+    @staticmethod
+    def _key(names):
+        return json.dumps(normalize_names(names), ensure_ascii=False)
+
+    def get(self, names):
+        """
+        Busca un resultado en caché.
+
+        Args:
+            names (list): Nombres de la búsqueda.
+
+        Returns:
+            object: El resultado guardado, o None si no existe, venció o es de otra generación.
+        """
+        generation = self.generation()
+        key = self._key(names)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, generation, created_at FROM search_cache WHERE key = ?", (key, )
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, entry_generation, created_at = row
+            now = time.time()
+            if entry_generation != generation or now - created_at > self.ttl:
+                conn.execute("DELETE FROM search_cache WHERE key = ?", (key, ))
+                return None
+
+            conn.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, names, value):
+        """
+        Guarda un resultado en caché y desaloja las entradas menos usadas si se supera el máximo.
+
+        Args:
+            names (list): Nombres de la búsqueda.
+            value (object): Resultado serializable a JSON.
+        """
+        generation = self.generation()
+        key = self._key(names)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO search_cache (key, generation, value, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, generation, json.dumps(value, default=_json_default), now, now)
+            )
+            conn.execute(
+                """
+                DELETE FROM search_cache WHERE key IN (
+                    SELECT key FROM search_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries, )
+            )
+
+    def clear(self):
+        """
+        Elimina todas las entradas de la caché.
+        """
+        with self._lock:
+            self._connection().execute("DELETE FROM search_cache")
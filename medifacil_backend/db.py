@@ -0,0 +1,262 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+
+def connection_params():
+    """
+    Lee los parámetros de conexión a PostgreSQL desde las variables de entorno.
+
+    Returns:
+        dict: Parámetros para psycopg2.connect.
+    """
+    return {
+        "host": os.environ["DB_HOSTNAME"],
+        "user": os.environ["DB_USERNAME"],  # El usuario con el que te conectas
+        "password": os.environ["DB_PASSWORD"],  # La contraseña del usuario
+        "dbname": os.environ["DB_DATABASE"],  # La base de datos a la que te conectas
+        "port": os.environ["DB_PORT"],  # Puerto de PostgreSQL (el valor por defecto es 5432)
+    }
+
+
+class PoolTimeout(Exception):
+    """
+    Se lanza cuando no se obtiene una conexión libre del pool dentro del tiempo de espera.
+    """
+
+
+class _CountingConnectionPool(pg_pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool que lleva la cuenta de las conexiones físicas abiertas.
+    """
+
+    def __init__(self, on_connect, *args, **kwargs):
+        self._on_connect = on_connect
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self._on_connect(conn)
+        return conn
+
+
+class PostgresConnectionPool:
+    """
+    Pool de conexiones PostgreSQL reutilizables, pensado para un pool por worker de gunicorn.
+
+    El pool se crea de forma perezosa en el primer uso y se vuelve a crear si el proceso
+    cambia de PID (por ejemplo, después de un fork), de modo que los workers nunca comparten
+    sockets con el proceso padre. Antes de entregar una conexión que lleva tiempo inactiva
+    se verifica con un `SELECT 1`; las conexiones rotas se descartan y se reemplazan.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=5.0, health_check_interval=30.0, **conn_kwargs):
+        """
+        Args:
+            minconn (int): Conexiones que se mantienen abiertas en reposo.
+            maxconn (int): Máximo de conexiones simultáneas por proceso.
+            timeout (float): Segundos que se espera por una conexión libre antes de fallar.
+            health_check_interval (float): Segundos de inactividad tras los cuales se verifica la conexión.
+            **conn_kwargs: Parámetros de conexión pasados a psycopg2.connect.
+        """
+        self.minconn = int(minconn)
+        self.maxconn = int(maxconn)
+        self.timeout = float(timeout)
+        self.health_check_interval = float(health_check_interval)
+        self._conn_kwargs = conn_kwargs
+
+        # Reentrante: protege también las métricas, que se actualizan al abrir conexiones mientras se crea el pool
+        self._lock = threading.RLock()
+        self._pool = None
+        self._pid = None
+        self._slots = None
+        self._last_used = {}
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._metrics = {
+            "checkouts": 0,
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "health_check_failures": 0,
+            "timeouts": 0,
+            "in_use": 0,
+        }
+
+    def _count(self, metric, delta=1):
+        with self._lock:
+            self._metrics[metric] += delta
+
+    def _register_connection(self, conn):
+        self._count("connections_created")
+        self._last_used[id(conn)] = time.monotonic()
+
+    def _get_pool(self):
+        """
+        Devuelve el pool del proceso actual, creándolo si no existe o si el proceso cambió.
+
+        Returns:
+            psycopg2.pool.ThreadedConnectionPool: Pool del proceso actual.
+        """
+        pid = os.getpid()
+        if self._pool is None or self._pid != pid:
+            with self._lock:
+                if self._pool is None or self._pid != pid:
+                    # Las conexiones heredadas de otro proceso no se cierran: pertenecen al padre
+                    self._last_used = {}
+                    self._reset_metrics()
+                    self._slots = threading.BoundedSemaphore(self.maxconn)
+                    self._pool = _CountingConnectionPool(
+                        self._register_connection,
+                        self.minconn,
+                        self.maxconn,
+                        **self._conn_kwargs
+                    )
+                    self._pid = pid
+        return self._pool
+
+    def _is_healthy(self, conn):
+        """
+        Verifica si una conexión sigue siendo utilizable.
+
+        Args:
+            conn (psycopg2.extensions.connection): Conexión a verificar.
+
+        Returns:
+            bool: True si la conexión responde.
+        """
+        if conn.closed:
+            return False
+
+        idle = time.monotonic() - self._last_used.get(id(conn), 0)
+        if idle < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, pool, conn):
+        self._last_used.pop(id(conn), None)
+        self._count("connections_discarded")
+        try:
+            pool.putconn(conn, close=True)
+        except pg_pool.PoolError:
+            pass
+
+    def getconn(self):
+        """
+        Obtiene una conexión sana del pool, esperando hasta `timeout` segundos si está lleno.
+
+        Returns:
+            psycopg2.extensions.connection: Conexión lista para usarse.
+
+        Raises:
+            PoolTimeout: Si no hay conexiones libres dentro del tiempo de espera.
+        """
+        pool = self._get_pool()
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count("timeouts")
+            raise PoolTimeout(f"No free database connection after {self.timeout}s")
+
+        try:
+            # Se reintenta una vez por cada conexión posible; una caída del servidor puede invalidar todas
+            for _ in range(self.maxconn + 1):
+                conn = pool.getconn()
+                if self._is_healthy(conn):
+                    break
+                self._count("health_check_failures")
+                self._discard(pool, conn)
+            else:
+                conn = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._count("checkouts")
+        self._count("in_use")
+        return conn
+
+    def putconn(self, conn, close=False):
+        """
+        Devuelve una conexión al pool.
+
+        Args:
+            conn (psycopg2.extensions.connection): Conexión obtenida con getconn().
+            close (bool): Si es True la conexión se cierra en lugar de reutilizarse.
+        """
+        pool = self._get_pool()
+        try:
+            if close or conn.closed:
+                self._discard(pool, conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                pool.putconn(conn)
+        finally:
+            self._count("in_use", -1)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager que presta una conexión del pool y la devuelve al terminar.
+
+        Si ocurre un error de conexión (servidor caído, socket cerrado) la conexión se
+        descarta para que el siguiente uso abra una nueva. Cualquier otro error revierte
+        la transacción en curso.
+
+        Yields:
+            psycopg2.extensions.connection: Conexión a la base de datos.
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def stats(self):
+        """
+        Devuelve las métricas del pool del proceso actual.
+
+        Returns:
+            dict: Contadores de uso y tamaño del pool.
+        """
+        pool = self._get_pool()
+        with self._lock:
+            metrics = dict(self._metrics)
+        return dict(
+            metrics,
+            pid=self._pid,
+            idle=len(pool._pool),
+            minconn=self.minconn,
+            maxconn=self.maxconn,
+        )
+
+    def closeall(self):
+        """
+        Cierra todas las conexiones del pool del proceso actual.
+        """
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid() and not self._pool.closed:
+                self._pool.closeall()
+                logging.info("Database pool closed")
+            self._pool = None
+            self._pid = None
@@ -0,0 +1,250 @@
+import logging
+import re
+import zlib
+from io import BytesIO
+from urllib.parse import urlparse
+
+import scrapy
+from lxml import etree
+from scrapy.http import XmlResponse
+from scrapy.utils.gz import gunzip, gzip_magic_number
+from scrapy.utils.sitemap import sitemap_urls_from_robots
+
+
+# Modos de descubrimiento de productos (setting DISCOVERY_MODE o argumento de spider `discovery`)
+DISCOVERY_LINKS = "links"
+DISCOVERY_SITEMAP = "sitemap"
+DISCOVERY_API = "api"  # Solo spiders con API de catálogo (CrawlMedicity); el resto usa "links"
+
+# Tamaño máximo de un sitemap comprimido una vez descomprimido (el límite del protocolo es 50 MB)
+SITEMAP_MAX_SIZE = 50 * 1024 * 1024
+
+
+def sitemap_body(response):
+    """
+    Devuelve el XML de un sitemap, descomprimiéndolo si llegó como .xml.gz.
+
+    Args:
+        response (scrapy.http.Response): Respuesta del sitemap.
+
+    Returns:
+        bytes: XML del sitemap o None si la respuesta no es un sitemap.
+    """
+    if isinstance(response, XmlResponse):
+        return response.body
+    if gzip_magic_number(response):
+        try:
+            return gunzip(response.body, max_size=SITEMAP_MAX_SIZE)
+        except Exception:
+            return None
+    # Algunos servidores entregan el sitemap como text/plain o application/octet-stream
+    if response.url.split("?")[0].endswith(".xml") or response.body.lstrip().startswith(b"<?xml"):
+        return response.body
+    return None
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else None
+
+
+def parse_sitemap(body):
+    """
+    Lee un sitemap o un índice de sitemaps.
+
+    El XML se recorre de forma incremental (iterparse) y cada entrada se descarta apenas se lee
+    su <loc>, así que un sitemap de 50 MB no se convierte en un árbol completo en memoria. No
+    depende de Scrapy ni de la red, así que se puede probar con sitemaps grabados.
+
+    Args:
+        body (bytes): XML del sitemap.
+
+    Returns:
+        tuple: (sitemaps, urls) con las URLs de los sitemaps hijos (si es un índice) y las
+            URLs de páginas (si es un urlset).
+    """
+    locations = []
+    events = etree.iterparse(
+        BytesIO(body),
+        tag=("{*}url", "{*}sitemap"),
+        resolve_entities=False,
+        recover=True,
+        huge_tree=True,
+    )
+    try:
+        for _, element in events:
+            # Solo el <loc> de la entrada, no el de las extensiones (por ejemplo <image:loc>)
+            location = element.findtext("{*}loc")
+            if location:
+                locations.append(location.strip())
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    except etree.XMLSyntaxError:
+        pass
+
+    root = _local_name(events.root.tag) if events.root is not None else None
+    if root == "sitemapindex":
+        return locations, []
+    if root == "urlset":
+        return [], locations
+    return [], []
+
+
+class SitemapDiscoveryMixin:
+    """
+    Descubrimiento de productos a partir del sitemap de la tienda.
+
+    En modo DISCOVERY_SITEMAP la spider lee los sitemaps de `sitemap_urls` (sitemap.xml,
+    índices de sitemaps o robots.txt) y envía las URLs que coinciden con `item_url_pattern`
+    directamente a `parse_item`, sin descargar páginas de categorías ni de marcas. Si la
+    tienda no tiene sitemap o ninguna URL coincide, se vuelve a las solicitudes de
+    `link_requests()`, que recorren los listados siguiendo enlaces.
+
+    Con el argumento `-a shard=i/n` la spider procesa solo su parte del trabajo, para repartirlo
+    entre n procesos (ver `--shards` en app_scraper.py): las URLs de producto cuyo hash cae en su
+    parte. En modo sitemap se filtran aquí; en modo enlaces cada parte recorre todos los listados
+    (los de una parte pueden ser la única ruta a productos de otra) y MedifacilBackendSpiderMiddleware
+    descarta los enlaces a productos de las demás partes.
+
+    Las clases que lo usan deben definir `sitemap_urls`, `item_url_pattern`, `parse_item` y
+    `link_requests()`.
+    """
+
+    sitemap_urls = ()
+    item_url_pattern = None
+
+    def discovery_mode(self):
+        """
+        Devuelve el modo de descubrimiento: el argumento `-a discovery=...` o el setting DISCOVERY_MODE.
+
+        Returns:
+            str: DISCOVERY_LINKS, DISCOVERY_SITEMAP o DISCOVERY_API.
+        """
+        return getattr(self, "discovery", None) or self.settings.get("DISCOVERY_MODE", DISCOVERY_LINKS)
+
+    def shard_spec(self):
+        """
+        Lee el argumento `-a shard=i/n`.
+
+        Returns:
+            tuple: (índice, total) de la parte de esta spider; (0, 1) si no se usa.
+        """
+        value = getattr(self, "shard", None)
+        if not value:
+            return 0, 1
+        index, count = (int(part) for part in str(value).split("/"))
+        if not 0 <= index < count:
+            raise ValueError(f"Invalid shard {value!r}, expected i/n with 0 <= i < n")
+        return index, count
+
+    def in_shard(self, key):
+        """
+        Indica si una llave (URL, categoría...) le corresponde a esta parte.
+
+        Usa un hash estable entre procesos (crc32), no hash() de Python.
+
+        Args:
+            key (str): Llave a repartir.
+
+        Returns:
+            bool: True si la llave se procesa en esta parte.
+        """
+        index, count = self.shard_spec()
+        return count == 1 or zlib.crc32(key.encode("utf-8")) % count == index
+
+    def start_requests(self):
+        """
+        Inicia el rastreo según el modo de descubrimiento.
+        """
+        if self.discovery_mode() != DISCOVERY_SITEMAP or not self.sitemap_urls:
+            yield from self.link_requests()
+            return
+
+        self._item_url_regex = re.compile(self.item_url_pattern)
+        self._sitemaps_seen = set()
+        self._sitemaps_pending = 0
+        self._sitemap_products = 0
+        self._discovery_fallback = False
+
+        for url in self.sitemap_urls:
+            yield from self._sitemap_request(url)
+        # Si no quedó ningún sitemap por pedir (todos de otro dominio)
+        yield from self._fallback_if_empty()
+
+    def _is_offsite(self, url):
+        host = urlparse(url).hostname or ""
+        domains = [domain.split(":")[0] for domain in getattr(self, "allowed_domains", None) or ()]
+        return bool(domains) and not any(host == domain or host.endswith(f".{domain}") for domain in domains)
+
+    def _sitemap_request(self, url):
+        # Los sitemaps no pasan por el filtro de duplicados: se llevan en un set propio para que
+        # el contador de pendientes no quede esperando una solicitud descartada
+        if url in self._sitemaps_seen:
+            return
+        self._sitemaps_seen.add(url)
+        # OffsiteMiddleware descartaría sin aviso un sitemap de otro dominio (por ejemplo, de un CDN
+        # listado en robots.txt) y el contador de pendientes nunca llegaría a 0
+        if self._is_offsite(url):
+            logging.warning(f"Ignoring offsite sitemap: {url}")
+            self.crawler.stats.inc_value("discovery/offsite_sitemaps")
+            return
+        self._sitemaps_pending += 1
+        # Los sitemaps pueden superar el download_maxsize de la tienda, pensado para páginas HTML
+        yield scrapy.Request(
+            url,
+            callback=self.parse_sitemap,
+            errback=self.sitemap_failed,
+            dont_filter=True,
+            meta={"download_maxsize": SITEMAP_MAX_SIZE}
+        )
+
+    def parse_sitemap(self, response):
+        """
+        Procesa un sitemap, un índice de sitemaps o un robots.txt.
+
+        Args:
+            response (scrapy.http.Response): La respuesta de la solicitud.
+        """
+        self._sitemaps_pending -= 1
+        self.crawler.stats.inc_value("discovery/sitemaps")
+
+        if response.url.endswith("/robots.txt"):
+            children, urls = list(sitemap_urls_from_robots(response.text, base_url=response.url)), []
+        else:
+            body = sitemap_body(response)
+            if body is None:
+                logging.warning(f"Ignoring invalid sitemap: {response.url}")
+                children, urls = [], []
+            else:
+                children, urls = parse_sitemap(body)
+
+        for url in children:
+            yield from self._sitemap_request(url)
+
+        for url in urls:
+            if self._item_url_regex.match(url) and self.in_shard(url):
+                self._sitemap_products += 1
+                self.crawler.stats.inc_value("discovery/sitemap_products")
+                yield scrapy.Request(url, callback=self.parse_item)
+
+        yield from self._fallback_if_empty()
+
+    def sitemap_failed(self, failure):
+        """
+        Maneja un sitemap que no se pudo descargar (por ejemplo, 404).
+
+        Args:
+            failure (twisted.python.failure.Failure): El error de la solicitud.
+        """
+        self._sitemaps_pending -= 1
+        logging.warning(f"Sitemap failed: {failure.request.url} ({failure.getErrorMessage()})")
+        yield from self._fallback_if_empty()
+
+    def _fallback_if_empty(self):
+        if self._sitemaps_pending > 0 or self._sitemap_products or self._discovery_fallback:
+            return
+
+        self._discovery_fallback = True
+        self.crawler.stats.set_value("discovery/fallback", True)
+        logging.warning(f"No products found in the sitemaps of {self.name}, falling back to link following")
+        yield from self.link_requests()
@@ -0,0 +1,132 @@
+# Define here the models for your extensions
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+
+import gc
+import os
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+
+def current_rss():
+    """
+    Devuelve la memoria residente actual del proceso.
+
+    MemoryUsage de Scrapy usa el pico (ru_maxrss), que nunca baja; para saber si la memoria se
+    liberó hace falta la residente actual, que se lee de /proc (solo Linux).
+
+    Returns:
+        int: Bytes de memoria residente, o None si /proc no está disponible.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryWatchdog:
+    """
+    Frena el rastreo cuando la memoria residente supera MEMORY_WATCHDOG_LIMIT_MB, en vez de cerrarlo.
+
+    Cada MEMORY_WATCHDOG_INTERVAL segundos revisa la memoria residente. Si supera el límite,
+    pausa el motor: no salen solicitudes nuevas mientras las descargas en curso y las respuestas
+    pendientes se procesan y se liberan. Se reanuda cuando la memoria baja de
+    MEMORY_WATCHDOG_RESUME_RATIO veces el límite.
+
+    Si pasan MEMORY_WATCHDOG_GRACE segundos sin trabajo en curso y la memoria no baja (Python no
+    siempre devuelve al sistema la memoria liberada), se reanuda igual y el umbral sube a la
+    memoria actual más un margen, para no quedar en pausa para siempre. El límite duro sigue
+    siendo MEMUSAGE_LIMIT_MB de Scrapy.
+
+    Se activa con MEMORY_WATCHDOG_ENABLED (lo hace `app_scraper.py --low-memory`). Si
+    MEMORY_WATCHDOG_LIMIT_MB es 0 se usa el 75% de MEMUSAGE_LIMIT_MB.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        limit_mb = settings.getint("MEMORY_WATCHDOG_LIMIT_MB") or int(settings.getint("MEMUSAGE_LIMIT_MB") * 0.75)
+        if not limit_mb:
+            raise NotConfigured
+        if current_rss() is None:
+            raise NotConfigured("MemoryWatchdog needs /proc/self/statm")
+
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.limit = limit_mb * 1024 * 1024
+        self.resume_ratio = settings.getfloat("MEMORY_WATCHDOG_RESUME_RATIO", 0.85)
+        self.interval = settings.getfloat("MEMORY_WATCHDOG_INTERVAL", 2.0)
+        self.grace = settings.getfloat("MEMORY_WATCHDOG_GRACE", 5.0)
+        self.threshold = self.limit
+        self.paused_at = None
+        self.drained_at = None
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("MEMORY_WATCHDOG_ENABLED"):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.engine_started, signal=signals.engine_started)
+        crawler.signals.connect(s.engine_stopped, signal=signals.engine_stopped)
+        return s
+
+    def engine_started(self):
+        self.task = task.LoopingCall(self.check)
+        self.task.start(self.interval, now=False)
+
+    def engine_stopped(self):
+        if self.task and self.task.running:
+            self.task.stop()
+        if self.paused_at is not None:
+            self.stats.inc_value("memwatchdog/paused_seconds", round(time.monotonic() - self.paused_at, 1))
+
+    def _in_progress(self):
+        engine = self.crawler.engine
+        return len(engine.downloader.active) + len(engine.scraper.slot.active)
+
+    def check(self):
+        """
+        Pausa o reanuda el motor según la memoria residente actual.
+        """
+        rss = current_rss()
+        self.stats.max_value("memwatchdog/max_rss", rss)
+        engine = self.crawler.engine
+        spider = engine.spider
+
+        if self.paused_at is None:
+            if rss > self.threshold:
+                self.paused_at = time.monotonic()
+                self.drained_at = None
+                engine.pause()
+                self.stats.inc_value("memwatchdog/pauses")
+                spider.logger.warning(
+                    f"Memory watchdog: {rss / 1048576:.0f} MB above {self.threshold / 1048576:.0f} MB, "
+                    f"pausing until in-flight work ({self._in_progress()} requests/responses) drains"
+                )
+            return
+
+        gc.collect()
+        rss = current_rss()
+        if rss < self.threshold * self.resume_ratio:
+            reason = "memory released"
+        elif self._in_progress():
+            self.drained_at = None
+            return
+        elif self.drained_at is None or time.monotonic() - self.drained_at < self.grace:
+            self.drained_at = self.drained_at or time.monotonic()
+            return
+        else:
+            # Ya no hay nada que drenar: la memoria retenida no se va a liberar esperando
+            self.threshold = max(self.threshold, int(rss / self.resume_ratio))
+            reason = f"nothing left to drain, threshold raised to {self.threshold / 1048576:.0f} MB"
+
+        paused = time.monotonic() - self.paused_at
+        self.stats.inc_value("memwatchdog/paused_seconds", round(paused, 1))
+        self.paused_at = None
+        engine.unpause()
+        spider.logger.warning(f"Memory watchdog: resuming after {paused:.1f}s at {rss / 1048576:.0f} MB ({reason})")
@@ -0,0 +1,88 @@
+import json
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+from medifacil_backend.items import MedicineItem, transform_price
+
+
+_translator = HTMLTranslator()
+
+
+class FieldExtractor:
+    """
+    Extrae varios campos de una página con selectores precompilados.
+
+    Los selectores CSS (con los pseudo-elementos `::text` y `::attr(...)` de Scrapy) se
+    traducen a XPath y se compilan una sola vez al definir la spider. En cada página se
+    evalúan directamente sobre el árbol lxml ya parseado de la respuesta, sin crear
+    `Selector` ni `SelectorList` intermedios por cada consulta.
+    """
+
+    def __init__(self, **selectors):
+        """
+        Args:
+            **selectors: Selector CSS por nombre de campo, por ejemplo name='h1::text'.
+        """
+        self.selectors = {
+            field: etree.XPath(_translator.css_to_xpath(css), smart_strings=False)
+            for field, css in selectors.items()
+        }
+
+    def extract(self, response, fields=None):
+        """
+        Evalúa los selectores sobre la página.
+
+        Args:
+            response (scrapy.http.Response): La respuesta de la solicitud.
+            fields (iterable): Campos a extraer; por defecto todos.
+
+        Returns:
+            dict: Primer resultado de cada selector por nombre de campo, o None si no hubo resultados.
+        """
+        root = response.selector.root
+        data = {}
+        for field in self.selectors if fields is None else fields:
+            result = self.selectors[field](root)
+            data[field] = result[0] if result else None
+        return data
+
+
+_json_ld = etree.XPath('//script[@type="application/ld+json"]/text()', smart_strings=False)
+
+
+def json_ld(response):
+    """
+    Devuelve el primer bloque JSON-LD de la página.
+
+    Args:
+        response (scrapy.http.Response): La respuesta de la solicitud.
+
+    Returns:
+        dict: El JSON-LD decodificado, o un dict vacío si la página no tiene.
+    """
+    result = _json_ld(response.selector.root)
+    return json.loads(result[0]) if result else {}
+
+
+def build_item(**data):
+    """
+    Construye un MedicineItem sin pasar por ItemLoader.
+
+    Aplica la misma validación que el ItemLoader con TakeFirst que usaban las spiders: el
+    precio pasa por transform_price y los campos vacíos (None o '') se omiten.
+
+    Args:
+        **data: Valores de los campos de MedicineItem.
+
+    Returns:
+        MedicineItem: El item construido.
+    """
+    item = MedicineItem()
+    for field, value in data.items():
+        if field == "price" and value is not None:
+            value = transform_price(str(value))
+        if value is None or value == "":
+            continue
+        item[field] = value
+    return item
@@ -0,0 +1,352 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+import psycopg2
+import scrapy
+from scrapy.exceptions import IgnoreRequest
+from scrapy.spidermiddlewares.httperror import HttpError
+
+from medifacil_backend import localstore
+from medifacil_backend.db import connection_params
+
+# Modo de descubrimiento que vuelve a rastrear los productos conocidos, los más desactualizados primero
+DISCOVERY_FRESHNESS = "freshness"
+
+# Modo de descubrimiento que actualiza todos los productos conocidos, sin ordenarlos (app_scraper.py --refresh)
+DISCOVERY_REFRESH = "refresh"
+
+# Señal que se envía cuando la página de un producto conocido ya no existe (404 o 410).
+# PostgresPipeline la usa para marcar el producto como no disponible.
+product_gone = object()
+
+# Respuestas que indican que la tienda retiró el producto
+GONE_STATUSES = (404, 410)
+
+# URLs de los productos conocidos de una farmacia, para el modo DISCOVERY_REFRESH
+REFRESH_QUERY = "SELECT url FROM public.medicines WHERE pharma = %s"
+
+# Productos conocidos de una farmacia con lo necesario para estimar su frescura:
+#   stale_days: días desde la última vez que el scraper vio el producto (NULL si nunca tuvo ingest_date)
+#   changes: cambios de precio o disponibilidad registrados en price_history (la primera fila es el alta)
+#   observed_days: días desde la primera fila de price_history del producto
+FRESHNESS_QUERY = """
+SELECT
+    m.url,
+    current_date - m.ingest_date,
+    greatest(count(h.url) - 1, 0),
+    coalesce(extract(epoch FROM now() - min(h.changed_at)) / 86400, 0)
+FROM public.medicines m
+LEFT JOIN public.price_history h ON h.url = m.url
+WHERE m.pharma = %s
+GROUP BY m.url, m.ingest_date
+"""
+
+
+def freshness_score(stale_days, changes, observed_days, hits=0, prior_changes=1.0, prior_days=30.0, popularity_weight=0.5):
+    """
+    Prioridad de un producto para volver a rastrearlo.
+
+    Estima la probabilidad de que el producto haya cambiado desde la última vez que se vio,
+    suponiendo que sus cambios llegan a la tasa observada en price_history (proceso de Poisson):
+    1 - e^(-tasa * días sin rastrear). La tasa parte de `prior_changes` cambios cada `prior_days`
+    días, para que los productos con poco historial no queden en 0. Las búsquedas recientes que
+    devolvieron el producto multiplican la prioridad por 1 + popularity_weight * ln(1 + hits).
+
+    Args:
+        stale_days (int): Días desde la última vez que se vio el producto, o None si nunca se vio.
+        changes (int): Cambios registrados en el historial.
+        observed_days (float): Días cubiertos por el historial.
+        hits (int): Veces que /search devolvió el producto en la ventana de popularidad.
+        prior_changes (float): Cambios supuestos antes de observar el producto.
+        prior_days (float): Días en los que se suponen esos cambios.
+        popularity_weight (float): Peso de la popularidad.
+
+    Returns:
+        float: Puntaje mayor o igual a 0; mayor significa más urgente.
+    """
+    if stale_days is None:
+        changed = 1.0
+    else:
+        rate = (changes + prior_changes) / (observed_days + prior_days)
+        changed = 1.0 - math.exp(-rate * max(stale_days, 0))
+    return changed * (1.0 + popularity_weight * math.log1p(hits))
+
+
+class SearchPopularity:
+    """
+    Veces que /search devolvió cada producto, por día, compartido entre los workers del servidor
+    y el scraper mediante un archivo SQLite local.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Ruta del archivo SQLite.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Crea el contador con la ruta de la variable de entorno SEARCH_POPULARITY_PATH.
+
+        Returns:
+            SearchPopularity: Contador de búsquedas.
+        """
+        return cls(os.environ.get("SEARCH_POPULARITY_PATH", f"{os.getcwd()}/temp/search_popularity.sqlite3"))
+
+    def _connection(self):
+        pid = os.getpid()
+        if self._conn is None or self._pid != pid:
+            self._conn = localstore.connect(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS search_hits (
+                    url TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    hits INTEGER NOT NULL,
+                    PRIMARY KEY (url, day)
+                )
+                """
+            )
+            self._pid = pid
+        return self._conn
+
+    def add_hits(self, hits):
+        """
+        Suma búsquedas de hoy a varios productos en una sola transacción.
+
+        Args:
+            hits (dict): Búsquedas a sumar por URL.
+        """
+        day = date.today().isoformat()
+        rows = [(url, day, count) for url, count in hits.items()]
+        if not rows:
+            return
+        with self._lock:
+            self._connection().executemany(
+                """
+                INSERT INTO search_hits (url, day, hits) VALUES (?, ?, ?)
+                ON CONFLICT (url, day) DO UPDATE SET hits = hits + excluded.hits
+                """,
+                rows
+            )
+
+    def hits(self, days=30):
+        """
+        Devuelve las búsquedas de cada producto en los últimos `days` días y borra los días anteriores.
+
+        Args:
+            days (int): Días de la ventana de popularidad.
+
+        Returns:
+            dict: Búsquedas por URL.
+        """
+        since = (date.today() - timedelta(days=days)).isoformat()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM search_hits WHERE day < ?", (since, ))
+            rows = conn.execute("SELECT url, sum(hits) FROM search_hits GROUP BY url")
+            return dict(rows.fetchall())
+
+
+class SearchPopularityRecorder(localstore.BackgroundWriter):
+    """
+    Registra en segundo plano, en una SearchPopularity, los productos que devuelve /search.
+
+    `submit` no toca el disco ni espera: deja los productos de la búsqueda para el hilo de
+    BackgroundWriter, que suma las búsquedas que encuentre esperando y las escribe en una sola
+    transacción; si la cola en memoria está llena la búsqueda no se cuenta.
+    """
+
+    thread_name = "popularity-recorder"
+    error_message = "Could not record search popularity"
+
+    def __init__(self, popularity, max_buffered=1000):
+        """
+        Args:
+            popularity (SearchPopularity): Contador de búsquedas.
+            max_buffered (int): Máximo de búsquedas en memoria esperando al hilo.
+        """
+        super().__init__(max_buffered)
+        self.popularity = popularity
+
+    def submit(self, urls):
+        """
+        Cuenta, sin esperar, una búsqueda para cada producto devuelto.
+
+        Args:
+            urls (iterable): URLs de los productos devueltos por una búsqueda.
+        """
+        urls = {url for url in urls if url}
+        if urls:
+            # Si el hilo no da abasto la popularidad es aproximada: se pierde esta búsqueda
+            self.put(urls)
+
+    def write(self, searches):
+        hits = Counter()
+        for urls in searches:
+            hits.update(urls)
+        self.popularity.add_hits(hits)
+
+
+class FreshnessRecrawlMixin:
+    """
+    Recorrido por frescura y actualización de los productos ya conocidos.
+
+    En modo DISCOVERY_FRESHNESS la spider no descubre productos: lee de public.medicines los
+    productos de su farmacia, los ordena con freshness_score (días sin rastrear, tasa de cambio
+    en price_history y búsquedas en /search) y los envía directamente a `parse_item`, los más
+    urgentes primero y con mayor prioridad de Scrapy. FRESHNESS_MAX_REQUESTS limita cuántos se
+    piden (los de mayor puntaje) y `app_scraper.py --time-budget` limita la duración; lo que no
+    alcanza a rastrearse es lo menos urgente, y se vuelve a ordenar en la siguiente ejecución.
+
+    Si la farmacia todavía no tiene productos guardados se vuelve a `link_requests()`.
+
+    En modo DISCOVERY_REFRESH (`app_scraper.py --refresh`) se piden todos los productos de la
+    farmacia, sin puntaje: las URLs se leen de a poco con un cursor del lado del servidor a medida
+    que Scrapy consume las solicitudes iniciales, así que nunca están todas en memoria. Si se
+    indica REFRESH_URLS_FILE (`--urls-file`) solo se piden los productos de la farmacia listados
+    en ese archivo.
+
+    En ambos modos, un producto que responde 404 o 410 envía la señal `product_gone`.
+
+    Las clases que lo usan deben heredar también de SitemapDiscoveryMixin y definir `pharma` y `parse_item`.
+    """
+
+    def start_requests(self):
+        """
+        Inicia el rastreo según el modo de descubrimiento; en modo DISCOVERY_FRESHNESS pide los productos conocidos.
+        """
+        mode = self.discovery_mode()
+        if mode == DISCOVERY_FRESHNESS:
+            yield from self.freshness_requests()
+        elif mode == DISCOVERY_REFRESH:
+            yield from self.refresh_requests()
+        else:
+            yield from super().start_requests()
+
+    def freshness_candidates(self):
+        """
+        Lee los productos de la farmacia y calcula su puntaje.
+
+        Returns:
+            list: (puntaje, url) de los productos de esta parte (ver `in_shard`), del más urgente al menos urgente.
+        """
+        settings = self.settings
+        popularity = SearchPopularity(settings.get("SEARCH_POPULARITY_PATH", "temp/search_popularity.sqlite3"))
+        hits = popularity.hits(settings.getint("FRESHNESS_POPULARITY_DAYS", 30))
+        prior_changes = settings.getfloat("FRESHNESS_PRIOR_CHANGES", 1.0)
+        prior_days = settings.getfloat("FRESHNESS_PRIOR_DAYS", 30.0)
+        popularity_weight = settings.getfloat("FRESHNESS_POPULARITY_WEIGHT", 0.5)
+
+        started = time.monotonic()
+        connection = psycopg2.connect(**connection_params())
+        try:
+            with connection.cursor(name="freshness_candidates") as cursor:
+                cursor.itersize = 10000
+                cursor.execute(FRESHNESS_QUERY, (self.pharma, ))
+                candidates = [
+                    (freshness_score(stale_days, changes, float(observed_days), hits.get(url, 0), prior_changes, prior_days, popularity_weight), url)
+                    for url, stale_days, changes, observed_days in cursor
+                    if self.in_shard(url)
+                ]
+        finally:
+            connection.close()
+
+        candidates.sort(reverse=True)
+        logging.info(f"Scored {len(candidates)} known products of {self.pharma} in {time.monotonic() - started:.1f}s")
+        return candidates
+
+    def freshness_requests(self):
+        """
+        Solicitudes del modo DISCOVERY_FRESHNESS: los productos conocidos con mayor puntaje, cada uno con su prioridad.
+        """
+        candidates = self.freshness_candidates()
+        if not candidates:
+            logging.warning(f"No known products of {self.pharma}, falling back to link following")
+            self.crawler.stats.set_value("discovery/fallback", True)
+            yield from self.link_requests()
+            return
+
+        budget = self.settings.getint("FRESHNESS_MAX_REQUESTS", 0)
+        if budget:
+            # El presupuesto es de la spider completa: cada parte pide su proporción
+            candidates = candidates[:math.ceil(budget / self.shard_spec()[1])]
+
+        stats = self.crawler.stats
+        stats.set_value("freshness/scheduled", len(candidates))
+        stats.set_value("freshness/top_score", round(candidates[0][0], 4))
+        stats.set_value("freshness/min_score", round(candidates[-1][0], 4))
+
+        # Pocos niveles de prioridad: con JOBDIR Scrapy guarda una cola en disco por cada prioridad distinta
+        levels = max(self.settings.getint("FRESHNESS_PRIORITY_LEVELS", 10), 1)
+        for position, (score, url) in enumerate(candidates):
+            yield self._known_product_request(
+                url,
+                priority=levels - 1 - position * levels // len(candidates),
+                meta={"freshness_score": score}
+            )
+
+    def refresh_requests(self):
+        """
+        Solicitudes del modo DISCOVERY_REFRESH: todos los productos conocidos de esta parte (ver `in_shard`).
+        """
+        stats = self.crawler.stats
+        for url in self._refresh_urls():
+            if self.in_shard(url):
+                stats.inc_value("refresh/urls")
+                yield self._known_product_request(url)
+
+        if not stats.get_value("refresh/urls"):
+            logging.warning(f"No known products of {self.pharma} to refresh")
+
+    def _refresh_urls(self):
+        urls_file = self.settings.get("REFRESH_URLS_FILE")
+        if urls_file:
+            # Una línea JSON por producto: {"url": ..., "pharma": ...} (lo escribe scraper_daemon.py)
+            with open(urls_file) as f:
+                for line in f:
+                    product = json.loads(line)
+                    if product["pharma"] == self.pharma:
+                        yield product["url"]
+            return
+
+        connection = psycopg2.connect(**connection_params())
+        try:
+            with connection.cursor(name="refresh_urls") as cursor:
+                cursor.itersize = self.settings.getint("REFRESH_FETCH_SIZE", 2000)
+                cursor.execute(REFRESH_QUERY, (self.pharma, ))
+                for url, in cursor:
+                    yield url
+        finally:
+            connection.close()
+
+    def _known_product_request(self, url, priority=0, meta=None):
+        return scrapy.Request(url, callback=self.parse_item, errback=self.known_product_failed, priority=priority, meta=meta)
+
+    def known_product_failed(self, failure):
+        """
+        Maneja un producto conocido que no se pudo rastrear; si la tienda lo retiró, envía la señal `product_gone`.
+
+        Args:
+            failure (twisted.python.failure.Failure): El error de la solicitud.
+        """
+        url = failure.request.url
+        if failure.check(HttpError) and failure.value.response.status in GONE_STATUSES:
+            self.crawler.stats.inc_value("refresh/gone")
+            self.crawler.signals.send_catch_log(product_gone, url=url, spider=self)
+            return
+        if failure.check(IgnoreRequest):
+            # Descartada a propósito (por ejemplo, una página sin cambios o un error HTTP ya registrado)
+            return
+        logging.warning(f"Could not refresh {url}: {failure.getErrorMessage()}")
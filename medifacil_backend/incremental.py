@@ -0,0 +1,210 @@
+import gzip
+import hashlib
+import logging
+import os
+import time
+
+from medifacil_backend import localstore
+
+
+# Señal que se envía cuando una página de producto no cambió desde la ejecución anterior.
+# PostgresPipeline la usa para marcar el producto como visto sin volver a procesarlo.
+page_unchanged = object()
+
+# Tipos de página que aprende IncrementalSpiderMiddleware según lo que produce el callback
+KIND_ITEM = "item"
+KIND_PAGE = "page"
+
+
+class IncrementalStore:
+    """
+    Estado local del modo incremental: validadores HTTP (ETag / Last-Modified), hash del cuerpo
+    y tipo de página por cada URL, y el cuerpo comprimido de las páginas de listado.
+
+    Los metadatos se guardan en un archivo SQLite y los cuerpos en archivos .gz dentro de
+    INCREMENTAL_CACHE_DIR. El directorio se mantiene acotado: al cerrar el spider se eliminan
+    las entradas y los cuerpos menos usados que superen INCREMENTAL_CACHE_MAX_ENTRIES y
+    INCREMENTAL_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self, directory, max_entries=200000, max_bytes=200 * 1024 * 1024):
+        """
+        Args:
+            directory (str): Directorio del estado incremental.
+            max_entries (int): Máximo de URLs recordadas.
+            max_bytes (int): Máximo de bytes de cuerpos comprimidos guardados.
+        """
+        self.directory = directory
+        self.bodies_dir = os.path.join(directory, "bodies")
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        os.makedirs(self.bodies_dir, exist_ok=True)
+
+        self.conn = localstore.connect(os.path.join(directory, "index.sqlite3"))
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                fingerprint TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                body_hash TEXT,
+                content_type TEXT,
+                kind TEXT,
+                body_size INTEGER NOT NULL DEFAULT 0,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_accessed_at ON pages (accessed_at)")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Devuelve el store del crawler, compartido por los middlewares de descarga y de spider.
+
+        Returns:
+            IncrementalStore: Store del crawler.
+        """
+        store = getattr(crawler, "incremental_store", None)
+        if store is None:
+            settings = crawler.settings
+            store = cls(
+                settings.get("INCREMENTAL_CACHE_DIR", "temp/incremental"),
+                max_entries=settings.getint("INCREMENTAL_CACHE_MAX_ENTRIES", 200000),
+                max_bytes=settings.getint("INCREMENTAL_CACHE_MAX_BYTES", 200 * 1024 * 1024)
+            )
+            crawler.incremental_store = store
+        return store
+
+    def _body_path(self, fingerprint):
+        return os.path.join(self.bodies_dir, f"{fingerprint}.gz")
+
+    def get(self, fingerprint):
+        """
+        Busca el estado guardado de una URL.
+
+        Args:
+            fingerprint (str): Huella de la solicitud.
+
+        Returns:
+            dict: Estado de la URL o None si no se conoce.
+        """
+        row = self.conn.execute(
+            """
+            SELECT etag, last_modified, body_hash, content_type, kind, body_size
+            FROM pages WHERE fingerprint = ?
+            """,
+            (fingerprint, )
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("etag", "last_modified", "body_hash", "content_type", "kind", "body_size"), row))
+
+    def save_response(self, fingerprint, url, etag, last_modified, body_hash, content_type):
+        """
+        Guarda los validadores y el hash del cuerpo de una respuesta 200.
+        """
+        self.conn.execute(
+            """
+            INSERT INTO pages (fingerprint, url, etag, last_modified, body_hash, content_type, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (fingerprint) DO UPDATE SET
+                url = excluded.url,
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                body_hash = excluded.body_hash,
+                content_type = excluded.content_type,
+                accessed_at = excluded.accessed_at
+            """,
+            (fingerprint, url, etag, last_modified, body_hash, content_type, time.time())
+        )
+
+    def touch(self, fingerprint):
+        self.conn.execute("UPDATE pages SET accessed_at = ? WHERE fingerprint = ?", (time.time(), fingerprint))
+
+    def set_kind(self, fingerprint, kind, body=None):
+        """
+        Registra el tipo de una página. Para las páginas de listado guarda el cuerpo comprimido,
+        para poder volver a extraer sus enlaces cuando el servidor responde 304.
+
+        Args:
+            fingerprint (str): Huella de la solicitud.
+            kind (str): KIND_ITEM o KIND_PAGE.
+            body (bytes): Cuerpo de la respuesta (solo se usa con KIND_PAGE).
+        """
+        body_size = 0
+        path = self._body_path(fingerprint)
+        if kind == KIND_PAGE and body is not None:
+            with open(path, "wb") as f:
+                f.write(gzip.compress(body))
+            body_size = os.path.getsize(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+        self.conn.execute(
+            "UPDATE pages SET kind = ?, body_size = ? WHERE fingerprint = ?",
+            (kind, body_size, fingerprint)
+        )
+
+    def load_body(self, fingerprint):
+        """
+        Devuelve el cuerpo guardado de una página de listado.
+
+        Returns:
+            bytes: Cuerpo descomprimido o None si no está guardado.
+        """
+        try:
+            with open(self._body_path(fingerprint), "rb") as f:
+                return gzip.decompress(f.read())
+        except (OSError, EOFError):
+            return None
+
+    def evict(self):
+        """
+        Elimina las entradas y cuerpos menos usados que superen los límites configurados.
+        """
+        stale = self.conn.execute(
+            "SELECT fingerprint FROM pages ORDER BY accessed_at DESC LIMIT -1 OFFSET ?",
+            (self.max_entries, )
+        ).fetchall()
+
+        # Cuerpos que exceden el límite de bytes, empezando por los menos usados
+        total = 0
+        oversized = []
+        for fingerprint, body_size in self.conn.execute(
+            "SELECT fingerprint, body_size FROM pages WHERE body_size > 0 ORDER BY accessed_at DESC"
+        ):
+            total += body_size
+            if total > self.max_bytes:
+                oversized.append(fingerprint)
+
+        for (fingerprint, ) in stale:
+            self.conn.execute("DELETE FROM pages WHERE fingerprint = ?", (fingerprint, ))
+        for fingerprint in oversized + [fingerprint for (fingerprint, ) in stale]:
+            path = self._body_path(fingerprint)
+            if os.path.exists(path):
+                os.remove(path)
+        if oversized:
+            self.conn.executemany(
+                "UPDATE pages SET body_size = 0 WHERE fingerprint = ?", [(f, ) for f in oversized]
+            )
+
+        if stale or oversized:
+            logging.info(f"Incremental cache evicted {len(stale)} entries and {len(oversized)} bodies")
+
+    def close(self):
+        self.conn.close()
+
+
+def body_hash(body):
+    """
+    Calcula el hash del cuerpo de una respuesta.
+
+    Args:
+        body (bytes): Cuerpo de la respuesta.
+
+    Returns:
+        str: Hash hexadecimal.
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
@@ -24,6 +24,38 @@ def transform_price(text):
         print(f"Error al transformar precio: {error}")
     return price
 
+# Detecta presentaciones como "x100" o "30 unidades" en el nombre del producto
+PRESENTATION_PATTERN = re.compile(r'(.+?)(?:\s*x(\d+)|\s*(\d+)\s*(?:unidad?e?s?))(.+)', re.IGNORECASE)
+
+def parse_presentation(name, price):
+    """
+    Separa la cantidad de unidades del nombre de un medicamento y calcula su precio unitario.
+
+    Reemplaza los nombres que tienen 'x 100' o 'n unidades' para tratar de obtener su precio unitario.
+
+    Args:
+        name (str): Nombre del medicamento tal como aparece en la farmacia.
+        price (float): Precio del empaque completo.
+
+    Returns:
+        tuple: (base_name, pack_quantity, unit_price). Si el nombre no indica una cantidad,
+            devuelve el nombre original, 1 y el mismo precio.
+    """
+    match = PRESENTATION_PATTERN.search(name or '')
+    quantity = int(match.group(2) or match.group(3)) if match else 0
+
+    if quantity <= 0:
+        return name, 1, price
+
+    base_name = match.group(1).strip()
+    if match.group(4):
+        base_name = f"{base_name} unidad {match.groups()[-1]}".strip()
+    else:
+        base_name = f"{base_name} x1 {match.groups()[-1]}".strip()
+
+    unit_price = float(price) / quantity if price is not None else None
+    return base_name, quantity, unit_price
+
 class MedicineItem(scrapy.Item):
     """
     Define el esquema de un ítem de medicina para Scrapy.
@@ -36,6 +68,9 @@ class MedicineItem(scrapy.Item):
         url_image (scrapy.Field): URL de la imagen del producto.
         availability (scrapy.Field): Disponibilidad del producto.
         ingest_date (scrapy.Field): Fecha de ingesta de los datos.
+        base_name (scrapy.Field): Nombre sin la cantidad de unidades, calculado por el pipeline.
+        pack_quantity (scrapy.Field): Cantidad de unidades del empaque, calculada por el pipeline.
+        unit_price (scrapy.Field): Precio por unidad, calculado por el pipeline.
     """
     url = scrapy.Field()
     pharma = scrapy.Field()
@@ -48,6 +83,9 @@ class MedicineItem(scrapy.Item):
     url_image = scrapy.Field()
     availability = scrapy.Field()
     ingest_date = scrapy.Field()
+    base_name = scrapy.Field()
+    pack_quantity = scrapy.Field()
+    unit_price = scrapy.Field()
 
     def __str__(self):
         return ""
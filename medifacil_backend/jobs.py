@@ -0,0 +1,347 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from medifacil_backend import localstore
+
+
+# Estados de un trabajo de scraping
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_FINISHED = "finished"
+STATUS_FAILED = "failed"
+
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+# Estadísticas de Scrapy que cada proceso del scraper reporta como progreso de su trabajo
+PROGRESS_STATS = (
+    "item_scraped_count",
+    "response_received_count",
+    "log_count/ERROR",
+    "memusage/max",
+    "finish_reason",
+)
+
+
+def job_key(spiders, options):
+    """
+    Llave de un trabajo para detectar solicitudes idénticas: mismas spiders (sin importar el orden) y opciones.
+
+    Args:
+        spiders (list): Nombres de las spiders.
+        options (dict): Opciones del trabajo.
+
+    Returns:
+        str: Llave del trabajo.
+    """
+    return json.dumps([sorted(set(spiders)), options], sort_keys=True)
+
+
+class JobStore:
+    """
+    Cola de trabajos de scraping compartida entre los workers de gunicorn, el daemon del
+    scraper (scraper_daemon.py) y los procesos de app_scraper.py.
+
+    Los trabajos y el progreso que reporta cada proceso del scraper se guardan en un archivo
+    SQLite local. /scraper encola un trabajo y responde de inmediato; el daemon toma los
+    trabajos en orden de llegada y /scraper/<id> consulta su estado. Mientras un trabajo está
+    en cola o en ejecución, una solicitud idéntica devuelve ese mismo trabajo en vez de crear otro.
+    """
+
+    def __init__(self, path, logs_dir):
+        """
+        Args:
+            path (str): Ruta del archivo SQLite de la cola.
+            logs_dir (str): Directorio de los logs de cada trabajo.
+        """
+        self.path = path
+        self.logs_dir = logs_dir
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Crea el store con las rutas de las variables de entorno SCRAPER_JOBS_PATH y SCRAPER_JOBS_LOG_DIR.
+
+        Returns:
+            JobStore: Store de trabajos.
+        """
+        return cls(
+            os.environ.get("SCRAPER_JOBS_PATH", f"{os.getcwd()}/temp/scraper_jobs.sqlite3"),
+            os.environ.get("SCRAPER_JOBS_LOG_DIR", f"{os.getcwd()}/temp/scraper_logs")
+        )
+
+    def _connection(self):
+        pid = os.getpid()
+        if self._conn is None or self._pid != pid:
+            self._conn = localstore.connect(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS scrape_jobs (
+                    id TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    spiders TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    pid INTEGER,
+                    returncode INTEGER,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scrape_jobs_status ON scrape_jobs (status, created_at)")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS scrape_job_progress (
+                    job_id TEXT NOT NULL,
+                    worker TEXT NOT NULL,
+                    stats TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, worker)
+                )
+                """
+            )
+            self._pid = pid
+        return self._conn
+
+    def log_path(self, job_id):
+        """
+        Devuelve la ruta del log de un trabajo.
+        """
+        return os.path.join(self.logs_dir, f"{job_id}.log")
+
+    def enqueue(self, spiders, options=None):
+        """
+        Encola un trabajo, o devuelve el trabajo idéntico que ya está en cola o en ejecución.
+
+        Args:
+            spiders (list): Nombres de las spiders.
+            options (dict): Opciones de app_scraper.py (discovery, incremental, low_memory, refresh, max_requests, time_budget).
+
+        Returns:
+            tuple: (id del trabajo, True si se creó o False si ya existía).
+        """
+        options = options or {}
+        key = job_key(spiders, options)
+        with self._lock:
+            conn = self._connection()
+            # BEGIN IMMEDIATE toma el bloqueo de escritura: dos workers no pueden encolar el mismo trabajo a la vez
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT id FROM scrape_jobs WHERE key = ? AND status IN {ACTIVE_STATUSES} ORDER BY created_at LIMIT 1",
+                    (key, )
+                ).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    return row[0], False
+
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    """
+                    INSERT INTO scrape_jobs (id, key, spiders, options, status, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (job_id, key, json.dumps(list(spiders)), json.dumps(options), STATUS_QUEUED, time.time())
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        logging.info(f"Scrape job {job_id} queued: {spiders} {options}")
+        return job_id, True
+
+    def claim_next(self):
+        """
+        Toma el trabajo más antiguo de la cola y lo marca en ejecución.
+
+        Returns:
+            dict: El trabajo tomado, o None si la cola está vacía.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id FROM scrape_jobs WHERE status = ? ORDER BY created_at LIMIT 1", (STATUS_QUEUED, )
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE scrape_jobs SET status = ?, attempts = attempts + 1, started_at = ? WHERE id = ?",
+                        (STATUS_RUNNING, time.time(), row[0])
+                    )
+                    conn.execute("DELETE FROM scrape_job_progress WHERE job_id = ?", (row[0], ))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def set_pid(self, job_id, pid):
+        """
+        Guarda el pid del proceso de app_scraper.py que ejecuta el trabajo.
+        """
+        with self._lock:
+            self._connection().execute("UPDATE scrape_jobs SET pid = ? WHERE id = ?", (pid, job_id))
+
+    def finish(self, job_id, returncode, error=None):
+        """
+        Marca un trabajo como terminado según el código de salida de app_scraper.py.
+
+        Args:
+            job_id (str): Id del trabajo.
+            returncode (int): Código de salida del scraper.
+            error (str): Descripción del error, si el scraper no se pudo ejecutar.
+        """
+        status = STATUS_FINISHED if returncode == 0 and error is None else STATUS_FAILED
+        with self._lock:
+            self._connection().execute(
+                "UPDATE scrape_jobs SET status = ?, returncode = ?, error = ?, pid = NULL, finished_at = ? WHERE id = ?",
+                (status, returncode, error, time.time(), job_id)
+            )
+        logging.info(f"Scrape job {job_id} {status} (returncode {returncode})")
+
+    def requeue(self, job_id):
+        """
+        Devuelve a la cola un trabajo interrumpido; al reanudarse, cada spider continúa desde su JOBDIR.
+        """
+        with self._lock:
+            self._connection().execute(
+                "UPDATE scrape_jobs SET status = ?, pid = NULL, started_at = NULL WHERE id = ?",
+                (STATUS_QUEUED, job_id)
+            )
+
+    def recover(self, max_attempts=3):
+        """
+        Recupera los trabajos que quedaron en ejecución cuando el daemon se detuvo.
+
+        Vuelven a la cola, salvo los que ya se intentaron `max_attempts` veces, que se marcan como fallidos.
+
+        Args:
+            max_attempts (int): Máximo de intentos por trabajo.
+
+        Returns:
+            int: Trabajos recuperados.
+        """
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT id, attempts FROM scrape_jobs WHERE status = ?", (STATUS_RUNNING, )
+            ).fetchall()
+        for job_id, attempts in rows:
+            if attempts >= max_attempts:
+                self.finish(job_id, None, error=f"Interrupted {attempts} times")
+            else:
+                logging.warning(f"Scrape job {job_id} was interrupted, queued again")
+                self.requeue(job_id)
+        return len(rows)
+
+    def report_progress(self, job_id, worker, stats):
+        """
+        Guarda el progreso de un proceso del scraper (una spider o una parte de una spider).
+
+        Args:
+            job_id (str): Id del trabajo.
+            worker (str): Nombre del proceso, por ejemplo "CrawlMedicity" o "CrawlMedicity 1/4".
+            stats (dict): Estadísticas de Scrapy del proceso.
+        """
+        progress = {name: stats[name] for name in PROGRESS_STATS if name in stats}
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO scrape_job_progress (job_id, worker, stats, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, worker, json.dumps(progress, default=str), time.time())
+            )
+
+    def get(self, job_id, log_lines=0):
+        """
+        Devuelve un trabajo con su progreso.
+
+        Args:
+            job_id (str): Id del trabajo.
+            log_lines (int): Últimas líneas del log a incluir.
+
+        Returns:
+            dict: El trabajo, o None si no existe.
+        """
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                """
+                SELECT id, spiders, options, status, attempts, returncode, error, created_at, started_at, finished_at
+                FROM scrape_jobs WHERE id = ?
+                """,
+                (job_id, )
+            ).fetchone()
+            if row is None:
+                return None
+            progress_rows = conn.execute(
+                "SELECT worker, stats, updated_at FROM scrape_job_progress WHERE job_id = ? ORDER BY worker",
+                (job_id, )
+            ).fetchall()
+
+        workers = {worker: dict(json.loads(stats), updated_at=updated_at) for worker, stats, updated_at in progress_rows}
+        job = {
+            "id": row[0],
+            "spiders": json.loads(row[1]),
+            "options": json.loads(row[2]),
+            "status": row[3],
+            "attempts": row[4],
+            "returncode": row[5],
+            "error": row[6],
+            "created_at": row[7],
+            "started_at": row[8],
+            "finished_at": row[9],
+            "items": sum(stats.get("item_scraped_count", 0) for stats in workers.values()),
+            "responses": sum(stats.get("response_received_count", 0) for stats in workers.values()),
+            "errors": sum(stats.get("log_count/ERROR", 0) for stats in workers.values()),
+            "workers": workers,
+        }
+        if log_lines:
+            job["log"] = self.tail_log(job_id, log_lines)
+        return job
+
+    def tail_log(self, job_id, lines):
+        """
+        Devuelve las últimas líneas del log de un trabajo.
+
+        Returns:
+            list: Líneas del log (vacía si todavía no existe).
+        """
+        try:
+            with open(self.log_path(job_id), errors="replace") as f:
+                return [line.rstrip("\n") for line in deque(f, maxlen=lines)]
+        except FileNotFoundError:
+            return []
+
+    def prune(self, retention):
+        """
+        Elimina los trabajos terminados hace más de `retention` segundos y sus logs.
+
+        Returns:
+            int: Trabajos eliminados.
+        """
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                f"SELECT id FROM scrape_jobs WHERE status NOT IN {ACTIVE_STATUSES} AND finished_at < ?",
+                (time.time() - retention, )
+            ).fetchall()
+            for (job_id, ) in rows:
+                conn.execute("DELETE FROM scrape_job_progress WHERE job_id = ?", (job_id, ))
+                conn.execute("DELETE FROM scrape_jobs WHERE id = ?", (job_id, ))
+        for (job_id, ) in rows:
+            try:
+                os.remove(self.log_path(job_id))
+            except FileNotFoundError:
+                pass
+        return len(rows)
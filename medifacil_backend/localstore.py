@@ -0,0 +1,106 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+
+
+def connect(path, timeout=5.0):
+    """
+    Abre una base SQLite local compartida entre procesos del mismo servidor.
+
+    Se usa modo WAL para que varios lectores (por ejemplo, los workers de gunicorn) no se
+    bloqueen entre sí mientras otro proceso escribe.
+
+    Args:
+        path (str): Ruta del archivo SQLite. El directorio se crea si no existe.
+        timeout (float): Segundos de espera cuando otro proceso tiene la base bloqueada.
+
+    Returns:
+        sqlite3.Connection: Conexión en modo autocommit.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class BackgroundWriter:
+    """
+    Escritura en segundo plano en una base local, sin hacer esperar al que la pide.
+
+    `put` no toca el disco ni espera: deja la entrada en una cola en memoria acotada y, si la
+    cola está llena, la descarta. Un hilo por proceso (se crea en el primer uso, también después
+    de un fork de gunicorn) junta las entradas que encuentre esperando, hasta `max_batch`, y las
+    pasa juntas a `write`, que las subclases implementan.
+    """
+
+    # Nombre del hilo y mensaje cuando un lote no se puede escribir
+    thread_name = "background-writer"
+    error_message = "Could not write in the background"
+
+    # Entradas que se escriben juntas como máximo
+    max_batch = 500
+
+    def __init__(self, max_buffered=1000):
+        """
+        Args:
+            max_buffered (int): Máximo de entradas en memoria esperando al hilo.
+        """
+        self.max_buffered = int(max_buffered)
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def _buffer(self):
+        pid = os.getpid()
+        if self._queue is None or self._pid != pid:
+            with self._lock:
+                if self._queue is None or self._pid != pid:
+                    self._queue = queue.Queue(maxsize=self.max_buffered)
+                    threading.Thread(target=self._run, args=(self._queue, ), name=self.thread_name, daemon=True).start()
+                    self._pid = pid
+        return self._queue
+
+    def put(self, entry):
+        """
+        Deja una entrada para el hilo, sin esperar.
+
+        Args:
+            entry: Entrada a escribir.
+
+        Returns:
+            bool: False si la cola estaba llena y la entrada se descartó.
+        """
+        try:
+            self._buffer().put_nowait(entry)
+        except queue.Full:
+            return False
+        return True
+
+    def write(self, entries):
+        """
+        Escribe un lote de entradas; se llama desde el hilo.
+
+        Args:
+            entries (list): Entradas en orden de llegada.
+        """
+        raise NotImplementedError
+
+    def _run(self, buffer):
+        while True:
+            entries = [buffer.get()]
+            # Junta lo que ya esté esperando para escribirlo en una sola transacción
+            while len(entries) < self.max_batch:
+                try:
+                    entries.append(buffer.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(entries)
+            except Exception as e:
+                logging.warning(f"{self.error_message}: {e}")
@@ -3,57 +3,143 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import re
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers, Request
+from scrapy.linkextractors import IGNORED_EXTENSIONS
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.url import url_has_any_extension
+from w3lib.url import canonicalize_url, url_query_cleaner
 
 # useful for handling different item types with a single interface
-from itemadapter import is_item, ItemAdapter
+from itemadapter import is_item
+
+from medifacil_backend.incremental import (
+    KIND_ITEM,
+    KIND_PAGE,
+    IncrementalStore,
+    body_hash,
+    page_unchanged,
+)
 
 
 class MedifacilBackendSpiderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the spider middleware does not modify the
-    # passed objects.
+    """
+    Canonicaliza y filtra las URLs que producen las spiders antes de que lleguen al scheduler.
+
+    Para cada solicitud de seguimiento de enlaces (sin callback, con parse_page o de las reglas de CrawlSpider):
+    - canonicaliza la URL (orden de parámetros, fragmentos, escapes) y quita los parámetros de
+      URL_IGNORED_QUERY_PARAMS y del atributo `ignored_query_params` de la spider;
+    - descarta los enlaces fuera de `allowed_domains`, los archivos (imágenes, PDF, etc.), los
+      que no coinciden con `item_url_pattern` ni `page_url_pattern` de la spider, y los repetidos
+      dentro de la misma respuesta;
+    - con `-a shard=i/n`, descarta los enlaces a productos de las demás partes (ver `in_shard` en
+      SitemapDiscoveryMixin): en modo enlaces cada parte recorre todos los listados.
+
+    Las solicitudes con otros callbacks (productos de sitemaps o de la base de datos, API de
+    catálogo) y las solicitudes iniciales no se modifican. Los descartes se cuentan en las estadísticas `urlfilter/dropped/<motivo>`.
+    Se desactiva con URL_FILTER_ENABLED = False.
+    """
+
+    # Callbacks de seguimiento de enlaces (CrawlSpider usa _parse y _callback para sus reglas)
+    FILTERED_CALLBACKS = ("parse", "_parse", "_callback", "parse_page")
+
+    # Extensiones de archivos que no son páginas, con el punto: url_has_any_extension compara el final de la ruta
+    IGNORED_EXTENSIONS = tuple(f".{extension}" for extension in IGNORED_EXTENSIONS)
+
+    def __init__(self, stats, ignored_query_params):
+        self.stats = stats
+        self.ignored_query_params = tuple(ignored_query_params)
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        if not crawler.settings.getbool("URL_FILTER_ENABLED", True):
+            raise NotConfigured
+        s = cls(crawler.stats, crawler.settings.getlist("URL_IGNORED_QUERY_PARAMS"))
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
-    def process_spider_input(self, response, spider):
-        # Called for each response that goes through the spider
-        # middleware and into the spider.
+    def spider_opened(self, spider):
+        self.ignored_params = self.ignored_query_params + tuple(getattr(spider, "ignored_query_params", ()))
+        self.allowed_domains = [d.lower() for d in getattr(spider, "allowed_domains", None) or [] if d]
+        self.url_patterns = [
+            re.compile(pattern)
+            for pattern in (getattr(spider, "item_url_pattern", None), getattr(spider, "page_url_pattern", None))
+            if pattern
+        ]
+        item_url_pattern = getattr(spider, "item_url_pattern", None)
+        self.item_url_regex = re.compile(item_url_pattern) if item_url_pattern else None
+        self.in_shard = getattr(spider, "in_shard", None)
+        spider.logger.info("Spider opened: %s" % spider.name)
 
-        # Should return None or raise an exception.
-        return None
+    def canonicalize(self, url):
+        """
+        Devuelve la forma canónica de una URL, sin los parámetros ignorados.
 
-    def process_spider_output(self, response, result, spider):
-        # Called with the results returned from the Spider, after
-        # it has processed the response.
+        Args:
+            url (str): URL a canonicalizar.
 
-        # Must return an iterable of Request, or item objects.
-        for i in result:
-            yield i
+        Returns:
+            str: URL canónica.
+        """
+        if self.ignored_params:
+            url = url_query_cleaner(url, self.ignored_params, remove=True, keep_fragments=True)
+        return canonicalize_url(url)
 
-    def process_spider_exception(self, response, exception, spider):
-        # Called when a spider or process_spider_input() method
-        # (from other spider middleware) raises an exception.
+    def _drop_reason(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        if self.allowed_domains and not any(host == d or host.endswith(f".{d}") for d in self.allowed_domains):
+            return "offsite"
+        if url_has_any_extension(url, self.IGNORED_EXTENSIONS):
+            return "asset"
+        # Los patrones describen la forma de la ruta; las variantes de parámetros ya se normalizaron
+        path = url.split("?", 1)[0]
+        if self.url_patterns and not any(pattern.match(path) for pattern in self.url_patterns):
+            return "pattern"
+        if self.in_shard and self.item_url_regex and self.item_url_regex.match(path) and not self.in_shard(url):
+            return "shard"
+        return None
 
-        # Should return either None or an iterable of Request or item objects.
-        pass
+    def _filters(self, request):
+        callback = request.callback
+        return not request.dont_filter and (
+            callback is None or getattr(callback, "__name__", None) in self.FILTERED_CALLBACKS
+        )
 
-    def process_start_requests(self, start_requests, spider):
-        # Called with the start requests of the spider, and works
-        # similarly to the process_spider_output() method, except
-        # that it doesn’t have a response associated.
+    def process_spider_output(self, response, result, spider):
+        seen = set()
+        for i in result:
+            if not isinstance(i, Request) or not self._filters(i):
+                yield i
+                continue
 
-        # Must return only requests (not items).
-        for r in start_requests:
-            yield r
+            url = self.canonicalize(i.url)
+            reason = "duplicate" if url in seen else self._drop_reason(url)
+            if reason is not None:
+                self.stats.inc_value("urlfilter/dropped", spider=spider)
+                self.stats.inc_value(f"urlfilter/dropped/{reason}", spider=spider)
+                continue
 
-    def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+            seen.add(url)
+            if url != i.url:
+                self.stats.inc_value("urlfilter/canonicalized", spider=spider)
+                i = i.replace(url=url)
+            yield i
+
+    def spider_closed(self, spider):
+        dropped = {
+            key.rsplit("/", 1)[-1]: value
+            for key, value in self.stats.get_stats(spider).items()
+            if key.startswith("urlfilter/dropped/")
+        }
+        if dropped:
+            spider.logger.info(f"URL filter dropped {sum(dropped.values())} requests: {dropped}")
 
 
 class MedifacilBackendDownloaderMiddleware:
@@ -101,3 +187,417 @@ class MedifacilBackendDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class IncrementalDownloaderMiddleware:
+    """
+    Modo de rastreo incremental: envía solicitudes condicionales (If-None-Match / If-Modified-Since)
+    con los validadores guardados de la ejecución anterior y detecta las páginas sin cambios.
+
+    Una página se considera sin cambios si el servidor responde 304 o si el hash del cuerpo
+    es igual al guardado (para servidores que no envían validadores). Las páginas de producto
+    sin cambios se descartan antes de llegar al spider, así que no se analizan ni se escriben;
+    solo se avisa al pipeline (señal page_unchanged) para que las marque como vistas. Las
+    páginas de listado sin cambios se sirven desde el cuerpo guardado para seguir sus enlaces.
+
+    Se activa con INCREMENTAL_CRAWL_ENABLED = True.
+    """
+
+    CONDITIONAL_HEADERS = (b"If-None-Match", b"If-Modified-Since")
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.store = IncrementalStore.from_crawler(crawler)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_CRAWL_ENABLED"):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def _fingerprint(self, request):
+        return self.crawler.request_fingerprinter.fingerprint(request).hex()
+
+    def _applies(self, request):
+        return request.method == "GET" and not request.meta.get("incremental_skip")
+
+    def process_request(self, request, spider):
+        if not self._applies(request):
+            return None
+
+        entry = self.store.get(self._fingerprint(request))
+        if entry is None:
+            return None
+
+        request.meta["incremental_entry"] = entry
+        if entry["etag"] and b"If-None-Match" not in request.headers:
+            request.headers[b"If-None-Match"] = entry["etag"]
+        if entry["last_modified"] and b"If-Modified-Since" not in request.headers:
+            request.headers[b"If-Modified-Since"] = entry["last_modified"]
+        return None
+
+    def process_response(self, request, response, spider):
+        if not self._applies(request):
+            return response
+
+        fingerprint = self._fingerprint(request)
+        entry = request.meta.get("incremental_entry")
+        if response.status == 304 and entry is not None:
+            return self._unchanged(request, response, fingerprint, entry, spider)
+
+        if response.status != 200:
+            return response
+
+        digest = body_hash(response.body)
+        headers = response.headers.to_unicode_dict()
+        self.store.save_response(
+            fingerprint,
+            response.url,
+            headers.get("ETag"),
+            headers.get("Last-Modified"),
+            digest,
+            headers.get("Content-Type")
+        )
+
+        if entry is not None and entry["body_hash"] == digest:
+            return self._unchanged(request, response, fingerprint, entry, spider)
+
+        self.stats.inc_value("incremental/changed" if entry is not None else "incremental/new", spider=spider)
+        return response
+
+    def _unchanged(self, request, response, fingerprint, entry, spider):
+        """
+        Resuelve una página sin cambios según su tipo.
+
+        Returns:
+            scrapy.http.Response | scrapy.Request: La respuesta a analizar o la solicitud a repetir.
+
+        Raises:
+            IgnoreRequest: Si es una página de producto, que no necesita analizarse otra vez.
+        """
+        self.stats.inc_value("incremental/unchanged", spider=spider)
+        self.store.touch(fingerprint)
+
+        if entry["kind"] == KIND_ITEM:
+            self.crawler.signals.send_catch_log(signal=page_unchanged, url=request.url, spider=spider)
+            raise IgnoreRequest(f"Unchanged page: {request.url}")
+
+        if response.status == 200:
+            return response
+
+        body = self.store.load_body(fingerprint)
+        if body is None:
+            # No hay cuerpo guardado de este listado: se descarga completo, sin validadores
+            headers = request.headers.copy()
+            for header in self.CONDITIONAL_HEADERS:
+                headers.pop(header, None)
+            return request.replace(
+                headers=headers,
+                meta={**request.meta, "incremental_skip": True},
+                dont_filter=True
+            )
+
+        headers = Headers({"Content-Type": entry["content_type"] or "text/html"})
+        response_cls = responsetypes.from_args(headers=headers, url=request.url, body=body)
+        return response_cls(
+            url=request.url,
+            status=200,
+            headers=headers,
+            body=body,
+            request=request,
+            flags=["incremental"]
+        )
+
+    def spider_closed(self, spider):
+        unchanged = self.stats.get_value("incremental/unchanged", 0, spider=spider)
+        total = unchanged + self.stats.get_value("incremental/changed", 0, spider=spider) + \
+            self.stats.get_value("incremental/new", 0, spider=spider)
+        ratio = unchanged / total if total else 0.0
+        self.stats.set_value("incremental/unchanged_ratio", round(ratio, 4), spider=spider)
+        spider.logger.info(f"Incremental crawl: {unchanged} of {total} pages unchanged ({ratio:.1%})")
+
+        self.store.evict()
+        self.store.close()
+
+
+class IncrementalSpiderMiddleware:
+    """
+    Complemento de IncrementalDownloaderMiddleware: aprende si cada URL es una página de producto
+    (su callback produjo items) o de listado, y guarda el cuerpo de los listados para poder
+    reutilizarlo cuando el servidor responda 304.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.store = IncrementalStore.from_crawler(crawler)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_CRAWL_ENABLED"):
+            raise NotConfigured
+        return cls(crawler)
+
+    def process_spider_output(self, response, result, spider):
+        produced_item = False
+        for i in result:
+            if is_item(i):
+                produced_item = True
+            yield i
+
+        # Los listados servidos desde el cuerpo guardado ya están clasificados
+        if response.status != 200 or "incremental" in response.flags or response.request.method != "GET":
+            return
+
+        fingerprint = self.crawler.request_fingerprinter.fingerprint(response.request).hex()
+        if produced_item:
+            self.store.set_kind(fingerprint, KIND_ITEM)
+        else:
+            self.store.set_kind(fingerprint, KIND_PAGE, response.body)
+
+
+class DuplicateListingMiddleware:
+    """
+    Corta las cadenas de paginación de los listados que repiten productos ya vistos.
+
+    Recuerda en qué listado y página apareció primero cada enlace de producto. Por cada página de
+    listado (callback `parse_listing`, ver AdaptivePaginationMixin) mide qué parte de sus
+    productos ya había aparecido, en otro listado o en páginas anteriores del mismo. Si la página
+    no trae productos nuevos, o la parte repetida llega a DUPLICATE_LISTING_OVERLAP, no se pide su
+    página siguiente: el listado es una variante de uno ya recorrido (por ejemplo el mismo
+    listado con otro `?order=`), o la tienda corre los productos de una página a otra sin fin.
+
+    Los productos de una cadena cortada pasan al siguiente listado que los traiga, para que dos
+    variantes del mismo listado no se corten entre sí antes de que una llegue al final.
+
+    Al cerrar la spider estima las solicitudes ahorradas: cada cadena cortada habría recorrido
+    tantas páginas como le quedaban al listado que repetía.
+    """
+
+    def __init__(self, stats, overlap=0.9):
+        """
+        Args:
+            stats (scrapy.statscollectors.StatsCollector): Estadísticas del rastreo.
+            overlap (float): Parte de productos ya vistos a partir de la cual se corta la cadena.
+        """
+        self.stats = stats
+        self.overlap = float(overlap)
+        self.products = {}  # Producto -> (listado, página) donde apareció primero
+        self.last_pages = {}  # Última página recibida de cada listado
+        self.stopped_listings = set()
+        self.stopped = []  # (listado cortado, listado repetido, página repetida) por cada cadena cortada
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("DUPLICATE_LISTING_ENABLED"):
+            raise NotConfigured
+        s = cls(crawler.stats, crawler.settings.getfloat("DUPLICATE_LISTING_OVERLAP", 0.9))
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def _is_chain(self, request, listing):
+        return getattr(request.callback, "__name__", None) == "parse_listing" and request.cb_kwargs.get("listing") == listing
+
+    def process_spider_output(self, response, result, spider):
+        request = response.request
+        listing = request.cb_kwargs.get("listing")
+        if getattr(request.callback, "__name__", None) != "parse_listing" or listing is None:
+            yield from result
+            return
+
+        page = request.cb_kwargs.get("page", 1)
+        self.last_pages[listing] = max(self.last_pages.get(listing, 0), page)
+        item_regex = re.compile(spider.item_url_pattern)
+        products = set()
+        chain = []
+        for i in result:
+            if isinstance(i, Request):
+                # La página siguiente se retiene hasta conocer todos los productos de esta
+                if self._is_chain(i, listing):
+                    chain.append(i)
+                    continue
+                if item_regex.match(i.url.split("?", 1)[0]):
+                    products.add(canonicalize_url(i.url))
+            yield i
+
+        if products:
+            repeated = Counter()
+            for product in products:
+                first = self.products.get(product)
+                if first is None or first[0] in self.stopped_listings:
+                    self.products[product] = (listing, page)
+                else:
+                    repeated[first] += 1
+            if sum(repeated.values()) >= self.overlap * len(products):
+                self.stats.inc_value("listingdedup/duplicate_pages")
+                if chain:
+                    # El listado y la página de donde vienen la mayoría de los productos repetidos
+                    first = repeated.most_common(1)[0][0]
+                    self.stopped_listings.add(listing)
+                    self.stopped.append((listing, ) + first)
+                    self.stats.inc_value("listingdedup/stopped_chains")
+                    spider.logger.debug(
+                        f"Listing {listing} page {page} repeats {sum(repeated.values())} of {len(products)} products"
+                        f" (most from {first[0]} page {first[1]}), not following"
+                    )
+                    return
+
+        yield from chain
+
+    def spider_closed(self, spider):
+        if not self.stopped:
+            return
+        # Una cadena que repite sus propias páginas no tiene un listado con el que compararse
+        saved = sum(
+            max(self.last_pages.get(first, page) - page, 0) for listing, first, page in self.stopped if first != listing
+        )
+        self.stats.set_value("listingdedup/saved_requests", saved)
+        spider.logger.info(f"Duplicate listings: {len(self.stopped)} pagination chains stopped, about {saved} listing requests saved")
+
+
+class _SlotWindow:
+    """
+    Respuestas observadas de un slot de descarga (dominio) desde la última decisión.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.responses = 0
+        self.errors = 0
+        self.throttled = 0
+        self.latency = 0.0
+        self.retry_after = 0.0
+
+
+class AdaptiveConcurrencyMiddleware:
+    """
+    Ajusta la concurrencia y el retraso de cada dominio según cómo responde.
+
+    Cada ADAPTIVE_CONCURRENCY_WINDOW respuestas de un dominio (o cada ADAPTIVE_CONCURRENCY_INTERVAL
+    segundos si el dominio va lento) se toma una decisión (AIMD):
+    - si hubo respuestas 429/503 o la tasa de errores (5xx y fallos de conexión) supera
+      ADAPTIVE_CONCURRENCY_ERROR_RATE, la concurrencia se reduce a la mitad y el retraso se
+      duplica (o se usa el Retry-After del servidor);
+    - si la latencia media supera ADAPTIVE_CONCURRENCY_LATENCY_FACTOR veces la mejor latencia
+      observada, el servidor se está saturando y la concurrencia baja en 1;
+    - si no, primero se reduce el retraso a la mitad y, sin retraso, la concurrencia sube en 1.
+
+    Un 429 reduce la concurrencia de inmediato, sin esperar a completar la ventana, salvo justo
+    después de otra reducción (los 429 de solicitudes que ya estaban en curso). Los valores
+    se mantienen entre ADAPTIVE_CONCURRENCY_MIN/MAX y ADAPTIVE_DELAY_MIN/MAX, y cada cambio se
+    registra en el log. Se desactiva con ADAPTIVE_CONCURRENCY_ENABLED = False.
+    """
+
+    THROTTLE_STATUSES = (429, 503)
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_concurrency = settings.getint("ADAPTIVE_CONCURRENCY_MIN", 1)
+        self.max_concurrency = settings.getint("ADAPTIVE_CONCURRENCY_MAX", 16)
+        self.min_delay = settings.getfloat("ADAPTIVE_DELAY_MIN", settings.getfloat("DOWNLOAD_DELAY"))
+        self.max_delay = settings.getfloat("ADAPTIVE_DELAY_MAX", 10.0)
+        self.window_size = settings.getint("ADAPTIVE_CONCURRENCY_WINDOW", 20)
+        self.interval = settings.getfloat("ADAPTIVE_CONCURRENCY_INTERVAL", 10.0)
+        self.error_rate = settings.getfloat("ADAPTIVE_CONCURRENCY_ERROR_RATE", 0.05)
+        self.latency_factor = settings.getfloat("ADAPTIVE_CONCURRENCY_LATENCY_FACTOR", 2.0)
+        self.windows = {}
+        self.best_latency = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def _slot(self, request):
+        key = request.meta.get("download_slot")
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def _window_full(self, window):
+        return window.responses >= self.window_size or time.monotonic() - window.started >= self.interval
+
+    def process_response(self, request, response, spider):
+        key, slot = self._slot(request)
+        if slot is None:
+            return response
+
+        window = self.windows.setdefault(key, _SlotWindow())
+        window.responses += 1
+        window.latency += request.meta.get("download_latency", 0.0)
+        if response.status in self.THROTTLE_STATUSES:
+            window.throttled += 1
+            retry_after = response.headers.get(b"Retry-After", b"").decode("latin-1").strip()
+            if retry_after.isdigit():
+                window.retry_after = max(window.retry_after, float(retry_after))
+        elif response.status >= 500:
+            window.errors += 1
+
+        # Tras una reducción, los 429 de las solicitudes que ya estaban en curso no vuelven a reducir
+        drained = window.responses >= slot.concurrency
+        if self._window_full(window) or (response.status == 429 and drained):
+            self._decide(key, slot, window, spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key, slot = self._slot(request)
+        if slot is None:
+            return None
+
+        window = self.windows.setdefault(key, _SlotWindow())
+        window.responses += 1
+        window.errors += 1
+        if self._window_full(window):
+            self._decide(key, slot, window, spider)
+        return None
+
+    def _decide(self, key, slot, window, spider):
+        """
+        Calcula la nueva concurrencia y el nuevo retraso del slot a partir de la ventana.
+        """
+        self.windows[key] = _SlotWindow()
+        latency = window.latency / window.responses
+        error_rate = (window.errors + window.throttled) / window.responses
+        healthy = not window.throttled and not window.errors
+        if healthy:
+            # Las respuestas de error suelen ser rápidas: no cuentan para la mejor latencia
+            self.best_latency[key] = min(self.best_latency.get(key, latency), latency)
+        best = self.best_latency.get(key, 0.0)
+
+        concurrency, delay = slot.concurrency, slot.delay
+        if window.throttled or error_rate > self.error_rate:
+            concurrency = concurrency // 2
+            delay = max(delay * 2, window.retry_after, 0.25)
+            reason = f"{window.throttled} throttled, {window.errors} errors"
+        elif healthy and best > 0 and latency > best * self.latency_factor:
+            concurrency -= 1
+            reason = f"latency {latency:.2f}s vs best {best:.2f}s"
+        elif delay > self.min_delay:
+            delay = delay / 2 if delay / 2 > 0.05 else 0.0
+            reason = "healthy"
+        else:
+            concurrency += 1
+            reason = "healthy"
+
+        concurrency = min(max(concurrency, self.min_concurrency), self.max_concurrency)
+        delay = min(max(delay, self.min_delay), self.max_delay)
+        if (concurrency, delay) == (slot.concurrency, slot.delay):
+            return
+
+        spider.logger.info(
+            f"Adaptive concurrency {key}: concurrency {slot.concurrency} -> {concurrency}, "
+            f"delay {slot.delay:.2f}s -> {delay:.2f}s ({reason}; latency {latency:.2f}s, "
+            f"errors {window.errors + window.throttled}/{window.responses})"
+        )
+        slot.concurrency, slot.delay = concurrency, delay
+        self.stats.inc_value("adaptive/decisions", spider=spider)
+
+    def spider_closed(self, spider):
+        for key, slot in self.crawler.engine.downloader.slots.items():
+            self.stats.set_value(f"adaptive/{key}/concurrency", slot.concurrency, spider=spider)
+            self.stats.set_value(f"adaptive/{key}/delay", round(slot.delay, 2), spider=spider)
@@ -0,0 +1,168 @@
+import logging
+import re
+import time
+
+import scrapy
+from w3lib.url import add_or_replace_parameter, canonicalize_url, url_query_cleaner
+
+from medifacil_backend import localstore
+
+
+class PaginationStore:
+    """
+    Cantidad de páginas con productos de cada listado, aprendida en la ejecución anterior.
+
+    Se guarda en un archivo SQLite local (PAGINATION_STATE_PATH) por spider y URL de listado.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Ruta del archivo SQLite.
+        """
+        self.conn = localstore.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS listing_pages (
+                spider TEXT NOT NULL,
+                listing TEXT NOT NULL,
+                pages INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (spider, listing)
+            )
+            """
+        )
+
+    def pages(self, spider):
+        """
+        Devuelve las páginas aprendidas de los listados de una spider.
+
+        Args:
+            spider (str): Nombre de la spider.
+
+        Returns:
+            dict: Cantidad de páginas por URL de listado.
+        """
+        rows = self.conn.execute("SELECT listing, pages FROM listing_pages WHERE spider = ?", (spider, ))
+        return dict(rows.fetchall())
+
+    def save(self, spider, pages):
+        """
+        Guarda las páginas con productos de cada listado recorrido.
+
+        Args:
+            spider (str): Nombre de la spider.
+            pages (dict): Última página con productos nuevos por URL de listado.
+        """
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO listing_pages (spider, listing, pages, updated_at) VALUES (?, ?, ?, ?)",
+            [(spider, listing, count, now) for listing, count in pages.items()]
+        )
+
+
+class AdaptivePaginationMixin:
+    """
+    Paginación de listados que se detiene en la última página real.
+
+    Cada listado de `listings` se pagina con el parámetro `page_param`. Una página pide la
+    siguiente solo si trajo enlaces de producto (rutas que coinciden con `item_url_pattern`) que
+    no aparecieron en las páginas anteriores del mismo listado; la primera página vacía o
+    repetida cierra la cadena. Los enlaces de paginación que trae la propia página se ignoran: la
+    cadena es la única que pide las páginas de sus listados. Al terminar el rastreo se guarda, por listado, la última página
+    que trajo productos nuevos, y en la siguiente ejecución esas páginas se piden de una vez
+    (sin esperar a la anterior) y solo la última sigue paginando si todavía trae productos.
+
+    Las clases que lo usan deben definir `listings`, `page_param`, `item_url_pattern` y
+    `parse_page`, que extrae los enlaces de la página.
+    """
+
+    listings = ()  # URLs de los listados paginados, sin el parámetro de página
+    page_param = "page"
+    max_pages = 100  # Tope de seguridad por listado
+
+    def listing_requests(self):
+        """
+        Solicitudes iniciales de los listados: las páginas aprendidas en la ejecución anterior, o solo la primera.
+        """
+        learned = self._pagination_store().pages(self.name)
+        for listing in self.listings:
+            pages = min(max(learned.get(listing, 1), 1), self.max_pages)
+            self.crawler.stats.inc_value("pagination/initial_pages", pages)
+            for page in range(1, pages + 1):
+                yield self._listing_request(listing, page)
+
+    def _pagination_store(self):
+        return PaginationStore(self.settings.get("PAGINATION_STATE_PATH", "temp/pagination.sqlite3"))
+
+    def _pagination_state(self):
+        # Se crea al primer uso: al reanudar un rastreo (JOBDIR) pueden llegar páginas de listado
+        # de la cola en disco antes de que se generen las solicitudes iniciales
+        if not hasattr(self, "_listing_links"):
+            self._listing_item_regex = re.compile(self.item_url_pattern)
+            self._listing_keys = {self._listing_key(listing) for listing in self.listings}
+            self._listing_links = {}
+            self._listing_requested = {}
+            self._listing_pages = {}
+
+    def _listing_key(self, url):
+        # La URL del listado sin el parámetro de página ni los parámetros ignorados por la spider
+        params = (self.page_param, ) + tuple(getattr(self, "ignored_query_params", ()))
+        return canonicalize_url(url_query_cleaner(url, params, remove=True))
+
+    def _listing_request(self, listing, page):
+        self._pagination_state()
+        self._listing_requested[listing] = max(self._listing_requested.get(listing, 0), page)
+        # parse_listing no pasa por el filtro de patrones de MedifacilBackendSpiderMiddleware:
+        # las URLs de listado con parámetros son generadas, no enlaces seguidos
+        return scrapy.Request(
+            add_or_replace_parameter(listing, self.page_param, str(page)),
+            callback=self.parse_listing,
+            cb_kwargs={"listing": listing, "page": page}
+        )
+
+    def parse_listing(self, response, listing, page):
+        """
+        Procesa una página de un listado paginado y pide la siguiente si trajo productos nuevos.
+
+        Args:
+            response (scrapy.http.Response): La respuesta de la solicitud.
+            listing (str): URL del listado.
+            page (int): Número de página.
+        """
+        self._pagination_state()
+        self.crawler.stats.inc_value("pagination/pages")
+        products = set()
+        for request in self.parse_page(response):
+            if self._listing_item_regex.match(request.url.split("?", 1)[0]):
+                products.add(canonicalize_url(request.url))
+            elif self._listing_key(request.url) in self._listing_keys:
+                continue
+            yield request
+
+        seen = self._listing_links.setdefault(listing, set())
+        new = products - seen
+        seen |= new
+        if not new:
+            self.crawler.stats.inc_value("pagination/exhausted")
+            logging.debug(f"Listing {listing} exhausted at page {page}")
+            return
+
+        self._listing_pages[listing] = max(self._listing_pages.get(listing, 0), page)
+        # Solo la última página pedida continúa la cadena; las anteriores ya tienen su siguiente en curso
+        if page >= self._listing_requested.get(listing, 0) and page < self.max_pages:
+            yield self._listing_request(listing, page + 1)
+
+    def closed(self, reason):
+        """
+        Guarda las páginas con productos de cada listado si el rastreo terminó completo.
+
+        Args:
+            reason (str): Motivo del cierre.
+        """
+        if reason != "finished" or not getattr(self, "_listing_pages", None):
+            return
+        self._pagination_store().save(self.name, self._listing_pages)
+        requested = sum(self._listing_requested.values())
+        useful = sum(self._listing_pages.values())
+        logging.info(f"Pagination of {self.name}: {useful} listing pages with new products out of {requested} requested")
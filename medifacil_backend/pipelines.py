@@ -4,13 +4,57 @@
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+import hashlib
 import logging
 import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
 from dotenv import load_dotenv
+from scrapy.exceptions import DropItem
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread
+
+from medifacil_backend.db import connection_params
+from medifacil_backend.freshness import product_gone
+from medifacil_backend.incremental import page_unchanged
+from medifacil_backend.items import parse_presentation
 
 # Carga las variables de entorno desde el archivo .env
-assert load_dotenv(f"{os.getcwd()}/medifacil_backend/.env", override=True)
+load_dotenv(f"{os.getcwd()}/medifacil_backend/.env", override=True)
+
+
+# Producto que no se volvió a analizar porque su página no cambió (modo incremental)
+SeenUrl = namedtuple('SeenUrl', ['url', 'ingest_date'])
+
+# Producto conocido cuya página ya no existe (404 o 410, modos de frescura y actualización)
+GoneUrl = namedtuple('GoneUrl', ['url', 'ingest_date'])
+
+# Disponibilidad de los productos retirados por la tienda
+UNAVAILABLE = 'No available'
+
+
+def content_fingerprint(item):
+    """
+    Calcula una huella compacta (entero de 64 bits) del contenido de un item.
+
+    Dos items con el mismo nombre, precio, imagen y disponibilidad tienen la misma huella,
+    lo que permite saber si un producto cambió sin comparar campo por campo.
+
+    Args:
+        item (scrapy.Item): El item a resumir.
+
+    Returns:
+        int: Huella con signo, compatible con una columna BIGINT.
+    """
+    content = "\x1f".join(
+        str(item.get(field, '')) for field in ('pharma', 'name', 'price', 'url_image', 'availability')
+    )
+    digest = hashlib.blake2b(content.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
 
 
 class PostgresPipeline:
@@ -18,9 +62,102 @@ class PostgresPipeline:
     Pipeline para guardar items en una base de datos PostgreSQL.
 
     Este pipeline se conecta a una base de datos PostgreSQL cuando se abre el spider
-    y cierra la conexión cuando el spider se cierra. Procesa cada item insertándolo
-    o actualizándolo en la base de datos.
+    y cierra la conexión cuando el spider se cierra. Las escrituras no se hacen en el hilo
+    del reactor de Twisted: process_item deja cada fila en una cola acotada y un hilo
+    escritor dedicado las inserta o actualiza por lotes (un solo INSERT de varias filas y
+    un solo commit por lote). El lote se escribe cuando alcanza POSTGRES_BATCH_SIZE items,
+    cuando pasan POSTGRES_FLUSH_INTERVAL segundos desde la última escritura y al cerrar
+    el spider. Con POSTGRES_BATCH_SIZE = 1 cada item se escribe apenas llega.
+
+    Al abrir el spider se cargan las huellas (content_hash) de los productos de la farmacia.
+    Los items cuyo contenido no cambió no se reescriben: solo se actualiza su ingest_date,
+    también por lotes, y al final de la ejecución se informa cuántas escrituras se evitaron.
+    Los productos cuya página ya no existe (señal product_gone) se marcan como no disponibles.
+
+    Si la cola (POSTGRES_QUEUE_SIZE) se llena, process_item devuelve un Deferred que se
+    resuelve cuando vuelve a haber espacio, así Scrapy frena el procesamiento de items
+    en lugar de acumularlos en memoria.
+
+    Si no se puede conectar a la base de datos el spider no se abre. Si el hilo escritor muere
+    por un error inesperado, el spider se cierra (motivo `postgres_writer_failed`) y los items
+    que sigan llegando se descartan en vez de esperar una cola que ya nadie vacía.
+    """
+
+    # Inserta o actualiza los items en la base de datos: La instrucción SQL utiliza la cláusula INSERT INTO para insertar datos en una tabla llamada medicines.
+    # Además, emplea la cláusula ON CONFLICT para manejar situaciones en las que se produce un conflicto (en este caso, una duplicación en la columna url). 
+    # Si ocurre un conflicto, la instrucción no insertará un nuevo registro, 
+    # sino que actualizará los campos específicos del registro existente con los nuevos valores proporcionados.
+    # VALUES %s: execute_values lo reemplaza por todas las filas del lote, cada una con UPSERT_TEMPLATE.
+    # %s: Marcador de posición para cada uno de los valores que se insertarán en las columnas para evitar SQL INJECTION
+    # name_tsv: tsvector del nombre, se guarda ya calculado para que /search no lo recalcule por cada fila
+    UPSERT_SQL = """
+        INSERT INTO medicines (url, pharma, name, price, url_image, availability, ingest_date, name_tsv, base_name, pack_quantity, unit_price, content_hash) 
+        VALUES %s
+        ON CONFLICT (url) 
+        DO UPDATE SET
+            name = EXCLUDED.name,
+            name_tsv = EXCLUDED.name_tsv,
+            base_name = EXCLUDED.base_name,
+            pack_quantity = EXCLUDED.pack_quantity,
+            unit_price = EXCLUDED.unit_price,
+            price = EXCLUDED.price,
+            url_image = EXCLUDED.url_image,
+            availability = EXCLUDED.availability,
+            ingest_date = EXCLUDED.ingest_date,
+            content_hash = EXCLUDED.content_hash
     """
+    UPSERT_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, to_tsvector('spanish', coalesce(%s, '')), %s, %s, %s, %s)"
+
+    # Marca como vistos los productos sin cambios: solo actualiza ingest_date si es distinta
+    TOUCH_SQL = """
+        UPDATE medicines SET ingest_date = %s
+        WHERE url = ANY(%s) AND ingest_date IS DISTINCT FROM %s
+    """
+
+    # Marca como no disponibles los productos retirados. Sin huella, el producto se reescribe completo si vuelve
+    GONE_SQL = """
+        UPDATE medicines SET availability = %s, ingest_date = %s, content_hash = NULL
+        WHERE url = ANY(%s)
+    """
+
+    # Marca que indica al hilo escritor que debe escribir lo pendiente y terminar
+    _STOP = object()
+
+    # Intervalo (segundos) con el que se reintenta encolar una fila cuando la cola está llena
+    QUEUE_RETRY_DELAY = 0.05
+
+    # Segundos entre intentos de encolar la marca de fin mientras el hilo escritor sigue vivo
+    STOP_RETRY_TIMEOUT = 1.0
+
+    def __init__(self, batch_size=1, flush_interval=5.0, queue_size=1000, stats=None):
+        """
+        Args:
+            batch_size (int): Cantidad de items por lote.
+            flush_interval (float): Segundos máximos que un item espera en el buffer.
+            queue_size (int): Máximo de filas pendientes entre el reactor y el hilo escritor.
+            stats (scrapy.statscollectors.StatsCollector): Colector de estadísticas del crawler.
+        """
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.queue_size = max(1, int(queue_size))
+        self.stats = stats
+        self.crawler = None
+        self.writer = None
+        # Error que detuvo el hilo escritor; mientras sea None el hilo sigue vaciando la cola
+        self.writer_error = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(
+            batch_size=crawler.settings.getint('POSTGRES_BATCH_SIZE', 1),
+            flush_interval=crawler.settings.getfloat('POSTGRES_FLUSH_INTERVAL', 5.0),
+            queue_size=crawler.settings.getint('POSTGRES_QUEUE_SIZE', 1000),
+            stats=crawler.stats
+        )
+        pipeline.crawler = crawler
+        crawler.signals.connect(pipeline.page_unchanged, signal=page_unchanged)
+        crawler.signals.connect(pipeline.product_gone, signal=product_gone)
+        return pipeline
 
     def open_spider(self, spider):
         """
@@ -29,40 +166,140 @@ class PostgresPipeline:
         Args:
             spider (scrapy.Spider): El spider que se está abriendo.
         """
-        hostname = os.environ["DB_HOSTNAME"]
-        username = os.environ["DB_USERNAME"]  # El usuario con el que te conectas
-        password = os.environ["DB_PASSWORD"]  # La contraseña del usuario
-        database = os.environ["DB_DATABASE"]  # La base de datos a la que te conectas
-        port = os.environ["DB_PORT"]  # Puerto de PostgreSQL (el valor por defecto es 5432)
+        # Buffer de filas pendientes indexado por url: si un producto llega dos veces en el mismo lote
+        # solo se escribe la última versión (ON CONFLICT no puede actualizar la misma fila dos veces)
+        self.buffer = {}
+        # Productos sin cambios pendientes de marcar como vistos: url -> ingest_date
+        self.touched = {}
+        # Productos retirados pendientes de marcar como no disponibles: url -> ingest_date
+        self.gone = {}
+        self.last_flush = time.monotonic()
+        self.pharma = getattr(spider, 'pharma', None)
+        self.fingerprints = {}
+        self.items_received = 0
+        # Filas escritas o marcadas como no disponibles: solo entonces cambian los resultados de /search
+        self.rows_changed = 0
+
+        self.writer_error = None
 
         try:
             # Establece la conexión con la base de datos
-            self.connection = psycopg2.connect(
-                host=hostname,
-                user=username,
-                password=password,
-                dbname=database,
-                port=port
-            )
+            self.connection = psycopg2.connect(**connection_params())
             self.cursor = self.connection.cursor(cursor_factory=RealDictCursor)
             logging.info("Connected to the database successfully")
         except Exception as e:
+            # Sin conexión no hay dónde escribir: el spider no se abre en vez de rastrear para nada
             logging.error(f"Error connecting to the database: {e}")
+            raise
+
+        # A partir de aquí la conexión solo la usa el hilo escritor
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.writer = threading.Thread(target=self._writer_loop, name=f"postgres-writer-{spider.name}", daemon=True)
+        self.writer.start()
 
     def close_spider(self, spider):
         """
-        Se llama cuando el spider se cierra. Cierra la conexión con la base de datos.
+        Se llama cuando el spider se cierra. Espera a que el hilo escritor termine sin bloquear el reactor.
 
         Args:
             spider (scrapy.Spider): El spider que se está cerrando.
+
+        Returns:
+            twisted.internet.defer.Deferred: Se resuelve cuando todo quedó escrito y la conexión cerrada.
         """
+        return deferToThread(self._shutdown)
+
+    def _shutdown(self):
+        """
+        Detiene el hilo escritor (que escribe los items pendientes), informa cuántas escrituras
+        se evitaron, incrementa la generación del catálogo si alguna fila cambió y cierra la
+        conexión con la base de datos.
+        """
+        if self.writer is None:
+            return
+        # La cola puede estar llena: se reintenta mientras el hilo siga vivo para vaciarla
+        while self.writer.is_alive():
+            try:
+                self.queue.put(self._STOP, timeout=self.STOP_RETRY_TIMEOUT)
+                break
+            except queue.Full:
+                continue
+        self.writer.join()
+
+        unchanged = self.stats.get_value("postgres/rows_unchanged", 0) if self.stats is not None else 0
+        logging.info(f"{unchanged} of {self.items_received} items unchanged, writes skipped")
+
+        if not self.rows_changed:
+            # Sin cambios (por ejemplo, un lote de --urls-file con precios iguales) la caché de /search sigue
+            # siendo válida; los productos que solo se marcaron como vistos cambian solo su ingest_date
+            logging.info("No rows changed, catalog generation kept")
+        else:
+            try:
+                # La nueva generación invalida la caché de resultados de /search
+                self.cursor.execute(
+                    "UPDATE public.catalog_generation SET generation = generation + 1, updated_at = now()"
+                )
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                logging.error(f"Error bumping catalog generation: {e}")
+
         self.cursor.close()
         self.connection.close()
         logging.info("Database connection closed")
 
+    def load_fingerprints(self):
+        """
+        Carga las huellas de contenido de los productos ya guardados de la farmacia del spider.
+        """
+        condition = "WHERE content_hash IS NOT NULL"
+        params = ()
+        if self.pharma is not None:
+            condition += " AND pharma = %s"
+            params = (self.pharma, )
+
+        with self.connection.cursor(name="load_fingerprints") as cursor:
+            cursor.itersize = 10000
+            cursor.execute(f"SELECT url, content_hash FROM medicines {condition}", params)
+            self.fingerprints = {url: content_hash for url, content_hash in cursor}
+        self.connection.commit()
+        logging.info(f"Loaded {len(self.fingerprints)} content fingerprints")
+
+    def _inc_stat(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(f"postgres/{key}", count)
+
+    def item_to_row(self, item):
+        """
+        Convierte un item en la tupla de valores que espera UPSERT_TEMPLATE.
+
+        Args:
+            item (scrapy.Item): El item a convertir.
+
+        Returns:
+            tuple: Valores de la fila en el orden de las columnas.
+        """
+        # Calcula el nombre base, la cantidad del empaque y el precio unitario una sola vez, al ingerir
+        item['base_name'], item['pack_quantity'], item['unit_price'] = parse_presentation(item['name'], item['price'])
+
+        return (
+            item['url'],
+            item['pharma'],
+            item['name'],
+            item['price'],
+            item.get('url_image', ''),
+            item['availability'],
+            item['ingest_date'],
+            item['name'],
+            item['base_name'],
+            item['pack_quantity'],
+            item['unit_price'],
+            content_fingerprint(item)
+        )
+
     def process_item(self, item, spider):
         """
-        Procesa cada item insertándolo o actualizándolo en la base de datos.
+        Agrega el item al buffer y escribe el lote si alcanzó el tamaño o el tiempo máximo.
 
         Args:
             item (scrapy.Item): El item a procesar.
@@ -71,37 +308,254 @@ class PostgresPipeline:
         Returns:
             scrapy.Item: El item procesado.
         """
+        self.items_received += 1
+        if self.writer_error is not None:
+            raise DropItem(f"Database writer stopped: {self.writer_error}")
         try:
-            # Inserta o actualiza el item en la base de datos: La instrucción SQL utiliza la cláusula INSERT INTO para insertar datos en una tabla llamada medicines.
-            # Además, emplea la cláusula ON CONFLICT para manejar situaciones en las que se produce un conflicto (en este caso, una duplicación en la columna url). 
-            # Si ocurre un conflicto, la instrucción no insertará un nuevo registro, 
-            # sino que actualizará los campos específicos del registro existente con los nuevos valores proporcionados.
-            # %s: Marcador de posición para cada uno de los valores que se insertarán en las columnas para evitar SQL INJECTION
-
-            self.cursor.execute(
-                """
-                INSERT INTO medicines (url, pharma, name, price, url_image, availability, ingest_date) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (url) 
-                DO UPDATE SET
-                    name = EXCLUDED.name,
-                    price = EXCLUDED.price,
-                    url_image = EXCLUDED.url_image,
-                    availability = EXCLUDED.availability,
-                    ingest_date = EXCLUDED.ingest_date
-                """,
-                (
-                    item['url'],
-                    item['pharma'],
-                    item['name'],
-                    item['price'],
-                    item.get('url_image', ''),
-                    item['availability'],
-                    item['ingest_date']
-                )
-            )
-            self.connection.commit()
-            # logging.info("Item inserted/updated successfully")
+            row = self.item_to_row(item)
         except Exception as e:
             logging.error(f"Error processing item: {e} {str(item)}")
-        return item
\ No newline at end of file
+            return item
+
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            # Contrapresión: el item queda en espera hasta que el hilo escritor libere espacio
+            self._inc_stat("queue_full")
+            return self._enqueue_later(row, item)
+        return item
+
+    def page_unchanged(self, url, spider):
+        """
+        Marca como visto un producto cuya página no cambió y por eso no produjo un item.
+
+        Args:
+            url (str): URL del producto.
+            spider (scrapy.Spider): El spider que lo rastreó.
+        """
+        row = SeenUrl(url, str(datetime.now().date()))
+        if self.writer_error is not None:
+            return
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self._enqueue_later(row, None)
+
+    def product_gone(self, url, spider):
+        """
+        Marca como no disponible un producto cuya página ya no existe.
+
+        Args:
+            url (str): URL del producto.
+            spider (scrapy.Spider): El spider que lo rastreó.
+        """
+        row = GoneUrl(url, str(datetime.now().date()))
+        if self.writer_error is not None:
+            return
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self._enqueue_later(row, None)
+
+    def _enqueue_later(self, row, item):
+        """
+        Reintenta encolar una fila desde el reactor, sin bloquearlo, hasta que haya espacio.
+
+        Args:
+            row (tuple): Fila generada por item_to_row.
+            item (scrapy.Item): El item al que pertenece la fila.
+
+        Returns:
+            twisted.internet.defer.Deferred: Se resuelve con el item cuando la fila quedó encolada, o
+            falla con DropItem si el hilo escritor murió.
+        """
+        from twisted.internet import reactor
+
+        deferred = Deferred()
+
+        def try_put():
+            if self.writer_error is not None:
+                if item is None:
+                    deferred.callback(None)
+                else:
+                    deferred.errback(DropItem(f"Database writer stopped: {self.writer_error}"))
+                return
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                reactor.callLater(self.QUEUE_RETRY_DELAY, try_put)
+                return
+            deferred.callback(item)
+
+        reactor.callLater(self.QUEUE_RETRY_DELAY, try_put)
+        return deferred
+
+    def _writer_loop(self):
+        """
+        Hilo escritor: toma filas de la cola, las acumula en el buffer y escribe los lotes.
+
+        Un error inesperado detiene el hilo: se guarda en writer_error y se cierra el spider.
+        """
+        try:
+            self._write_until_stopped()
+        except Exception as e:
+            self.writer_error = e
+            logging.error(f"Database writer stopped: {e}")
+            if self.crawler is not None:
+                from twisted.internet import reactor
+                reactor.callFromThread(self._close_spider_after_failure)
+
+    def _close_spider_after_failure(self):
+        # En el hilo del reactor; si el spider ya se está cerrando, close_spider devuelve ese cierre
+        engine = self.crawler.engine
+        if engine is not None and engine.slot is not None:
+            engine.close_spider(self.crawler.spider, "postgres_writer_failed")
+
+    def _write_until_stopped(self):
+        try:
+            self.load_fingerprints()
+        except Exception as e:
+            self.connection.rollback()
+            logging.error(f"Error loading content fingerprints, every item will be written: {e}")
+
+        while True:
+            pending = len(self.buffer) + len(self.touched) + len(self.gone)
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - self.last_flush))
+            try:
+                row = self.queue.get(timeout=timeout if pending else None)
+            except queue.Empty:
+                row = None
+
+            if row is self._STOP:
+                self.flush()
+                return
+
+            if row is not None:
+                if not pending:
+                    self.last_flush = time.monotonic()
+                self._buffer_row(row)
+                pending = len(self.buffer) + len(self.touched) + len(self.gone)
+
+            if pending >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                try:
+                    self.flush()
+                except Exception as e:
+                    logging.error(f"Error writing batch: {e}")
+
+    def _buffer_row(self, row):
+        """
+        Agrega una fila al buffer de escritura, o al de productos vistos si su contenido no cambió.
+
+        Args:
+            row (tuple): Fila generada por item_to_row.
+        """
+        if isinstance(row, SeenUrl):
+            self.touched[row.url] = row.ingest_date
+            return
+        if isinstance(row, GoneUrl):
+            self.fingerprints.pop(row.url, None)
+            self.buffer.pop(row.url, None)
+            self.touched.pop(row.url, None)
+            self.gone[row.url] = row.ingest_date
+            return
+
+        url, ingest_date, fingerprint = row[0], row[6], row[-1]
+        if self.fingerprints.get(url) == fingerprint:
+            self.touched[url] = ingest_date
+            self.buffer.pop(url, None)
+            self._inc_stat("rows_unchanged")
+            return
+
+        self.fingerprints[url] = fingerprint
+        self.touched.pop(url, None)
+        self.buffer[url] = row
+
+    def flush(self):
+        """
+        Escribe en la base de datos todas las filas del buffer, marca como vistos los productos sin cambios
+        y como no disponibles los retirados.
+        """
+        rows = list(self.buffer.values())
+        touched = self.touched
+        gone = self.gone
+        self.buffer.clear()
+        self.touched = {}
+        self.gone = {}
+        self.last_flush = time.monotonic()
+        if rows:
+            self.write_rows(rows)
+        if touched:
+            self.touch_rows(touched)
+        if gone:
+            self.mark_gone(gone)
+
+    def touch_rows(self, touched):
+        """
+        Actualiza en una sola sentencia por fecha la ingest_date de los productos que no cambiaron.
+
+        Args:
+            touched (dict): url -> ingest_date de los productos vistos.
+        """
+        urls_by_date = {}
+        for url, ingest_date in touched.items():
+            urls_by_date.setdefault(ingest_date, []).append(url)
+
+        try:
+            for ingest_date, urls in urls_by_date.items():
+                self.cursor.execute(self.TOUCH_SQL, (ingest_date, urls, ingest_date))
+            self.connection.commit()
+            self._inc_stat("rows_touched", len(touched))
+        except Exception as e:
+            self.connection.rollback()
+            logging.error(f"Error touching {len(touched)} unchanged rows: {e}")
+
+    def mark_gone(self, gone):
+        """
+        Marca como no disponibles, en una sola sentencia por fecha, los productos cuya página ya no existe.
+
+        Args:
+            gone (dict): url -> ingest_date de los productos retirados.
+        """
+        urls_by_date = {}
+        for url, ingest_date in gone.items():
+            urls_by_date.setdefault(ingest_date, []).append(url)
+
+        try:
+            for ingest_date, urls in urls_by_date.items():
+                self.cursor.execute(self.GONE_SQL, (UNAVAILABLE, ingest_date, urls))
+            self.connection.commit()
+            self.rows_changed += len(gone)
+            self._inc_stat("rows_gone", len(gone))
+        except Exception as e:
+            self.connection.rollback()
+            logging.error(f"Error marking {len(gone)} rows as unavailable: {e}")
+
+    def write_rows(self, rows):
+        """
+        Inserta o actualiza un lote de filas en una sola sentencia y un solo commit.
+
+        Si el lote falla, se revierte y se reintenta fila por fila para que solo se descarten
+        (y se registren) las filas con errores.
+
+        Args:
+            rows (list): Filas generadas por item_to_row.
+        """
+        try:
+            execute_values(self.cursor, self.UPSERT_SQL, rows, template=self.UPSERT_TEMPLATE, page_size=len(rows))
+            self.connection.commit()
+            self.rows_changed += len(rows)
+            self._inc_stat("rows_written", len(rows))
+            self._inc_stat("batches")
+            return
+        except Exception as e:
+            self.connection.rollback()
+            if len(rows) == 1:
+                logging.error(f"Error processing item: {e} {rows[0]}")
+                self._inc_stat("rows_failed")
+                # Sin huella, el producto se vuelve a intentar si llega otra vez
+                self.fingerprints.pop(rows[0][0], None)
+                return
+            logging.warning(f"Batch of {len(rows)} rows failed, retrying row by row: {e}")
+
+        for row in rows:
+            self.write_rows([row])
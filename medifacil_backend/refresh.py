@@ -0,0 +1,231 @@
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+from medifacil_backend import localstore
+
+
+# Estados de una URL en la cola de actualización
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+
+
+class RefreshQueue:
+    """
+    Cola de productos para actualizar a pedido, compartida entre los workers de gunicorn (que
+    encolan los resultados desactualizados de /search) y el daemon del scraper (que los actualiza
+    con `app_scraper.py --refresh --urls-file`), mediante un archivo SQLite local.
+
+    Cada URL aparece una sola vez: mientras está pendiente o en curso no se vuelve a encolar, y
+    después de actualizarse tampoco hasta que pasan `cooldown` segundos. Además, como mucho se
+    encolan `rate_per_minute` URLs por minuto entre todos los workers, y nunca más de
+    `max_pending` pendientes a la vez.
+    """
+
+    def __init__(self, path, cooldown=21600, rate_per_minute=60, max_pending=1000):
+        """
+        Args:
+            path (str): Ruta del archivo SQLite de la cola.
+            cooldown (float): Segundos tras una actualización en los que la URL no se vuelve a encolar.
+            rate_per_minute (int): Máximo de URLs encoladas por minuto.
+            max_pending (int): Máximo de URLs pendientes.
+        """
+        self.path = path
+        self.cooldown = float(cooldown)
+        self.rate_per_minute = int(rate_per_minute)
+        self.max_pending = int(max_pending)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Crea la cola con la configuración de las variables de entorno REFRESH_QUEUE_PATH, REFRESH_COOLDOWN,
+        REFRESH_RATE_PER_MINUTE y REFRESH_MAX_PENDING.
+
+        Returns:
+            RefreshQueue: Cola de actualización.
+        """
+        return cls(
+            os.environ.get("REFRESH_QUEUE_PATH", f"{os.getcwd()}/temp/refresh_queue.sqlite3"),
+            cooldown=float(os.environ.get("REFRESH_COOLDOWN", 21600)),
+            rate_per_minute=int(os.environ.get("REFRESH_RATE_PER_MINUTE", 60)),
+            max_pending=int(os.environ.get("REFRESH_MAX_PENDING", 1000))
+        )
+
+    def _connection(self):
+        pid = os.getpid()
+        if self._conn is None or self._pid != pid:
+            self._conn = localstore.connect(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS refresh_queue (
+                    url TEXT PRIMARY KEY,
+                    pharma TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    refreshed_at REAL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_refresh_queue_status ON refresh_queue (status, enqueued_at)")
+            self._pid = pid
+        return self._conn
+
+    def enqueue(self, products):
+        """
+        Encola productos para actualizar, respetando la deduplicación, el límite por minuto y el máximo de pendientes.
+
+        Args:
+            products (list): (url, farmacia) de cada producto.
+
+        Returns:
+            int: URLs encoladas.
+        """
+        now = time.time()
+        added = 0
+        with self._lock:
+            conn = self._connection()
+            # BEGIN IMMEDIATE: los límites se cuentan y se aplican sin que otro worker encole en medio
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                recent = conn.execute(
+                    "SELECT count(*) FROM refresh_queue WHERE enqueued_at > ?", (now - 60, )
+                ).fetchone()[0]
+                pending = conn.execute(
+                    "SELECT count(*) FROM refresh_queue WHERE status = ?", (STATUS_PENDING, )
+                ).fetchone()[0]
+                allowed = min(self.rate_per_minute - recent, self.max_pending - pending)
+
+                for url, pharma in products:
+                    if added >= allowed:
+                        break
+                    cursor = conn.execute(
+                        """
+                        INSERT INTO refresh_queue (url, pharma, status, enqueued_at) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (url) DO UPDATE SET status = excluded.status, enqueued_at = excluded.enqueued_at
+                        WHERE refresh_queue.status = ? AND refresh_queue.refreshed_at < ?
+                        """,
+                        (url, pharma, STATUS_PENDING, now, STATUS_DONE, now - self.cooldown)
+                    )
+                    added += cursor.rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def claim(self, limit):
+        """
+        Toma las URLs pendientes más antiguas y las marca en curso.
+
+        Args:
+            limit (int): Máximo de URLs.
+
+        Returns:
+            list: (url, farmacia) de las URLs tomadas.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Las URLs actualizadas hace más de `cooldown` segundos ya no sirven para deduplicar
+                conn.execute(
+                    "DELETE FROM refresh_queue WHERE status = ? AND refreshed_at < ?", (STATUS_DONE, now - self.cooldown)
+                )
+                rows = conn.execute(
+                    "SELECT url, pharma FROM refresh_queue WHERE status = ? ORDER BY enqueued_at LIMIT ?",
+                    (STATUS_PENDING, limit)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE refresh_queue SET status = ? WHERE url = ?", [(STATUS_RUNNING, url) for url, _ in rows]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def finish(self, urls):
+        """
+        Marca URLs como actualizadas.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection().executemany(
+                "UPDATE refresh_queue SET status = ?, refreshed_at = ? WHERE url = ?", [(STATUS_DONE, now, url) for url in urls]
+            )
+
+    def requeue(self, urls):
+        """
+        Devuelve URLs en curso a la cola, por ejemplo si el daemon se detuvo antes de actualizarlas.
+        """
+        with self._lock:
+            self._connection().executemany(
+                "UPDATE refresh_queue SET status = ? WHERE url = ?", [(STATUS_PENDING, url) for url in urls]
+            )
+
+    def recover(self):
+        """
+        Devuelve a la cola las URLs que quedaron en curso cuando el daemon se detuvo.
+
+        Returns:
+            int: URLs recuperadas.
+        """
+        with self._lock:
+            cursor = self._connection().execute(
+                "UPDATE refresh_queue SET status = ? WHERE status = ?", (STATUS_PENDING, STATUS_RUNNING)
+            )
+        return cursor.rowcount
+
+
+class StaleRefreshEnqueuer(localstore.BackgroundWriter):
+    """
+    Encola en segundo plano, en una RefreshQueue, los productos desactualizados que devuelve /search.
+
+    `submit` no toca el disco ni espera: filtra los productos con ingest_date anterior a
+    `stale_days` días y los deja para el hilo de BackgroundWriter, que los pasa por lotes a la
+    RefreshQueue; si la cola en memoria está llena se descartan.
+    """
+
+    thread_name = "refresh-enqueuer"
+    error_message = "Could not queue stale search results for refresh"
+
+    def __init__(self, refresh_queue, stale_days=2, max_buffered=1000):
+        """
+        Args:
+            refresh_queue (RefreshQueue): Cola de actualización.
+            stale_days (float): Días desde ingest_date a partir de los cuales un producto está desactualizado (0 desactiva).
+            max_buffered (int): Máximo de productos en memoria esperando al hilo.
+        """
+        super().__init__(max_buffered)
+        self.refresh_queue = refresh_queue
+        self.stale_days = float(stale_days)
+
+    def submit(self, medicines):
+        """
+        Encola, sin esperar, los productos desactualizados de un resultado de búsqueda.
+
+        Args:
+            medicines (iterable): Productos con url, pharma e ingest_date (fecha ISO o None).
+        """
+        if self.stale_days <= 0:
+            return
+        stale_before = (date.today() - timedelta(days=self.stale_days)).isoformat()
+        for medicine in medicines:
+            ingest_date = medicine.get('ingest_date')
+            if ingest_date is None or ingest_date >= stale_before:
+                continue
+            if not self.put((medicine['url'], medicine['pharma'])):
+                # El hilo no da abasto: el producto se volverá a pedir en una próxima búsqueda
+                return
+
+    def write(self, products):
+        added = self.refresh_queue.enqueue(list(dict(products).items()))
+        if added:
+            logging.info(f"{added} stale search results queued for refresh")
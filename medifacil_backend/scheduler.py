@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+from scrapy.core.scheduler import Scheduler
+from scrapy.pqueues import ScrapyPriorityQueue
+from scrapy.squeues import PickleFifoDiskQueue
+from scrapy.utils.job import job_dir
+from scrapy.utils.request import request_from_dict
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+# Archivo del último punto de control dentro de JOBDIR
+CHECKPOINT_FILE = "requests.checkpoint"
+
+# Registros por archivo de la cola en disco: tan grande que nunca se pasa a un segundo archivo, así que
+# los registros ya leídos no se borran y un punto de control anterior siempre se puede restaurar
+CHUNK_SIZE = 2 ** 31
+
+
+class CheckpointDiskQueue(PickleFifoDiskQueue):
+    """
+    Cola FIFO en disco de Scrapy que no borra lo que ya entregó mientras dura el rastreo.
+
+    queuelib borra cada archivo de la cola al terminar de leerlo, y el directorio entero cuando
+    la cola se vacía. Aquí los registros se conservan (el JOBDIR se borra al terminar el rastreo)
+    para que CheckpointScheduler pueda volver la cola al estado de su último punto de control.
+    """
+
+    def _loadinfo(self, chunksize):
+        return super()._loadinfo(CHUNK_SIZE)
+
+    def _cleanup(self):
+        pass
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def restore_checkpoint(jobdir):
+    """
+    Prepara JOBDIR para reanudar un rastreo que terminó sin cerrar el scheduler (SIGKILL, OOM).
+
+    Scrapy solo guarda el estado de la cola en disco (requests.queue/active.json y el info.json de
+    cada prioridad) al cerrar la spider. Si el proceso murió antes, se vuelve al último punto de
+    control: la cola y requests.seen.bin se recortan a lo que tenían en ese momento, y se devuelven
+    las solicitudes que estaban en curso para volver a pedirlas. Si no hay punto de control ni
+    estado de cierre, se descartan las URLs vistas y la cola: sin ellas se rastrea desde el inicio
+    en vez de filtrar solicitudes que nunca se completaron.
+
+    Args:
+        jobdir (str): Directorio del estado del rastreo.
+
+    Returns:
+        list: Solicitudes en curso en el punto de control, como diccionarios de Request.to_dict().
+    """
+    checkpoint = Path(jobdir, CHECKPOINT_FILE)
+    queue_dir = Path(jobdir, "requests.queue")
+    seen = Path(jobdir, "requests.seen.bin")
+
+    if not checkpoint.exists():
+        if seen.exists() and not Path(queue_dir, "active.json").exists():
+            logger.warning(f"{jobdir} has no saved queue state, discarding its seen requests")
+            seen.unlink()
+            shutil.rmtree(queue_dir, ignore_errors=True)
+        return []
+
+    with checkpoint.open("rb") as f:
+        state = pickle.load(f)
+
+    if queue_dir.is_dir():
+        for path in queue_dir.iterdir():
+            if not path.is_dir():
+                continue
+            saved = state["queues"].get(path.name)
+            if saved is None:
+                # Prioridad creada después del punto de control
+                shutil.rmtree(path)
+                continue
+            with Path(path, "q00000").open("ab") as chunk:
+                chunk.truncate(saved["bytes"])
+            _write_atomic(Path(path, "info.json"), json.dumps(saved["info"]).encode())
+        _write_atomic(Path(queue_dir, "active.json"), json.dumps([int(priority) for priority in state["queues"]]).encode())
+
+    if seen.exists():
+        with seen.open("ab") as f:
+            f.truncate(state["seen_bytes"])
+
+    logger.info(
+        f"Restored {jobdir} to its last checkpoint: {sum(q['info']['size'] for q in state['queues'].values())} "
+        f"queued and {len(state['inflight'])} in-flight requests"
+    )
+    return state["inflight"]
+
+
+class CheckpointScheduler(Scheduler):
+    """
+    Scheduler de Scrapy que guarda periódicamente un punto de control del rastreo en JOBDIR.
+
+    Cada FRONTIER_CHECKPOINT_INTERVAL segundos guarda, en un solo archivo escrito de forma atómica,
+    la posición de cada cola en disco, el tamaño de requests.seen.bin (sincronizado con fsync) y las
+    solicitudes en curso (descargándose o procesándose en la spider). Todo se toma en el mismo
+    instante del reactor, así que es consistente: lo que descubrieron las solicitudes terminadas
+    ya está en la cola, y lo que descubran las que estaban en curso se vuelve a descubrir al
+    pedirlas de nuevo. Al reanudar después de un cierre forzado se restaura con
+    restore_checkpoint(); al cerrar normalmente el archivo se borra y Scrapy reanuda con su
+    propio estado. Requiere CheckpointDiskQueue como SCHEDULER_DISK_QUEUE.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkpoint_interval = 30.0
+        self.inflight = []
+        self.checkpoint_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = job_dir(crawler.settings)
+        # Antes de crear el filtro de duplicados, que carga requests.seen.bin
+        inflight = restore_checkpoint(jobdir) if jobdir else []
+        scheduler = super().from_crawler(crawler)
+        scheduler.checkpoint_interval = crawler.settings.getfloat("FRONTIER_CHECKPOINT_INTERVAL", 30.0)
+        scheduler.inflight = inflight
+        return scheduler
+
+    def open(self, spider):
+        result = super().open(spider)
+        if self.dqs is None:
+            return result
+        if not isinstance(self.dqs, ScrapyPriorityQueue):
+            logger.warning(f"Crawl checkpoints need ScrapyPriorityQueue, not {type(self.dqs).__name__}")
+            return result
+
+        # Se vuelven a pedir aunque ya estén en requests.seen.bin
+        for request in self.inflight:
+            self.enqueue_request(request_from_dict(request, spider=spider).replace(dont_filter=True))
+        self.inflight = []
+
+        self.checkpoint()
+        if self.checkpoint_interval > 0:
+            self.checkpoint_task = task.LoopingCall(self.checkpoint)
+            self.checkpoint_task.start(self.checkpoint_interval, now=False)
+        return result
+
+    def close(self, reason):
+        if self.checkpoint_task and self.checkpoint_task.running:
+            self.checkpoint_task.stop()
+        result = super().close(reason)
+        if self.dqdir:
+            # Scrapy acaba de guardar el estado completo de la cola
+            Path(self.dqdir).parent.joinpath(CHECKPOINT_FILE).unlink(missing_ok=True)
+        return result
+
+    def checkpoint(self):
+        """
+        Guarda el punto de control del rastreo en JOBDIR.
+        """
+        queues = {}
+        for priority, queue in self.dqs.queues.items():
+            os.fsync(queue.headf.fileno())
+            queues[str(priority)] = {
+                "info": {**queue.info, "head": list(queue.info["head"]), "tail": list(queue.info["tail"])},
+                "bytes": os.fstat(queue.headf.fileno()).st_size,
+            }
+
+        inflight = []
+        engine = self.crawler.engine
+        for request in (engine.slot.inprogress if engine and engine.slot else ()):
+            try:
+                inflight.append(request.to_dict(spider=self.spider))
+            except ValueError:
+                # Solicitudes internas sin callback de la spider (robots.txt); tampoco irían a la cola en disco
+                continue
+
+        state = {"queues": queues, "seen_bytes": self.df.flush(), "inflight": inflight}
+        _write_atomic(Path(self.dqdir).parent.joinpath(CHECKPOINT_FILE), pickle.dumps(state, protocol=4))
+        self.stats.inc_value("scheduler/checkpoints", spider=self.spider)
@@ -21,20 +21,33 @@ USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTM
 ROBOTSTXT_OBEY = False
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-#CONCURRENT_REQUESTS = 32
-CONCURRENT_REQUESTS = 4
+# Es el tope global; la concurrencia de cada farmacia la ajusta AdaptiveConcurrencyMiddleware
+CONCURRENT_REQUESTS = 32
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
 #DOWNLOAD_DELAY = 3
-RANDOMIZE_DOWNLOAD_DELAY = True
-DOWNLOAD_DELAY = 0  # Retraso mínimo de 1 segundo
-DOWNLOAD_DELAY_MAX = 2  # Retraso máximo de 3 segundos
+RANDOMIZE_DOWNLOAD_DELAY = True  # El retraso real varía entre 0.5 y 1.5 veces DOWNLOAD_DELAY
+DOWNLOAD_DELAY = 0
 
-# The download delay setting will honor only one of:
+# Concurrencia inicial de cada dominio. Los slots de descarga son por dominio (no por IP) para que
+# AdaptiveConcurrencyMiddleware ajuste cada farmacia por separado
 CONCURRENT_REQUESTS_PER_DOMAIN = 4
-CONCURRENT_REQUESTS_PER_IP = 4
+CONCURRENT_REQUESTS_PER_IP = 0
+
+# Control adaptativo de concurrencia y retraso por dominio (ver AdaptiveConcurrencyMiddleware): cada
+# ADAPTIVE_CONCURRENCY_WINDOW respuestas (o ADAPTIVE_CONCURRENCY_INTERVAL segundos) sube la concurrencia si el dominio responde bien y la baja (y aumenta
+# el retraso) ante respuestas 429/503, errores o aumento de la latencia, dentro de estos límites
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_CONCURRENCY_MAX = 16
+ADAPTIVE_DELAY_MIN = 0
+ADAPTIVE_DELAY_MAX = 10  # Segundos
+ADAPTIVE_CONCURRENCY_WINDOW = 20  # Respuestas por decisión
+ADAPTIVE_CONCURRENCY_INTERVAL = 10  # Segundos máximos entre decisiones
+ADAPTIVE_CONCURRENCY_ERROR_RATE = 0.05  # Tasa de errores que se considera sobrecarga
+ADAPTIVE_CONCURRENCY_LATENCY_FACTOR = 2.0  # Latencia media / mejor latencia que se considera saturación
 
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
@@ -53,18 +66,79 @@ CONCURRENT_REQUESTS_PER_IP = 4
 #SPIDER_MIDDLEWARES = {
 #    "medifacil_backend.middlewares.MedifacilBackendSpiderMiddleware": 543,
 #}
+SPIDER_MIDDLEWARES = {
+    "medifacil_backend.middlewares.MedifacilBackendSpiderMiddleware": 543,
+    "medifacil_backend.middlewares.DuplicateListingMiddleware": 544,
+    "medifacil_backend.middlewares.IncrementalSpiderMiddleware": 545,
+}
+
+# Canonicalización y filtro de los enlaces que siguen las spiders (ver MedifacilBackendSpiderMiddleware).
+# Los parámetros de URL_IGNORED_QUERY_PARAMS se quitan de todos los enlaces; cada spider puede agregar
+# los suyos con el atributo `ignored_query_params`.
+URL_FILTER_ENABLED = True
+URL_IGNORED_QUERY_PARAMS = [
+    "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "gclid", "fbclid",
+]
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #DOWNLOADER_MIDDLEWARES = {
 #    "medifacil_backend.middlewares.MedifacilBackendDownloaderMiddleware": 543,
 #}
+# IncrementalDownloaderMiddleware va entre HttpCompressionMiddleware (590) y MetaRefreshMiddleware (580)
+# para calcular el hash sobre el cuerpo ya descomprimido
+# AdaptiveConcurrencyMiddleware va junto al descargador para ver las respuestas 429/5xx antes que RetryMiddleware (550)
+DOWNLOADER_MIDDLEWARES = {
+    "medifacil_backend.middlewares.IncrementalDownloaderMiddleware": 585,
+    "medifacil_backend.middlewares.AdaptiveConcurrencyMiddleware": 950,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
 #    "scrapy.extensions.telnet.TelnetConsole": None,
 #}
+EXTENSIONS = {
+    "medifacil_backend.extensions.MemoryWatchdog": 500,
+}
+
+# Pausa el rastreo mientras la memoria residente supera MEMORY_WATCHDOG_LIMIT_MB y lo reanuda al bajar de
+# MEMORY_WATCHDOG_RESUME_RATIO veces el límite (ver MemoryWatchdog). Con 0 se usa el 75% de MEMUSAGE_LIMIT_MB.
+# Si tras MEMORY_WATCHDOG_GRACE segundos sin trabajo en curso la memoria no baja, se reanuda con un umbral mayor.
+MEMORY_WATCHDOG_ENABLED = False
+MEMORY_WATCHDOG_LIMIT_MB = 0
+MEMORY_WATCHDOG_RESUME_RATIO = 0.85
+MEMORY_WATCHDOG_INTERVAL = 2  # Segundos
+MEMORY_WATCHDOG_GRACE = 5  # Segundos
+
+# Perfil de memoria acotada para servidores con menos de 2 GB de RAM: `python app_scraper.py --low-memory ...`
+# aplica estos valores sobre los anteriores. app_scraper.py ya guarda la cola de solicitudes en disco (JOBDIR).
+LOW_MEMORY_SETTINGS = {
+    # Avisa en el log si alguna solicitud no se puede guardar en la cola en disco y queda en memoria
+    "SCHEDULER_DEBUG": True,
+    "CONCURRENT_REQUESTS": 8,
+    "ADAPTIVE_CONCURRENCY_MAX": 4,
+    # Bytes de respuestas que se procesan a la vez en los callbacks (por defecto 5 MB): limita cuántos
+    # cuerpos y árboles HTML de listados grandes hay en memoria al mismo tiempo
+    "SCRAPER_SLOT_MAX_ACTIVE_SIZE": 1024 * 1024,
+    "POSTGRES_QUEUE_SIZE": 500,
+    "REACTOR_THREADPOOL_MAXSIZE": 4,
+    "DNSCACHE_SIZE": 1000,
+    "MEMUSAGE_ENABLED": True,
+    "MEMUSAGE_LIMIT_MB": 512,
+    "MEMORY_WATCHDOG_ENABLED": True,
+}
+
+# Perfil de actualización de precios: `python app_scraper.py --refresh ...` pide directamente las páginas de los
+# productos ya guardados (sin listados ni enlaces que seguir), así que admite más concurrencia por tienda.
+# Con --low-memory se aplica primero este perfil y luego el de memoria acotada.
+REFRESH_SETTINGS = {
+    "DISCOVERY_MODE": "refresh",
+    "CONCURRENT_REQUESTS": 64,
+    "CONCURRENT_REQUESTS_PER_DOMAIN": 16,
+    "ADAPTIVE_CONCURRENCY_MAX": 32,
+}
+REFRESH_FETCH_SIZE = 2000  # URLs que se leen de la base de datos por viaje del cursor
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -93,12 +167,64 @@ CONCURRENT_REQUESTS_PER_IP = 4
 #HTTPCACHE_IGNORE_HTTP_CODES = []
 #HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
 
+# Modo de rastreo incremental (ver IncrementalDownloaderMiddleware): solicitudes condicionales con ETag/Last-Modified
+# y hash del cuerpo por URL. Las páginas de producto sin cambios no se analizan ni se escriben en la base de datos.
+# Se activa también con `python app_scraper.py --incremental ...`
+INCREMENTAL_CRAWL_ENABLED = False
+INCREMENTAL_CACHE_DIR = "temp/incremental"
+INCREMENTAL_CACHE_MAX_ENTRIES = 200000  # URLs recordadas como máximo
+INCREMENTAL_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Bytes de cuerpos de listados comprimidos como máximo
+
+# Cómo descubren productos las spiders: "links" recorre los listados siguiendo enlaces y "sitemap" lee el sitemap
+# de la tienda y descarga solo las páginas de producto (si no hay sitemap se vuelve a "links"). "api" recorre el API
+# JSON de catálogo de VTEX en CrawlMedicity; las demás spiders lo tratan como "links". "freshness" no descubre productos:
+# vuelve a rastrear los ya guardados, los más urgentes primero, y "refresh" (REFRESH_SETTINGS) los actualiza todos
+# (ver FreshnessRecrawlMixin).
+# Se puede cambiar con `python app_scraper.py --discovery sitemap ...` o `scrapy crawl ... -a discovery=sitemap`
+DISCOVERY_MODE = "links"
+
+# Recorrido por frescura (DISCOVERY_MODE = "freshness"). Cada producto recibe un puntaje: la probabilidad de que haya
+# cambiado desde la última vez que se vio, según su tasa de cambios en price_history (con una tasa inicial de
+# FRESHNESS_PRIOR_CHANGES cambios cada FRESHNESS_PRIOR_DAYS días), multiplicada por su popularidad en /search durante
+# los últimos FRESHNESS_POPULARITY_DAYS días. Se piden los FRESHNESS_MAX_REQUESTS de mayor puntaje (0 = todos), repartidos
+# en FRESHNESS_PRIORITY_LEVELS prioridades de Scrapy. Se cambia con `app_scraper.py --max-requests` y `--time-budget`.
+FRESHNESS_MAX_REQUESTS = 0
+FRESHNESS_PRIORITY_LEVELS = 10
+FRESHNESS_PRIOR_CHANGES = 1.0
+FRESHNESS_PRIOR_DAYS = 30.0
+FRESHNESS_POPULARITY_WEIGHT = 0.5
+FRESHNESS_POPULARITY_DAYS = 30
+SEARCH_POPULARITY_PATH = "temp/search_popularity.sqlite3"  # Lo escribe /search (variable SEARCH_POPULARITY_PATH del servidor)
+
+# Páginas con productos de cada listado, aprendidas en la ejecución anterior (ver AdaptivePaginationMixin). Los listados
+# se paginan hasta la primera página sin productos nuevos; las páginas aprendidas se piden de una vez al iniciar.
+PAGINATION_STATE_PATH = "temp/pagination.sqlite3"
+
+# Corta la paginación de los listados cuyas páginas repiten productos ya vistos, como las variantes de orden
+# (?order=) de una misma categoría o las tiendas que corren los productos de una página a otra
+# (ver DuplicateListingMiddleware). DUPLICATE_LISTING_OVERLAP es la parte repetida de una página que corta la cadena.
+DUPLICATE_LISTING_ENABLED = True
+DUPLICATE_LISTING_OVERLAP = 0.9
+
 # Set settings whose default value is deprecated to a future-proof value
 
 # Versión de la implementación de Request Fingerprinter a utilizar.
 # "2.7" indica que se está utilizando la implementación más reciente compatible con Scrapy 2.7.
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 
+# Filtro de duplicados con huellas compactas de 8 bytes, persistidas en JOBDIR/requests.seen.bin para poder reanudar.
+DUPEFILTER_CLASS = "medifacil_backend.dupefilters.CompactDupeFilter"
+
+# Scheduler que guarda cada FRONTIER_CHECKPOINT_INTERVAL segundos un punto de control del rastreo en JOBDIR
+# (posición de la cola en disco, URLs vistas y solicitudes en curso), para reanudar aunque el proceso muera sin cerrarse.
+SCHEDULER = "medifacil_backend.scheduler.CheckpointScheduler"
+SCHEDULER_DISK_QUEUE = "medifacil_backend.scheduler.CheckpointDiskQueue"
+FRONTIER_CHECKPOINT_INTERVAL = 30  # Segundos
+
+# Directorio raíz de los estados de rastreo (cola de solicitudes en disco y URLs vistas). app_scraper.py usa
+# un JOBDIR por spider dentro de este directorio para reanudar un rastreo interrumpido; se borra al terminar bien.
+CRAWL_JOBS_DIR = "temp/jobs"
+
 # Configuración del reactor Twisted para usar con asyncio.
 # "twisted.internet.asyncioreactor.AsyncioSelectorReactor" permite que Scrapy funcione con el loop de eventos asyncio.
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
@@ -114,4 +240,15 @@ ITEM_PIPELINES = {
     'medifacil_backend.pipelines.PostgresPipeline': 300,
 }
 
+# Cantidad de items que PostgresPipeline acumula antes de escribirlos en un solo INSERT de varias filas y un solo commit.
+# Con 1 cada item se escribe (y se confirma) apenas llega.
+POSTGRES_BATCH_SIZE = 500
+
+# Segundos máximos que un item puede esperar en el buffer antes de escribir el lote, aunque no esté completo.
+POSTGRES_FLUSH_INTERVAL = 10
+
+# Máximo de filas en espera entre el reactor y el hilo escritor de PostgresPipeline.
+# Cuando se llena, el pipeline aplica contrapresión y Scrapy deja de procesar items hasta que haya espacio.
+POSTGRES_QUEUE_SIZE = 2000
+
 LOG_LEVEL = 'DEBUG'
\ No newline at end of file
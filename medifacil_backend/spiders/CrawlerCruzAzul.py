@@ -1,37 +1,61 @@
-import scrapy
-import json
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.linkextractors import LinkExtractor
-from scrapy.loader import ItemLoader
-from itemloaders.processors import TakeFirst
 from datetime import datetime
 import logging
 
 
-from medifacil_backend.items import MedicineItem
+from medifacil_backend.discovery import SitemapDiscoveryMixin
+from medifacil_backend.extraction import FieldExtractor, build_item
+from medifacil_backend.freshness import FreshnessRecrawlMixin
+from medifacil_backend.pagination import AdaptivePaginationMixin
 
 
 # URL base para la farmacia Cruz Azul
 base_url_minimal = "https://farmaciascruzazul.ec"
 
 
-class CrawlCruzAzul(CrawlSpider):
+class CrawlCruzAzul(FreshnessRecrawlMixin, AdaptivePaginationMixin, SitemapDiscoveryMixin, CrawlSpider):
     """
     Spider que rastrea y extrae información de productos de la farmacia Cruz Azul.
     Utiliza reglas para seguir enlaces y procesar páginas específicas de productos.
     """
     name = "crawl_cruz_azul"  # Nombre de la araña
+    pharma = "CruzAzul"  # Nombre de la farmacia en public.pharmas
     base_url = f"{base_url_minimal}/medicina"
 
-    # URLs a rastrear
-    urls = [
-        f"{base_url_minimal}/medicina?pagenumber={i}" for i in range(1, 30)
+    # Listados a rastrear; se paginan con ?pagenumber= hasta la última página con productos (ver AdaptivePaginationMixin)
+    listings = [
+        f"{base_url_minimal}/medicina"
     ]
+    page_param = "pagenumber"
 
     allowed_domains = [
         base_url_minimal.split("//")[-1]  # Dominio permitido para el rastreo
     ]
 
+    # Sitemaps para el modo de descubrimiento por sitemap (ver SitemapDiscoveryMixin)
+    sitemap_urls = [
+        f"{base_url_minimal}/robots.txt",
+        f"{base_url_minimal}/sitemap.xml",
+    ]
+
+    # Tamaño máximo de una respuesta de esta tienda: las más grandes se cancelan en vez de quedar completas
+    # en memoria (el valor por defecto de Scrapy es 1 GB). Los sitemaps usan su propio límite (SITEMAP_MAX_SIZE)
+    download_maxsize = 3 * 1024 * 1024
+    download_warnsize = 3 * 1024 * 1024 // 2
+
+    # URLs de páginas de producto y de listado; MedifacilBackendSpiderMiddleware descarta los demás enlaces
+    item_url_pattern = r"^https?:\/\/w?w?w?\.?farmaciascruzazul\.ec\/[a-zA-Z0-9\-\_]+.*\d{1,}$"
+    page_url_pattern = r"^https?:\/\/w?w?w?\.?farmaciascruzazul\.ec(?:\/[a-zA-Z0-9\-\_.]+)+\/?$"
+
+    # Selectores de la página de producto, compilados una sola vez
+    item_fields = FieldExtractor(
+        name='div.ps-product__title a::text',
+        price='div.ps-product__meta span.ps-product__price::text',
+        url_image='div.ps-product__thumbnail img::attr(src)',
+        in_stock='div.ps-product__badge span.ps-badge--instock::text'
+    )
+
     # Reglas para seguir enlaces y llamar a callbacks específicos
     rules = (
 
@@ -39,7 +63,7 @@ class CrawlCruzAzul(CrawlSpider):
             LinkExtractor(
                 allow_domains=allowed_domains,
                 allow=(
-                    r"^https?:\/\/w?w?w?\.?farmaciascruzazul\.ec\/[a-zA-Z0-9\-\_]+.*\d{1,}$"
+                    item_url_pattern,
                 )
             ),
             callback='parse_item'  # Llama a parse_item para las URLs que coinciden
@@ -49,7 +73,7 @@ class CrawlCruzAzul(CrawlSpider):
             LinkExtractor(
                 allow_domains=allowed_domains,
                 allow=(
-                    r"^https?:\/\/w?w?w?\.?farmaciascruzazul\.ec\/[a-zA-Z0-9\-\_.]+$"
+                    page_url_pattern,
                 )
             ),
             callback='parse_page'  # Llama a parse_page para las URLs que coinciden
@@ -65,12 +89,11 @@ class CrawlCruzAzul(CrawlSpider):
         super(CrawlCruzAzul, self).__init__(*a, **kw)
 
 
-    def start_requests(self):
+    def link_requests(self):
         """
-        Inicia las solicitudes a las URLs especificadas en self.urls.
+        Solicitudes iniciales del descubrimiento por enlaces: las páginas de los listados de self.listings.
         """
-        for url in self.urls:
-            yield scrapy.Request(url, callback=self.parse_page)
+        yield from self.listing_requests()
 
 
     def parse_page(self, response):
@@ -82,7 +105,7 @@ class CrawlCruzAzul(CrawlSpider):
         """
 
         for u in response.css("a::attr(href)").getall():
-            u = u.lower().strip()
+            u = u.strip()
             if u == '/':
                 continue
 
@@ -100,37 +123,21 @@ class CrawlCruzAzul(CrawlSpider):
         """
 
         url = response.request.url
-        item_loader = ItemLoader(item=MedicineItem(), selector=response)
-        item_loader.default_output_processor = TakeFirst()
 
         try:
-            # Extrae la información del producto utilizando selectores CSS
-            name = response.css('div.ps-product__title a::text').get()
-            price = response.css('div.ps-product__meta span.ps-product__price::text').get()
-            url_image = response.css('div.ps-product__thumbnail img::attr(src)').get()
-            availability = 'Available' if response.css('div.ps-product__badge span.ps-badge--instock::text').get() is not None else 'No available'
-
-            if url_image is None:
-                url_image = ''
-
-            if availability is None:
-                availability = ''
-
-            data = {
-                'url': url,
-                'pharma': 'CruzAzul',
-                'name': name,
-                'price': price,
-                'url_image': str(url_image),
-                'availability': availability,
-                'ingest_date': str(datetime.now().date())
-            }
-
-            for key, value in data.items():
-                item_loader.add_value(key, value)
-
-            item = item_loader.load_item()
-            yield item
+            # Extrae la información del producto con los selectores precompilados de item_fields
+            fields = self.item_fields.extract(response)
+            availability = 'Available' if fields['in_stock'] is not None else 'No available'
+
+            yield build_item(
+                url=url,
+                pharma=self.pharma,
+                name=fields['name'],
+                price=fields['price'],
+                url_image=fields['url_image'] or '',
+                availability=availability,
+                ingest_date=str(datetime.now().date())
+            )
 
         except Exception as error:
             logging.error(f"Error parsing item: {error}")
@@ -1,27 +1,27 @@
 import scrapy
-import json
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.linkextractors import LinkExtractor
-from scrapy.loader import ItemLoader
-from itemloaders.processors import TakeFirst
 from datetime import datetime
 import logging
 
 
-from medifacil_backend.items import MedicineItem
+from medifacil_backend.discovery import SitemapDiscoveryMixin
+from medifacil_backend.extraction import FieldExtractor, build_item, json_ld
+from medifacil_backend.freshness import FreshnessRecrawlMixin
 
 
 # URL base para la farmacia Fybeca
 base_url_minimal = "https://www.fybeca.com"
 
 
-class CrawlFybeca(CrawlSpider):
+class CrawlFybeca(FreshnessRecrawlMixin, SitemapDiscoveryMixin, CrawlSpider):
     """
     Spider que rastrea y extrae información de productos de la farmacia Fybeca.
     Utiliza reglas para seguir enlaces y procesar páginas específicas de productos.
     """
 
     name = "crawl_fybeca"  # Nombre de la araña
+    pharma = "Fybeca"  # Nombre de la farmacia en public.pharmas
 
     base_url = f"{base_url_minimal}"
 
@@ -35,6 +35,29 @@ class CrawlFybeca(CrawlSpider):
         base_url_minimal.split("//")[-1]  # Dominio permitido para el rastreo
     ]
 
+    # Sitemaps para el modo de descubrimiento por sitemap (ver SitemapDiscoveryMixin)
+    sitemap_urls = [
+        f"{base_url_minimal}/robots.txt",
+        f"{base_url_minimal}/sitemap_index.xml",
+    ]
+
+    # Tamaño máximo de una respuesta de esta tienda: las más grandes se cancelan en vez de quedar completas
+    # en memoria (el valor por defecto de Scrapy es 1 GB). Los sitemaps usan su propio límite (SITEMAP_MAX_SIZE)
+    download_maxsize = 3 * 1024 * 1024
+    download_warnsize = 3 * 1024 * 1024 // 2
+
+    # URLs de páginas de producto y de listado; MedifacilBackendSpiderMiddleware descarta los demás enlaces
+    item_url_pattern = r"^https://www\.fybeca\.com/[a-zA-Z0-9\-.]+/[A-Z]+_[0-9]+\.html$"
+    page_url_pattern = r"^https?:\/\/www\.fybeca\.com(?:\/[a-zA-Z0-9\-.]+)+\/?$"
+
+    # Selectores de respaldo de la página de producto cuando falta el JSON-LD, compilados una sola vez
+    item_fields = FieldExtractor(
+        name='h1::text',
+        price='.price .value::attr(content)',
+        url_image='img.product-image::attr(src)',
+        availability='.availability::text'
+    )
+
     # Reglas para seguir enlaces y llamar a callbacks específicos
     rules = (
 
@@ -42,7 +65,7 @@ class CrawlFybeca(CrawlSpider):
             LinkExtractor(
                 allow_domains=allowed_domains,
                 allow=(
-                    r"^https?:\/\/www\.fybeca\.com\/[a-zA-Z0-9\-.]+$"
+                    page_url_pattern,
                 )
             ),
             callback='parse_page'  # Llama a parse_page para las URLs que coinciden
@@ -52,7 +75,7 @@ class CrawlFybeca(CrawlSpider):
             LinkExtractor(
                 allow_domains=allowed_domains,
                 allow=(
-                    r"^https://www\.fybeca\.com/[a-zA-Z0-9\-.]+/[A-Z]+_[0-9]+\.html$"
+                    item_url_pattern,
                 )
             ),
             callback='parse_item'  # Llama a parse_item para las URLs que coinciden
@@ -68,9 +91,9 @@ class CrawlFybeca(CrawlSpider):
         super(CrawlFybeca, self).__init__(*a, **kw)
 
 
-    def start_requests(self):
+    def link_requests(self):
         """
-        Inicia las solicitudes a las URLs especificadas en self.urls.
+        Solicitudes iniciales del descubrimiento por enlaces: las URLs especificadas en self.urls.
         """
         for url in self.urls:
             yield scrapy.Request(url, callback=self.parse_page)
@@ -85,8 +108,6 @@ class CrawlFybeca(CrawlSpider):
         """
 
         for u in response.css("a::attr(href)").getall():
-            u = u.lower()
-
             if u.startswith("http"):
                 yield response.follow(u)
             elif u.startswith("/"):
@@ -103,41 +124,32 @@ class CrawlFybeca(CrawlSpider):
 
         url = response.request.url
 
-        item_loader = ItemLoader(item=MedicineItem(), selector=response)
-        item_loader.default_output_processor = TakeFirst()
-
         try:
-            # Extrae datos del producto utilizando JSON-LD y selectores CSS/XPath
-            product_data = response.xpath('//script[@type="application/ld+json"]/text()').get()
-            product_json = json.loads(product_data) if product_data else {}
-            name = product_json.get('name') or response.xpath('//h1/text()').get()
-            price = product_json.get('offers', {}).get('price') or response.css('.price .value::attr(content)').get()  # first option
-
-            url_image = (product_json.get('image', [])[0] if product_json.get('image') else response.css('img.product-image::attr(src)').get())
-
-            availability = product_json.get('offers', {}).get('availability') or response.css('.availability::text').get()
-
-            if url_image is None:
-                url_image = ''
-
-            if availability is None:
-                availability = ''
-
+            # Extrae datos del producto del JSON-LD; los selectores de item_fields son el respaldo
+            product_json = json_ld(response)
+            offers = product_json.get('offers', {})
+            images = product_json.get('image')
             data = {
-                'url': url,
-                'pharma': 'Fybeca',
-                'name': name,
-                'price': price,
-                'url_image': str(url_image),
-                'availability': availability,
-                'ingest_date': str(datetime.now().date())
+                'name': product_json.get('name'),
+                'price': offers.get('price'),  # first option
+                'url_image': images[0] if images else None,
+                'availability': offers.get('availability'),
             }
 
-            for key, value in data.items():
-                item_loader.add_value(key, value)
-
-            item = item_loader.load_item()
-            yield item
+            # Solo se evalúan los selectores de los campos que faltan en el JSON-LD
+            missing = [field for field, value in data.items() if not value]
+            if missing:
+                data.update(self.item_fields.extract(response, missing))
+
+            yield build_item(
+                url=url,
+                pharma=self.pharma,
+                name=data['name'],
+                price=data['price'],
+                url_image=str(data['url_image'] or ''),
+                availability=data['availability'] or '',
+                ingest_date=str(datetime.now().date())
+            )
 
         except Exception as error:
             logging.error(f"Error parsing item: {error}")
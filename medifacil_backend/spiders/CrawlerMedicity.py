@@ -2,36 +2,112 @@ import scrapy
 import json
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.linkextractors import LinkExtractor
-from scrapy.loader import ItemLoader
-from itemloaders.processors import TakeFirst
 from datetime import datetime
+from urllib.parse import urlencode
 import logging
 
+import psycopg2
 
-from medifacil_backend.items import MedicineItem
+from medifacil_backend import vtex
+from medifacil_backend.db import connection_params
+from medifacil_backend.discovery import DISCOVERY_API, SitemapDiscoveryMixin
+from medifacil_backend.extraction import FieldExtractor, build_item
+from medifacil_backend.freshness import FreshnessRecrawlMixin
+from medifacil_backend.pagination import AdaptivePaginationMixin
 
 
 # URL base para la farmacia Medicity
 base_url_minimal = "https://www.farmaciasmedicity.com"
 
 
-class CrawlMedicity(CrawlSpider):
+class CrawlMedicity(FreshnessRecrawlMixin, AdaptivePaginationMixin, SitemapDiscoveryMixin, CrawlSpider):
     """
     Spider que rastrea y extrae información de productos de la farmacia Medicity.
     Utiliza reglas para seguir enlaces y procesar páginas específicas de productos.
     """
 
     name = "crawl_medicity"  # Nombre de la araña
+    pharma = "Medicity"  # Nombre de la farmacia en public.pharmas
 
     base_url = f"{base_url_minimal}/medicina"
 
-    urls = [f"{base_url_minimal}/medicina?page={i}" for i in range(1, 50)] + [base_url_minimal]
+    urls = [base_url_minimal]
+
+    # Listados a rastrear; se paginan con ?page= hasta la última página con productos (ver AdaptivePaginationMixin)
+    listings = list(dict.fromkeys(f"{base_url_minimal}/{path.lstrip('/')}" for path in [
+        '/medicina',
+        '/especialidad',
+        '/medicina?order=',
+        '/dermocosmetica?order=',
+        'cuidado-infantil-y-mama?order=',
+        '/bienestar-y-nutricion/vitaminas-adultos?order=',
+        '/belleza?order=',
+        '/cuidado-personal?order=',
+        '/cuidado-infantil-y-mama?order=OrderByBestDiscountDESC',
+        '/bienestar-y-nutricion?order=OrderByBestDiscountDESC',
+        '/dermocosmetica?order=OrderByBestDiscountDESC',
+        '/medicina?order=OrderByBestDiscountDESC',
+        '/139?map=productClusterIds&order=OrderByBestDiscountDESC',
+        '/especialidad',
+        '/piel%20grasa?_q=piel%20grasa&map=ft',
+        '/antiedad?_q=antiedad&map=ft',
+        '/pigmentos?_q=pigmentos&map=ft',
+        '/eucerin?_q=eucerin&map=ft',
+        '/la%20roche?_q=la%20roche&map=ft',
+        '/bioderma?_q=bioderma&map=ft',
+        '/redoxon?_q=redoxon&map=ft',
+        '/pediasure?_q=pediasure&map=ft'
+    ]))
+    max_pages = 50  # Tope de seguridad por listado
 
 
     allowed_domains = [
         base_url_minimal.split("//")[-1]  # Dominio permitido para el rastreo
     ]
 
+    # Sitemaps para el modo de descubrimiento por sitemap (ver SitemapDiscoveryMixin)
+    sitemap_urls = [
+        f"{base_url_minimal}/robots.txt",
+        f"{base_url_minimal}/sitemap.xml",
+    ]
+
+    # Tamaño máximo de una respuesta de esta tienda: las más grandes se cancelan en vez de quedar completas
+    # en memoria (el valor por defecto de Scrapy es 1 GB). Es mayor que en las otras tiendas porque VTEX incluye
+    # el estado de la tienda en cada página y el API de catálogo devuelve 50 productos por página
+    download_maxsize = 6 * 1024 * 1024
+    download_warnsize = 6 * 1024 * 1024 // 2
+
+    # URLs de páginas de producto y de listado; MedifacilBackendSpiderMiddleware descarta los demás enlaces
+    item_url_pattern = r"^https://w?w?w?\.?farmaciasmedicity\.com/[a-zA-Z0-9\-.]+/p$"
+    page_url_pattern = r"^https?:\/\/w?w?w?\.?farmaciasmedicity\.com(?:\/[a-zA-Z0-9\-.]+)+\/?$"
+
+    # Parámetros que solo cambian el orden de un listado; se quitan de los enlaces seguidos
+    ignored_query_params = ['order']
+
+    # Profundidad del árbol de categorías que se pide al API de catálogo (modo DISCOVERY_API)
+    api_category_depth = 3
+
+    # Disponibilidad de los productos disponibles en modo DISCOVERY_API cuando la base todavía no tiene
+    # la que guardó el modo HTML (ver stored_in_stock_text)
+    in_stock_text = "Disponible"
+
+    # Texto más frecuente de availability de la farmacia, sin los productos retirados (GONE_SQL)
+    IN_STOCK_TEXT_QUERY = """
+        SELECT availability FROM public.medicines
+        WHERE pharma = %s AND availability <> '' AND availability <> 'No available'
+        GROUP BY availability ORDER BY count(*) DESC LIMIT 1
+    """
+
+    # Selectores de la página de producto, compilados una sola vez
+    item_fields = FieldExtractor(
+        name='div.vtex-flex-layout-0-x-flexCol--right-col h1.vtex-store-components-3-x-productNameContainer span.vtex-store-components-3-x-productBrand::text',
+        currency_integer='span.vtex-product-price-1-x-currencyInteger::text',
+        currency_decimal='span.vtex-product-price-1-x-currencyDecimal::text',
+        currency_fraction='span.vtex-product-price-1-x-currencyFraction::text',
+        url_image='img.vtex-store-components-3-x-imageElement::attr(src)',
+        availability='div.vtex-product-availability-0-x-container span.vtex-product-availability-0-x-highStockText::text'
+    )
+
     # Reglas para seguir enlaces y llamar a callbacks específicos
     rules = (
 
@@ -39,7 +115,7 @@ class CrawlMedicity(CrawlSpider):
             LinkExtractor(
                 allow_domains=allowed_domains,
                 allow=(
-                    r"^https://w?w?w?\.?farmaciasmedicity\.com/[a-zA-Z0-9\-.]+/p$"
+                    item_url_pattern,
                 )
             ),
             callback='parse_item'  # Llama a parse_item para las URLs que coinciden
@@ -48,7 +124,7 @@ class CrawlMedicity(CrawlSpider):
             LinkExtractor(
                 allow_domains=allowed_domains,
                 allow=(
-                    r"^https?:\/\/w?w?w?\.?farmaciasmedicity\.com\/[a-zA-Z0-9\-.]+$"
+                    page_url_pattern,
                 )
             ),
             callback='parse_page'  # Llama a parse_page para las URLs que coinciden
@@ -66,43 +142,146 @@ class CrawlMedicity(CrawlSpider):
 
     def start_requests(self):
         """
-        Inicia las solicitudes a las URLs especificadas en self.urls.
-        """
-
-        extra_urls = [
-            '/especialidad',
-            '/medicina?order=',
-            '/dermocosmetica?order=',
-            'cuidado-infantil-y-mama?order=',
-            '/bienestar-y-nutricion/vitaminas-adultos?order=',
-            '/belleza?order=',
-            '/cuidado-personal?order=',
-            '/cuidado-infantil-y-mama?order=OrderByBestDiscountDESC',
-            '/bienestar-y-nutricion?order=OrderByBestDiscountDESC',
-            '/dermocosmetica?order=OrderByBestDiscountDESC',
-            '/medicina?order=OrderByBestDiscountDESC',
-            '/139?map=productClusterIds&order=OrderByBestDiscountDESC',
-            '/especialidad',
-            '/piel%20grasa?_q=piel%20grasa&map=ft',
-            '/antiedad?_q=antiedad&map=ft',
-            '/pigmentos?_q=pigmentos&map=ft',
-            '/eucerin?_q=eucerin&map=ft',
-            '/la%20roche?_q=la%20roche&map=ft',
-            '/bioderma?_q=bioderma&map=ft',
-            '/redoxon?_q=redoxon&map=ft',
-            '/pediasure?_q=pediasure&map=ft'
-        ]
+        Inicia el rastreo según el modo de descubrimiento; en modo DISCOVERY_API recorre el API de catálogo de VTEX.
+        """
+        if self.discovery_mode() == DISCOVERY_API:
+            yield from self.api_requests()
+        else:
+            yield from super().start_requests()
+
+
+    def api_requests(self):
+        """
+        Solicitud inicial del modo API: el árbol de categorías del catálogo.
+        """
+        self._api_products = set()
+        self._in_stock_text = self.stored_in_stock_text()
+        url = f"{base_url_minimal}{vtex.CATEGORY_TREE_PATH.format(depth=self.api_category_depth)}"
+        # Las respuestas JSON no pasan por el modo incremental: cada página mezcla muchos productos
+        yield scrapy.Request(
+            url,
+            callback=self.parse_category_tree,
+            errback=self.api_failed,
+            meta={'incremental_skip': True}
+        )
+
+
+    def stored_in_stock_text(self):
+        """
+        Devuelve el texto de disponibilidad que el modo HTML guardó para los productos disponibles
+        (el highStockText de la página), para escribir lo mismo desde el API de catálogo.
+
+        Returns:
+            str: El texto guardado, o in_stock_text si la base no tiene productos de la farmacia.
+        """
+        try:
+            connection = psycopg2.connect(**connection_params())
+        except (KeyError, psycopg2.Error) as error:
+            logging.warning(f"Could not read the stored availability of {self.pharma}: {error}")
+            return self.in_stock_text
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(self.IN_STOCK_TEXT_QUERY, (self.pharma, ))
+                row = cursor.fetchone()
+        finally:
+            connection.close()
+        return row[0] if row else self.in_stock_text
+
+
+    def _catalog_fallback(self, reason):
+        logging.warning(f"Catalog API failed ({reason}), falling back to link following")
+        self.crawler.stats.set_value('discovery/fallback', True)
+        yield from self.link_requests()
+
+
+    def api_failed(self, failure):
+        """
+        Si el API de catálogo no responde, vuelve al descubrimiento por enlaces.
+
+        Args:
+            failure (twisted.python.failure.Failure): El error de la solicitud.
+        """
+        yield from self._catalog_fallback(failure.getErrorMessage())
+
+
+    def _search_request(self, category_path, offset):
+        url = f"{base_url_minimal}{vtex.PRODUCT_SEARCH_PATH}?{urlencode(vtex.search_params(category_path, offset))}"
+        return scrapy.Request(
+            url,
+            callback=self.parse_search_page,
+            cb_kwargs={'category_path': category_path, 'offset': offset},
+            meta={'incremental_skip': True}
+        )
 
+
+    def parse_category_tree(self, response):
+        """
+        Procesa el árbol de categorías y pide la primera página de productos de cada categoría hoja.
+
+        Args:
+            response (scrapy.http.Response): La respuesta de la solicitud.
+        """
+        try:
+            paths = vtex.category_paths(json.loads(response.text))
+        except (ValueError, TypeError, KeyError, AttributeError) as error:
+            # Una página de error o de mantenimiento en lugar del JSON del árbol
+            yield from self._catalog_fallback(f"invalid category tree: {error}")
+            return
+        if not paths:
+            yield from self._catalog_fallback("empty category tree")
+            return
+
+        self.crawler.stats.set_value('vtex/categories', len(paths))
+        for category_path in paths:
+            # Con `-a shard=i/n` cada proceso recorre solo sus categorías
+            if self.in_shard(category_path):
+                yield self._search_request(category_path, 0)
+
+
+    def parse_search_page(self, response, category_path, offset):
+        """
+        Procesa una página de la búsqueda de productos de una categoría y construye los MedicineItem
+        directamente desde el JSON.
+
+        La primera página de cada categoría pide las páginas restantes según el total del
+        header `resources`; si no viene, se sigue paginando mientras las páginas lleguen llenas.
+
+        Args:
+            response (scrapy.http.Response): La respuesta de la solicitud.
+            category_path (str): Ruta de la categoría consultada.
+            offset (int): Posición del primer producto de la página.
+        """
+        products = json.loads(response.text)
+        self.crawler.stats.inc_value('vtex/pages')
+
+        for product in products:
+            data = vtex.product_data(product, self._in_stock_text)
+            if data is None or data['url'] is None or product.get('productId') in self._api_products:
+                continue
+            self._api_products.add(product.get('productId'))
+
+            yield build_item(pharma=self.pharma, ingest_date=str(datetime.now().date()), **data)
+
+        total = vtex.parse_resources(response.headers.get('resources', b'').decode())
+        if total is None:
+            if len(products) == vtex.PAGE_SIZE and offset + vtex.PAGE_SIZE < vtex.MAX_OFFSET:
+                yield self._search_request(category_path, offset + vtex.PAGE_SIZE)
+        elif offset == 0:
+            if total > vtex.MAX_OFFSET:
+                logging.warning(f"Category {category_path} has {total} products, only the first {vtex.MAX_OFFSET} are reachable")
+            for next_offset in range(vtex.PAGE_SIZE, min(total, vtex.MAX_OFFSET), vtex.PAGE_SIZE):
+                yield self._search_request(category_path, next_offset)
+
+
+    def link_requests(self):
+        """
+        Solicitudes iniciales del descubrimiento por enlaces: las URLs especificadas en self.urls y las
+        páginas de los listados de self.listings.
+        """
         for url in self.urls:
             yield scrapy.Request(url, callback=self.parse_page)
 
-        for extra_url in extra_urls:
-            base_url = f"{base_url_minimal}/{extra_url}"
-            # print(base_url)
-            urls_augmentation = [f"{base_url}&page={i}" for i in range(1, 50)] + [base_url]
-
-            for url_augmented in urls_augmentation:
-                yield scrapy.Request(url_augmented, callback=self.parse_page)
+        yield from self.listing_requests()
 
 
     def parse_page(self, response):
@@ -114,8 +293,6 @@ class CrawlMedicity(CrawlSpider):
         """
 
         for u in response.css("a::attr(href)").getall():
-            u = u.lower()
-
             if u.startswith("http"):
                 yield response.follow(u)
             elif u.startswith("/"):
@@ -131,47 +308,23 @@ class CrawlMedicity(CrawlSpider):
         """
 
         url = response.request.url
-        item_loader = ItemLoader(item=MedicineItem(), selector=response)
-        item_loader.default_output_processor = TakeFirst()
 
         try:
-            # Extrae la información del producto utilizando selectores CSS
-            
-            name = response.css('div.vtex-flex-layout-0-x-flexCol--right-col h1.vtex-store-components-3-x-productNameContainer span.vtex-store-components-3-x-productBrand::text').get()
-
-            currency_code = response.css('span.vtex-product-price-1-x-currencyCode::text').get()
-            currency_integer = response.css('span.vtex-product-price-1-x-currencyInteger::text').get()
-            currency_decimal = response.css('span.vtex-product-price-1-x-currencyDecimal::text').get()
-            currency_fraction = response.css('span.vtex-product-price-1-x-currencyFraction::text').get()
+            # Extrae la información del producto con los selectores precompilados de item_fields
+            fields = self.item_fields.extract(response)
 
             # Combina las partes del precio en una sola cadena
-            price = f"{currency_integer}{currency_decimal}{currency_fraction}"
-
-            url_image = response.css('img.vtex-store-components-3-x-imageElement::attr(src)').get()
-            availability = response.css('div.vtex-product-availability-0-x-container span.vtex-product-availability-0-x-highStockText::text').get()
-
-
-            if url_image is None:
-                url_image = ''
-
-            if availability is None:
-                availability = ''
-
-            data = {
-                'url': url,
-                'pharma': 'Medicity',
-                'name': name,
-                'price': price,
-                'url_image': str(url_image),
-                'availability': availability,
-                'ingest_date': str(datetime.now().date())
-            }
-
-            for key, value in data.items():
-                item_loader.add_value(key, value)
-
-            item = item_loader.load_item()
-            yield item
+            price = f"{fields['currency_integer']}{fields['currency_decimal']}{fields['currency_fraction']}"
+
+            yield build_item(
+                url=url,
+                pharma=self.pharma,
+                name=fields['name'],
+                price=price,
+                url_image=fields['url_image'] or '',
+                availability=fields['availability'] or '',
+                ingest_date=str(datetime.now().date())
+            )
 
         except Exception as error:
             logging.error(f"Error parsing item: {error}. URL: {url}")
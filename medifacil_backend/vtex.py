@@ -0,0 +1,101 @@
+import re
+
+
+# Rutas del API público de catálogo de VTEX
+CATEGORY_TREE_PATH = "/api/catalog_system/pub/category/tree/{depth}"
+PRODUCT_SEARCH_PATH = "/api/catalog_system/pub/products/search"
+
+# VTEX devuelve como máximo 50 productos por página y no pagina más allá de _from=2500
+PAGE_SIZE = 50
+MAX_OFFSET = 2500
+
+RESOURCES_PATTERN = re.compile(r"^\s*(\d+)-(\d+)/(\d+)\s*$")
+
+
+def category_paths(tree, prefix="/"):
+    """
+    Recorre el árbol de categorías y devuelve las rutas de las categorías hoja.
+
+    Se consultan solo las hojas porque VTEX no pagina más allá de MAX_OFFSET resultados:
+    una categoría padre grande quedaría incompleta, mientras que sus hojas suelen ser más pequeñas.
+
+    Args:
+        tree (list): JSON de CATEGORY_TREE_PATH.
+        prefix (str): Ruta de la categoría padre.
+
+    Returns:
+        list: Rutas para el filtro `fq=C:<ruta>`, por ejemplo "/1/15/".
+    """
+    paths = []
+    for category in tree:
+        path = f"{prefix}{category['id']}/"
+        children = category.get("children") or []
+        if children:
+            paths.extend(category_paths(children, path))
+        else:
+            paths.append(path)
+    return paths
+
+
+def search_params(category_path, offset, page_size=PAGE_SIZE):
+    """
+    Arma los parámetros de búsqueda de una página de productos de una categoría.
+
+    Returns:
+        dict: Parámetros de PRODUCT_SEARCH_PATH.
+    """
+    return {
+        "fq": f"C:{category_path}",
+        "_from": str(offset),
+        "_to": str(offset + page_size - 1),
+    }
+
+
+def parse_resources(header):
+    """
+    Lee el total de productos del header `resources` de una búsqueda (por ejemplo "0-49/1234").
+
+    Args:
+        header (str): Valor del header, o None si no vino.
+
+    Returns:
+        int: Total de productos, o None si el header no existe o no es válido.
+    """
+    match = RESOURCES_PATTERN.match(header or "")
+    return int(match.group(3)) if match else None
+
+
+def product_data(product, in_stock_text):
+    """
+    Extrae los datos de un producto del JSON de búsqueda de VTEX.
+
+    Se usa el primer SKU y su primer vendedor, que es lo que muestra la página del producto.
+    La disponibilidad se escribe igual que en el modo HTML, que guarda el texto de stock de la
+    página o '' si no aparece, para que cambiar de modo no cambie la huella de los productos.
+
+    Args:
+        product (dict): Un producto de la respuesta de PRODUCT_SEARCH_PATH.
+        in_stock_text (str): Disponibilidad de los productos disponibles.
+
+    Returns:
+        dict: url, name, price, url_image y availability, o None si el producto no tiene SKUs ni precio.
+    """
+    skus = product.get("items") or []
+    if not skus:
+        return None
+
+    sku = skus[0]
+    images = sku.get("images") or []
+    sellers = sku.get("sellers") or []
+    offer = sellers[0].get("commertialOffer", {}) if sellers else {}
+    if offer.get("Price") is None:
+        return None
+    available = offer.get("IsAvailable", offer.get("AvailableQuantity", 0) > 0)
+
+    return {
+        "url": product.get("link"),
+        "name": product.get("productName"),
+        "price": str(offer["Price"]),
+        "url_image": images[0].get("imageUrl", "") if images else "",
+        "availability": in_stock_text if available else "",
+    }
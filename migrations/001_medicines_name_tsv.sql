@@ -0,0 +1,22 @@
+-- Agrega la columna name_tsv (tsvector almacenado) a public.medicines con su propio índice GIN.
+--
+-- /search filtra y ordena por relevancia usando name_tsv, así que el vector ya no se recalcula
+-- por cada fila candidata. PostgresPipeline mantiene la columna en cada inserción/actualización.
+--
+-- Uso: psql -h <host> -U <usuario> -d <base> -f migrations/001_medicines_name_tsv.sql
+
+BEGIN;
+
+ALTER TABLE public.medicines ADD COLUMN IF NOT EXISTS name_tsv tsvector;
+
+-- Rellena la columna para las filas existentes
+UPDATE public.medicines
+SET name_tsv = to_tsvector('spanish', coalesce(name, ''))
+WHERE name_tsv IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_medicines_name_tsv ON public.medicines USING GIN(name_tsv);
+
+-- El índice por expresión anterior ya no lo usa ninguna consulta y solo encarece las escrituras
+DROP INDEX IF EXISTS idx_medicines_name;
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- Crea public.catalog_generation, un contador de una sola fila que PostgresPipeline incrementa
+-- al terminar cada ejecución del scraper. La caché de resultados de /search guarda la generación
+-- con cada entrada y descarta las entradas de generaciones anteriores.
+--
+-- Uso: psql -h <host> -U <usuario> -d <base> -f migrations/002_catalog_generation.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.catalog_generation (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    generation BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO public.catalog_generation (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,16 @@
+-- Agrega a public.medicines las columnas calculadas al ingerir: nombre base, cantidad del empaque
+-- y precio unitario. /search las lee directamente en lugar de analizar el nombre en cada solicitud.
+--
+-- Uso: psql -h <host> -U <usuario> -d <base> -f migrations/003_medicines_unit_price.sql
+-- Luego rellena las filas existentes con: python -m medifacil_backend.backfill
+
+BEGIN;
+
+ALTER TABLE public.medicines ADD COLUMN IF NOT EXISTS base_name TEXT;
+ALTER TABLE public.medicines ADD COLUMN IF NOT EXISTS pack_quantity INTEGER;
+ALTER TABLE public.medicines ADD COLUMN IF NOT EXISTS unit_price DECIMAL;
+
+-- Invalida la caché de resultados de /search, que guarda el formato anterior
+UPDATE public.catalog_generation SET generation = generation + 1, updated_at = now();
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- Agrega la huella de contenido de cada producto. PostgresPipeline la carga al iniciar cada spider
+-- y solo reescribe las filas cuyo nombre, precio, imagen o disponibilidad cambiaron; para las demás
+-- solo actualiza ingest_date.
+--
+-- Uso: psql -h <host> -U <usuario> -d <base> -f migrations/004_medicines_content_hash.sql
+-- Las filas existentes quedan sin huella y se reescriben una vez en la siguiente ejecución del scraper.
+
+ALTER TABLE public.medicines ADD COLUMN IF NOT EXISTS content_hash BIGINT;
@@ -0,0 +1,42 @@
+-- Historial de precios de solo inserción. Un trigger sobre public.medicines agrega una fila
+-- únicamente cuando un producto se crea o cambia su precio o su disponibilidad, así que el
+-- historial crece con los cambios y no con cada ejecución del scraper.
+--
+-- Uso: psql -h <host> -U <usuario> -d <base> -f migrations/005_price_history.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.price_history (
+    url TEXT NOT NULL,
+    price DECIMAL,
+    availability TEXT,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- /history lee la serie de cada producto en orden cronológico
+CREATE INDEX IF NOT EXISTS idx_price_history_url_changed_at ON public.price_history (url, changed_at);
+
+CREATE OR REPLACE FUNCTION public.record_price_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT'
+        OR NEW.price IS DISTINCT FROM OLD.price
+        OR NEW.availability IS DISTINCT FROM OLD.availability THEN
+        INSERT INTO public.price_history (url, price, availability, changed_at)
+        VALUES (NEW.url, NEW.price, NEW.availability, now());
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_medicines_price_history ON public.medicines;
+CREATE TRIGGER trg_medicines_price_history
+AFTER INSERT OR UPDATE OF price, availability ON public.medicines
+FOR EACH ROW EXECUTE PROCEDURE public.record_price_change();
+
+-- Punto de partida del historial: el precio actual de los productos que aún no tienen historial
+INSERT INTO public.price_history (url, price, availability, changed_at)
+SELECT m.url, m.price, m.availability, coalesce(m.ingest_date::timestamptz, now())
+FROM public.medicines m
+WHERE NOT EXISTS (SELECT 1 FROM public.price_history h WHERE h.url = m.url);
+
+COMMIT;
@@ -0,0 +1,219 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+from medifacil_backend.jobs import JobStore
+from medifacil_backend.refresh import RefreshQueue
+from medifacil_backend.spiders.CrawlerCruzAzul import CrawlCruzAzul
+from medifacil_backend.spiders.CrawlerFybeca import CrawlFybeca
+from medifacil_backend.spiders.CrawlerMedicity import CrawlMedicity
+
+# python scraper_daemon.py
+
+# Ejecuta en segundo plano los trabajos que encola /scraper, uno a la vez, con app_scraper.py.
+# Cuando no hay trabajos, actualiza los productos desactualizados que devolvió /search (ver RefreshQueue).
+# Se deja corriendo como servicio (ver "Daemon del scraper" en el README).
+
+load_dotenv(f"{os.getcwd()}/medifacil_backend/.env", override=True)
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+# Spider de cada farmacia, para actualizar los productos de la cola de actualización
+REFRESH_SPIDERS = {spider.pharma: spider.__name__ for spider in (CrawlFybeca, CrawlMedicity, CrawlCruzAzul)}
+
+
+class Stop(Exception):
+    """
+    Se lanza al recibir SIGTERM o SIGINT para detener el daemon.
+    """
+
+
+def handle_stop(signum, frame):
+    raise Stop(signal.Signals(signum).name)
+
+
+def scraper_args(job, workers):
+    """
+    Arma la línea de comandos de app_scraper.py para un trabajo.
+
+    Args:
+        job (dict): Trabajo de la cola.
+        workers (int): Procesos simultáneos del scraper.
+
+    Returns:
+        list: Argumentos del proceso.
+    """
+    # -u: sin buffer, para que el log del trabajo se pueda consultar mientras corre
+    args = [sys.executable, '-u', 'app_scraper.py', '--workers', str(workers), '--job-id', job['id']]
+    options = job['options']
+    if options.get('discovery'):
+        args += ['--discovery', options['discovery']]
+    if options.get('incremental'):
+        args.append('--incremental')
+    if options.get('low_memory'):
+        args.append('--low-memory')
+    if options.get('refresh'):
+        args.append('--refresh')
+    if options.get('max_requests'):
+        args += ['--max-requests', str(options['max_requests'])]
+    if options.get('time_budget'):
+        args += ['--time-budget', str(options['time_budget'])]
+    # Después de '--' los nombres nunca se leen como opciones
+    return args + ['--'] + job['spiders']
+
+
+def run_job(store, job, workers):
+    """
+    Ejecuta un trabajo y guarda su resultado. La salida de app_scraper.py queda en el log del trabajo.
+
+    Si el daemon se detiene mientras el trabajo corre, el scraper se termina y el trabajo vuelve
+    a la cola; al reanudarse, cada spider continúa desde su JOBDIR.
+
+    Args:
+        store (JobStore): Cola de trabajos.
+        job (dict): Trabajo tomado de la cola.
+        workers (int): Procesos simultáneos del scraper.
+    """
+    args = scraper_args(job, workers)
+    logging.info(f"Running scrape job {job['id']}: {' '.join(args[2:])}")
+    os.makedirs(store.logs_dir, exist_ok=True)
+
+    with open(store.log_path(job['id']), 'a') as log:
+        try:
+            scraper = subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT)
+        except OSError as e:
+            store.finish(job['id'], None, error=str(e))
+            return
+        store.set_pid(job['id'], scraper.pid)
+
+        try:
+            returncode = scraper.wait()
+        except Stop:
+            stop_scraper(scraper)
+            store.requeue(job['id'])
+            raise
+
+    store.finish(job['id'], returncode)
+
+
+def stop_scraper(scraper):
+    scraper.terminate()
+    try:
+        scraper.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        scraper.kill()
+
+
+def run_refresh(refresh_queue, products, log_path):
+    """
+    Actualiza un lote de la cola de actualización con `app_scraper.py --refresh --urls-file`, que
+    envía cada URL al `parse_item` de la spider de su farmacia. La salida queda en `log_path`
+    (solo la del último lote).
+
+    Si el daemon se detiene mientras el lote corre, sus URLs vuelven a la cola.
+
+    Args:
+        refresh_queue (RefreshQueue): Cola de actualización.
+        products (list): (url, farmacia) de las URLs tomadas de la cola.
+        log_path (str): Archivo de log del lote.
+    """
+    urls = [url for url, _ in products]
+    spiders = sorted({REFRESH_SPIDERS[pharma] for _, pharma in products if pharma in REFRESH_SPIDERS})
+    if not spiders:
+        refresh_queue.finish(urls)
+        return
+
+    with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as urls_file:
+        for url, pharma in products:
+            urls_file.write(json.dumps({'url': url, 'pharma': pharma}) + '\n')
+    args = [sys.executable, '-u', 'app_scraper.py', '--refresh', '--urls-file', urls_file.name] + spiders
+    logging.info(f"Refreshing {len(urls)} products requested by searches ({', '.join(spiders)})")
+
+    try:
+        with open(log_path, 'w') as log:
+            try:
+                scraper = subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT)
+            except OSError as e:
+                logging.error(f"Could not start the refresh of {len(urls)} products: {e}")
+                refresh_queue.finish(urls)
+                return
+            try:
+                returncode = scraper.wait()
+            except Stop:
+                stop_scraper(scraper)
+                refresh_queue.requeue(urls)
+                raise
+    finally:
+        os.remove(urls_file.name)
+
+    if returncode != 0:
+        logging.warning(f"Refresh of {len(urls)} products exited with code {returncode}, see {log_path}")
+    # Las URLs que fallaron no se reintentan ahora: una próxima búsqueda las vuelve a encolar al vencer el cooldown
+    refresh_queue.finish(urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the scrape jobs queued by /scraper.")
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=float(os.environ.get('SCRAPER_DAEMON_POLL_INTERVAL', 5)),
+        help='Seconds between checks of the job queue'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=int(os.environ.get('SCRAPER_WORKERS', 3)),
+        help='Processes per job (app_scraper.py --workers)'
+    )
+    parser.add_argument(
+        '--refresh-batch-size',
+        type=int,
+        default=int(os.environ.get('REFRESH_BATCH_SIZE', 200)),
+        help='Products of the refresh queue updated per scraper run'
+    )
+    parser.add_argument(
+        '--retention-days',
+        type=float,
+        default=float(os.environ.get('SCRAPER_JOBS_RETENTION_DAYS', 30)),
+        help='Days to keep finished jobs and their logs'
+    )
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    store = JobStore.from_env()
+    store.recover()
+    refresh_queue = RefreshQueue.from_env()
+    refresh_queue.recover()
+    logging.info(f"Scraper daemon started, queue {store.path}, refresh queue {refresh_queue.path}")
+
+    try:
+        while True:
+            store.prune(args.retention_days * 86400)
+            job = store.claim_next()
+            if job is not None:
+                run_job(store, job, args.workers)
+                continue
+            # Los trabajos de /scraper van primero; las actualizaciones pedidas por /search se hacen en los ratos libres
+            products = refresh_queue.claim(args.refresh_batch_size)
+            if products:
+                os.makedirs(store.logs_dir, exist_ok=True)
+                run_refresh(refresh_queue, products, os.path.join(store.logs_dir, 'refresh.log'))
+                continue
+            time.sleep(args.poll_interval)
+    except Stop as e:
+        logging.info(f"Scraper daemon stopped ({e})")
+
+
+if __name__ == '__main__':
+    main()
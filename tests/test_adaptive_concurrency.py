@@ -0,0 +1,162 @@
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import scrapy
+from scrapy.crawler import CrawlerRunner
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+from twisted.internet.error import TimeoutError
+from twisted.trial import unittest as trial_unittest
+
+from benchmarks.adaptive_concurrency_benchmark import StoreStandIn
+from medifacil_backend.middlewares import AdaptiveConcurrencyMiddleware
+
+SLOT = "www.fybeca.com"
+
+SETTINGS = {
+    "ADAPTIVE_CONCURRENCY_ENABLED": True,
+    "ADAPTIVE_CONCURRENCY_MIN": 1,
+    "ADAPTIVE_CONCURRENCY_MAX": 16,
+    "ADAPTIVE_DELAY_MIN": 0,
+    "ADAPTIVE_DELAY_MAX": 10,
+    "ADAPTIVE_CONCURRENCY_WINDOW": 4,
+    "ADAPTIVE_CONCURRENCY_INTERVAL": 3600,
+    "ADAPTIVE_CONCURRENCY_ERROR_RATE": 0.05,
+    "ADAPTIVE_CONCURRENCY_LATENCY_FACTOR": 2.0,
+}
+
+
+class AdaptiveDecisionTest(unittest.TestCase):
+    """
+    Decisiones del controlador AIMD con respuestas simuladas, sin red.
+    """
+
+    def middleware(self, concurrency=4, delay=0.0, **settings):
+        crawler = get_crawler(scrapy.Spider, {**SETTINGS, **settings})
+        self.slot = SimpleNamespace(concurrency=concurrency, delay=delay)
+        crawler.engine = mock.Mock()
+        crawler.engine.downloader.slots = {SLOT: self.slot}
+        self.spider = scrapy.Spider("fybeca")
+        self.stats = crawler.stats
+        return AdaptiveConcurrencyMiddleware.from_crawler(crawler)
+
+    def respond(self, middleware, status=200, latency=0.1, headers=None):
+        request = Request(f"https://{SLOT}/medicamentos", meta={"download_slot": SLOT, "download_latency": latency})
+        response = Response(request.url, status=status, headers=headers, request=request)
+        return middleware.process_response(request, response, self.spider)
+
+    def window(self, middleware, statuses=(200, 200, 200, 200), latency=0.1, headers=None):
+        for status in statuses:
+            self.respond(middleware, status, latency, headers if status != 200 else None)
+
+    def test_healthy_windows_ramp_up_additively(self):
+        middleware = self.middleware(concurrency=4)
+        for expected in (5, 6, 7):
+            self.window(middleware)
+            self.assertEqual(self.slot.concurrency, expected)
+        self.assertEqual(self.stats.get_value("adaptive/decisions"), 3)
+
+    def test_delay_is_reduced_before_concurrency_grows(self):
+        middleware = self.middleware(concurrency=4, delay=1.0)
+        self.window(middleware)
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (4, 0.5))
+
+    def test_throttling_halves_concurrency_and_honors_retry_after(self):
+        middleware = self.middleware(concurrency=8)
+        self.window(middleware, statuses=(200, 200, 200, 503), headers={"Retry-After": "3"})
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (4, 3.0))
+
+    def test_429_reduces_once_the_in_flight_requests_drained(self):
+        middleware = self.middleware(concurrency=2, ADAPTIVE_CONCURRENCY_WINDOW=20)
+        # Los 429 de solicitudes que ya estaban en curso no reducen dos veces
+        self.respond(middleware, 429, headers={"Retry-After": "2"})
+        self.assertEqual(self.slot.concurrency, 2)
+        self.respond(middleware, 429, headers={"Retry-After": "2"})
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (1, 2.0))
+
+    def test_latency_above_target_backs_off(self):
+        middleware = self.middleware(concurrency=4)
+        self.window(middleware, latency=0.1)
+        self.assertEqual(self.slot.concurrency, 5)
+        self.window(middleware, latency=0.5)
+        self.assertEqual(self.slot.concurrency, 4)
+
+    def test_connection_errors_count_as_errors(self):
+        middleware = self.middleware(concurrency=6)
+        request = Request(f"https://{SLOT}/medicamentos", meta={"download_slot": SLOT})
+        for _ in range(4):
+            middleware.process_exception(request, TimeoutError(), self.spider)
+        self.assertEqual(self.slot.concurrency, 3)
+
+    def test_bounds_are_respected(self):
+        middleware = self.middleware(concurrency=5, ADAPTIVE_CONCURRENCY_MAX=5)
+        self.window(middleware)
+        self.assertEqual(self.slot.concurrency, 5)
+
+        middleware = self.middleware(concurrency=3, ADAPTIVE_CONCURRENCY_MIN=2)
+        self.window(middleware, statuses=(503, 200, 200, 200), headers={"Retry-After": "60"})
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (2, 10.0))
+
+    def test_disabled(self):
+        crawler = get_crawler(scrapy.Spider, {**SETTINGS, "ADAPTIVE_CONCURRENCY_ENABLED": False})
+        with self.assertRaises(scrapy.exceptions.NotConfigured):
+            AdaptiveConcurrencyMiddleware.from_crawler(crawler)
+
+
+class StandInSpider(scrapy.Spider):
+    name = "stand_in"
+    pages = 0
+    base_url = None
+
+    def start_requests(self):
+        for page in range(self.pages):
+            yield scrapy.Request(f"{self.base_url}/p/{page}")
+
+    def parse(self, response):
+        pass
+
+
+class StandInServerTest(trial_unittest.TestCase):
+    """
+    Rastreo contra un servidor local con capacidad limitada, latencia según la carga y 429 con Retry-After.
+    """
+
+    timeout = 60
+
+    def setUp(self):
+        self.server = StoreStandIn(capacity=3, latency=0.01, latency_per_request=0.01, retry_after=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_adapts_to_the_capacity_of_the_server(self):
+        pages = 60
+        runner = CrawlerRunner({
+            **SETTINGS,
+            "ADAPTIVE_CONCURRENCY_WINDOW": 5,
+            "ADAPTIVE_DELAY_MAX": 0.2,
+            "CONCURRENT_REQUESTS_PER_DOMAIN": 12,
+            "DOWNLOADER_MIDDLEWARES": {"medifacil_backend.middlewares.AdaptiveConcurrencyMiddleware": 950},
+            "RETRY_TIMES": 10,
+            "LOG_LEVEL": "WARNING",
+            "REQUEST_FINGERPRINTER_IMPLEMENTATION": "2.7",
+        })
+        crawler = runner.create_crawler(StandInSpider)
+        base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+        def check(_):
+            stats = crawler.stats.get_stats()
+            concurrency = stats["adaptive/127.0.0.1/concurrency"]
+            # Empieza en 12 contra un servidor que atiende 3: baja hasta su capacidad y no pierde páginas
+            self.assertEqual(self.server.served, pages)
+            self.assertGreater(stats["adaptive/decisions"], 0)
+            self.assertLessEqual(concurrency, 4)
+            self.assertGreater(self.server.throttled, 0)
+
+        return runner.crawl(crawler, pages=pages, base_url=base_url).addCallback(check)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from medifacil_backend import cache
+from medifacil_backend.cache import PharmaCache, SearchCache
+
+
+class Clock:
+    """
+    Reemplazo del módulo time con un reloj que solo avanza cuando el test lo pide.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class Loader:
+    """
+    Carga de farmacias que cuenta las consultas a la base de datos.
+    """
+
+    def __init__(self, pharmas):
+        self.pharmas = dict(pharmas)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return dict(self.pharmas)
+
+
+FYBECA = {"location": "Quito", "link_logo": "https://www.fybeca.com/logo.png", "link": "https://www.fybeca.com"}
+MEDICITY = {"location": "Guayaquil", "link_logo": "https://www.farmaciasmedicity.com/logo.png", "link": "https://www.farmaciasmedicity.com"}
+
+
+class PharmaCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(cache, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loader = Loader({"Fybeca": FYBECA})
+        self.cache = PharmaCache(self.loader, ttl=60)
+
+    def test_loads_once_until_the_ttl_expires(self):
+        self.assertEqual(self.cache.get("Fybeca"), FYBECA)
+        self.clock.advance(59)
+        self.assertEqual(self.cache.get("Fybeca"), FYBECA)
+        self.assertEqual(self.loader.calls, 1)
+
+        self.loader.pharmas["Fybeca"] = dict(FYBECA, location="Cuenca")
+        self.clock.advance(1)
+        self.assertEqual(self.cache.get("Fybeca")["location"], "Cuenca")
+        self.assertEqual(self.loader.calls, 2)
+
+    def test_invalidate_reloads_on_next_read(self):
+        self.cache.all()
+        self.cache.invalidate()
+        self.cache.all()
+        self.assertEqual(self.loader.calls, 2)
+
+    def test_new_pharma_is_found_by_reloading(self):
+        self.cache.all()
+        self.loader.pharmas["Medicity"] = MEDICITY
+        self.assertEqual(self.cache.get("Medicity"), MEDICITY)
+        self.assertEqual(self.loader.calls, 2)
+
+    def test_missing_pharma_reloads_once_per_ttl(self):
+        self.cache.all()
+        self.assertIsNone(self.cache.get("Cruz Azul"))
+        # Una recarga por si se agregó después de la carga inicial
+        self.assertEqual(self.loader.calls, 2)
+        self.loader.pharmas["Cruz Azul"] = MEDICITY
+        for _ in range(5):
+            self.assertIsNone(self.cache.get("Cruz Azul"))
+        self.assertEqual(self.loader.calls, 2)
+
+        # Al vencer el TTL se olvida y la recarga la encuentra
+        self.clock.advance(60)
+        self.assertEqual(self.cache.get("Cruz Azul"), MEDICITY)
+        self.assertEqual(self.loader.calls, 3)
+
+    def test_pharma_missing_from_a_fresh_load_is_not_queried_again(self):
+        # all() acaba de cargar: get no vuelve a consultar por la farmacia que falta
+        self.assertIsNone(self.cache.get("Cruz Azul"))
+        self.clock.advance(60)
+        self.assertIsNone(self.cache.get("Cruz Azul"))
+        self.assertEqual(self.loader.calls, 2)
+
+    def test_refresh_skips_the_query_when_another_thread_already_reloaded(self):
+        loads = self.cache._loads
+        self.cache.refresh()
+        # Quien vio la carga anterior recibe los datos de la recarga que ya ocurrió
+        self.assertEqual(self.cache.refresh(seen_loads=loads), {"Fybeca": FYBECA})
+        self.assertEqual(self.loader.calls, 1)
+
+
+class SearchCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(cache, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.catalog_generation = 1
+        self.invalidations = 0
+        self.cache = SearchCache(
+            os.path.join(directory.name, "search_cache.sqlite3"),
+            lambda: self.catalog_generation,
+            max_entries=2,
+            ttl=600,
+            generation_check_interval=10,
+        )
+        self.cache.on_generation_change(self.invalidated)
+
+    def invalidated(self):
+        self.invalidations += 1
+
+    def entries(self):
+        return [key for key, in self.cache._connection().execute("SELECT key FROM search_cache ORDER BY key")]
+
+    def test_results_are_shared_by_normalized_names(self):
+        self.cache.set(["  Paracetamol 500mg "], [{"name": "Paracetamol", "price": Decimal("2.35")}])
+        self.assertEqual(self.cache.get(["paracetamol   500MG"]), [{"name": "Paracetamol", "price": 2.35}])
+        self.assertIsNone(self.cache.get(["ibuprofeno"]))
+
+    def test_entries_expire_after_the_ttl(self):
+        self.cache.set(["paracetamol"], [])
+        self.clock.advance(600)
+        self.assertEqual(self.cache.get(["paracetamol"]), [])
+        self.clock.advance(1)
+        self.assertIsNone(self.cache.get(["paracetamol"]))
+        self.assertEqual(self.entries(), [])
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set(["paracetamol"], [1])
+        self.clock.advance(1)
+        self.cache.set(["ibuprofeno"], [2])
+        self.clock.advance(1)
+        # Leer paracetamol actualiza accessed_at: ibuprofeno pasa a ser el menos usado
+        self.cache.get(["paracetamol"])
+        self.clock.advance(1)
+        self.cache.set(["loratadina"], [3])
+        self.assertEqual(self.entries(), ['["loratadina"]', '["paracetamol"]'])
+        self.assertIsNone(self.cache.get(["ibuprofeno"]))
+
+    def test_new_catalog_generation_invalidates_entries_and_notifies(self):
+        self.cache.set(["paracetamol"], [1])
+        self.catalog_generation = 2
+        # La generación se vuelve a consultar cada generation_check_interval segundos
+        self.assertEqual(self.cache.get(["paracetamol"]), [1])
+        self.assertEqual(self.invalidations, 0)
+
+        self.clock.advance(10)
+        self.assertIsNone(self.cache.get(["paracetamol"]))
+        self.assertEqual(self.entries(), [])
+        self.assertEqual(self.invalidations, 1)
+
+        self.cache.set(["paracetamol"], [2])
+        self.clock.advance(10)
+        self.assertEqual(self.cache.get(["paracetamol"]), [2])
+        self.assertEqual(self.invalidations, 1)
+
+    def test_first_generation_load_is_not_an_invalidation(self):
+        self.assertEqual(self.cache.generation(), 1)
+        self.assertEqual(self.invalidations, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from pathlib import Path
+
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Request, Response, TextResponse, XmlResponse
+from scrapy.utils.test import get_crawler
+from twisted.python.failure import Failure
+
+from medifacil_backend.discovery import parse_sitemap, sitemap_body
+from medifacil_backend.spiders.CrawlerCruzAzul import CrawlCruzAzul
+from medifacil_backend.spiders.CrawlerFybeca import CrawlFybeca
+
+FIXTURES = Path(__file__).parent / "fixtures" / "sitemaps"
+
+
+def fixture_response(url, name, cls=XmlResponse):
+    return cls(url, body=(FIXTURES / name).read_bytes(), request=Request(url))
+
+
+def failed(request):
+    failure = Failure(IgnoreRequest("404"))
+    failure.request = request
+    return failure
+
+
+def sitemap_spider(cls):
+    crawler = get_crawler(cls, {"DISCOVERY_MODE": "sitemap"})
+    return cls.from_crawler(crawler)
+
+
+class ParseSitemapTest(unittest.TestCase):
+
+    def test_sitemap_index(self):
+        children, urls = parse_sitemap((FIXTURES / "fybeca_sitemap_index.xml").read_bytes())
+        self.assertEqual(children, [
+            "https://www.fybeca.com/sitemap_0-product.xml",
+            "https://www.fybeca.com/sitemap_1-category.xml",
+        ])
+        self.assertEqual(urls, [])
+
+    def test_urlset_ignores_image_locations(self):
+        children, urls = parse_sitemap((FIXTURES / "fybeca_sitemap_0-product.xml").read_bytes())
+        self.assertEqual(children, [])
+        self.assertEqual(urls, [
+            "https://www.fybeca.com/paracetamol-500mg-x-20-tabletas/FY_100234.html",
+            "https://www.fybeca.com/ibuprofeno-400mg-x-10-capsulas/FY_100871.html",
+            "https://www.fybeca.com/vitamina-c-1g-x-10-efervescentes/FY_204511.html",
+            "https://www.fybeca.com/medicamentos",
+        ])
+
+    def test_gzipped_sitemap(self):
+        url = "https://www.farmaciasmedicity.com/sitemap/product-0.xml.gz"
+        body = sitemap_body(fixture_response(url, "medicity_product-0.xml.gz", cls=Response))
+        self.assertEqual(parse_sitemap(body)[1], [
+            "https://www.farmaciasmedicity.com/omeprazol-20mg-x-14-capsulas/p",
+            "https://www.farmaciasmedicity.com/loratadina-10mg-x-10-tabletas/p",
+        ])
+
+    def test_truncated_sitemap_keeps_complete_entries(self):
+        body = (FIXTURES / "cruzazul_sitemap.xml").read_bytes()
+        cut = body.index(b"<url><loc>https://www.farmaciascruzazul.ec/contactenos")
+        self.assertEqual(len(parse_sitemap(body[:cut])[1]), 3)
+
+    def test_not_a_sitemap(self):
+        self.assertEqual(parse_sitemap(b"<html><body>404</body></html>"), ([], []))
+
+
+class SitemapDiscoveryTest(unittest.TestCase):
+
+    def test_follows_robots_index_and_product_sitemaps(self):
+        spider = sitemap_spider(CrawlFybeca)
+        requests = list(spider.start_requests())
+        self.assertEqual([r.url for r in requests], list(CrawlFybeca.sitemap_urls))
+
+        robots, index = requests
+        # El sitemap de imágenes de otro dominio se ignora en vez de quedar pendiente para siempre
+        self.assertEqual(list(spider.parse_sitemap(fixture_response(robots.url, "fybeca_robots.txt", cls=TextResponse))), [])
+        self.assertEqual(spider.crawler.stats.get_value("discovery/offsite_sitemaps"), 1)
+
+        children = list(spider.parse_sitemap(fixture_response(index.url, "fybeca_sitemap_index.xml")))
+        self.assertEqual([r.callback for r in children], [spider.parse_sitemap] * 2)
+
+        products, category = children
+        items = list(spider.parse_sitemap(fixture_response(products.url, "fybeca_sitemap_0-product.xml")))
+        self.assertEqual(len(items), 3)
+        self.assertTrue(all(r.callback == spider.parse_item for r in items))
+
+        self.assertEqual(list(spider.sitemap_failed(failed(category))), [])
+        self.assertIsNone(spider.crawler.stats.get_value("discovery/fallback"))
+
+    def test_falls_back_to_links_when_sitemaps_fail(self):
+        spider = sitemap_spider(CrawlCruzAzul)
+        robots, sitemap = spider.start_requests()
+        self.assertEqual(list(spider.sitemap_failed(failed(robots))), [])
+
+        fallback = list(spider.sitemap_failed(failed(sitemap)))
+        self.assertTrue(fallback)
+        self.assertTrue(spider.crawler.stats.get_value("discovery/fallback"))
+
+    def test_falls_back_when_only_offsite_sitemaps(self):
+        spider = sitemap_spider(CrawlCruzAzul)
+        spider.sitemap_urls = ["https://cdn.example.com/sitemap.xml"]
+        requests = list(spider.start_requests())
+        self.assertTrue(requests)
+        self.assertTrue(all(r.callback != spider.parse_sitemap for r in requests))
+
+
+if __name__ == "__main__":
+    unittest.main()
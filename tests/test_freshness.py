@@ -0,0 +1,85 @@
+import os
+import queue
+import tempfile
+import time
+import unittest
+
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Request, Response
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.test import get_crawler
+from twisted.internet.error import TimeoutError
+from twisted.python.failure import Failure
+
+from medifacil_backend.freshness import SearchPopularity, SearchPopularityRecorder, product_gone
+from medifacil_backend.spiders.CrawlerFybeca import CrawlFybeca
+
+
+class SearchPopularityRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.popularity = SearchPopularity(os.path.join(directory.name, "search_popularity.sqlite3"))
+
+    def wait_for_hits(self, expected):
+        deadline = time.monotonic() + 5
+        while self.popularity.hits() != expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.popularity.hits()
+
+    def test_counts_each_product_once_per_search(self):
+        recorder = SearchPopularityRecorder(self.popularity)
+        for _ in range(30):
+            recorder.submit(["https://a", "https://b", "https://a", None])
+        recorder.submit(["https://c"])
+        expected = {"https://a": 30, "https://b": 30, "https://c": 1}
+        self.assertEqual(self.wait_for_hits(expected), expected)
+
+    def test_full_buffer_drops_searches_without_blocking(self):
+        recorder = SearchPopularityRecorder(self.popularity, max_buffered=1)
+        # Sin hilo que la vacíe, la cola se llena con la primera búsqueda
+        buffer = queue.Queue(maxsize=1)
+        recorder._buffer = lambda: buffer
+        recorder.submit(["https://a"])
+        recorder.submit(["https://b"])
+        self.assertEqual(buffer.get_nowait(), {"https://a"})
+
+
+class KnownProductFailedTest(unittest.TestCase):
+
+    url = "https://www.fybeca.com/paracetamol/FY_1.html"
+
+    def setUp(self):
+        crawler = get_crawler(CrawlFybeca)
+        self.spider = CrawlFybeca.from_crawler(crawler)
+        self.stats = crawler.stats
+        self.gone = []
+        crawler.signals.connect(lambda url, spider: self.gone.append(url), signal=product_gone, weak=False)
+
+    def request_failed(self, exception):
+        failure = Failure(exception)
+        failure.request = Request(self.url)
+        self.spider.known_product_failed(failure)
+
+    def test_gone_product_sends_the_signal(self):
+        with self.assertNoLogs(level="WARNING"):
+            self.request_failed(HttpError(Response(self.url, status=404)))
+        self.assertEqual(self.gone, [self.url])
+        self.assertEqual(self.stats.get_value("refresh/gone"), 1)
+
+    def test_ignored_requests_are_quiet(self):
+        with self.assertNoLogs(level="WARNING"):
+            # Páginas sin cambios y errores HTTP que HttpErrorMiddleware ya registró
+            self.request_failed(IgnoreRequest(f"Unchanged page: {self.url}"))
+            self.request_failed(HttpError(Response(self.url, status=500)))
+        self.assertEqual(self.gone, [])
+
+    def test_download_errors_are_logged(self):
+        with self.assertLogs(level="WARNING"):
+            self.request_failed(TimeoutError())
+        self.assertEqual(self.gone, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
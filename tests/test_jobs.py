@@ -0,0 +1,173 @@
+import importlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from medifacil_backend.jobs import STATUS_FAILED, STATUS_FINISHED, STATUS_QUEUED, STATUS_RUNNING, JobStore
+
+TOKEN = "test-token"
+
+
+def temp_job_store(test):
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    return JobStore(os.path.join(directory.name, "scraper_jobs.sqlite3"), directory.name)
+
+
+class JobStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = temp_job_store(self)
+
+    def test_identical_active_job_is_not_queued_twice(self):
+        job_id, created = self.store.enqueue(["CrawlFybeca", "CrawlMedicity"], {"incremental": True})
+        self.assertTrue(created)
+        # Mismas spiders en otro orden y mismas opciones
+        self.assertEqual(self.store.enqueue(["CrawlMedicity", "CrawlFybeca"], {"incremental": True}), (job_id, False))
+        # Otras opciones son otro trabajo
+        other_id, created = self.store.enqueue(["CrawlFybeca", "CrawlMedicity"])
+        self.assertTrue(created)
+        self.assertNotEqual(other_id, job_id)
+
+        self.store.claim_next()
+        self.assertEqual(self.store.enqueue(["CrawlFybeca", "CrawlMedicity"], {"incremental": True}), (job_id, False))
+        # Un trabajo terminado ya no absorbe las solicitudes nuevas
+        self.store.finish(job_id, 0)
+        new_id, created = self.store.enqueue(["CrawlFybeca", "CrawlMedicity"], {"incremental": True})
+        self.assertTrue(created)
+        self.assertNotEqual(new_id, job_id)
+
+    def test_jobs_are_claimed_in_order(self):
+        first, _ = self.store.enqueue(["CrawlFybeca"])
+        second, _ = self.store.enqueue(["CrawlMedicity"])
+        self.assertEqual(self.store.claim_next()["id"], first)
+        self.assertEqual(self.store.claim_next()["id"], second)
+        self.assertIsNone(self.store.claim_next())
+
+    def test_progress_is_added_up_by_worker(self):
+        job_id, _ = self.store.enqueue(["CrawlMedicity"])
+        self.store.claim_next()
+        self.store.report_progress(job_id, "CrawlMedicity 1/2", {"item_scraped_count": 10, "response_received_count": 12, "other": 1})
+        self.store.report_progress(job_id, "CrawlMedicity 2/2", {"item_scraped_count": 5, "log_count/ERROR": 1})
+        job = self.store.get(job_id)
+        self.assertEqual((job["items"], job["responses"], job["errors"]), (15, 12, 1))
+        self.assertNotIn("other", job["workers"]["CrawlMedicity 1/2"])
+
+    def test_interrupted_jobs_are_requeued_until_max_attempts(self):
+        job_id, _ = self.store.enqueue(["CrawlFybeca"])
+        self.store.claim_next()
+        self.assertEqual(self.store.recover(max_attempts=2), 1)
+        self.assertEqual(self.store.get(job_id)["status"], STATUS_QUEUED)
+
+        self.store.claim_next()
+        self.store.recover(max_attempts=2)
+        job = self.store.get(job_id)
+        self.assertEqual((job["status"], job["error"]), (STATUS_FAILED, "Interrupted 2 times"))
+
+
+def setUpModule():
+    # app.py lee el .env, abre el pool de PostgreSQL y los archivos SQLite locales al importarse
+    global app, directory
+    directory = tempfile.TemporaryDirectory()
+    env = {
+        "DB_HOSTNAME": "localhost", "DB_USERNAME": "", "DB_PASSWORD": "", "DB_DATABASE": "", "DB_PORT": "5432",
+        "SECRET_TOKEN": TOKEN,
+        "SEARCH_CACHE_PATH": os.path.join(directory.name, "search_cache.sqlite3"),
+        "SEARCH_POPULARITY_PATH": os.path.join(directory.name, "search_popularity.sqlite3"),
+        "REFRESH_QUEUE_PATH": os.path.join(directory.name, "refresh_queue.sqlite3"),
+        "SCRAPER_JOBS_PATH": os.path.join(directory.name, "scraper_jobs.sqlite3"),
+        "SCRAPER_JOBS_LOG_DIR": os.path.join(directory.name, "scraper_logs"),
+    }
+    with mock.patch.dict(os.environ, env), \
+            mock.patch("dotenv.load_dotenv", return_value=True), \
+            mock.patch("medifacil_backend.db.PostgresConnectionPool"):
+        app = importlib.import_module("app")
+
+
+def tearDownModule():
+    directory.cleanup()
+
+
+class ScraperEndpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = temp_job_store(self)
+        patchers = [mock.patch.object(app, "job_store", self.store), mock.patch.dict(os.environ, {"SECRET_TOKEN": TOKEN})]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.app.test_client()
+
+    def post(self, **data):
+        return self.client.post("/scraper", json={"token": TOKEN, **data})
+
+    def status(self, job_id):
+        response = self.client.get(f"/scraper/{job_id}", query_string={"token": TOKEN})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.post("/scraper", json={"spiders": ["CrawlFybeca"]}).status_code, 401)
+        self.assertEqual(self.client.get("/scraper/abc").status_code, 401)
+
+    def test_rejects_unknown_spiders(self):
+        for spiders in ([], ["CrawlFybeca", "CrawlFarmacia"], ["CrawlFybeca; rm -rf /"], "CrawlFybeca", [1]):
+            self.assertEqual(self.post(spiders=spiders).status_code, 400, spiders)
+        self.assertIsNone(self.store.claim_next())
+
+    def test_rejects_invalid_options(self):
+        invalid = (
+            {"discovery": "everything"},
+            {"max_requests": 0},
+            {"max_requests": "100"},
+            {"max_requests": True},
+            {"time_budget": -1},
+            {"refresh": True, "discovery": "sitemap"},
+        )
+        for options in invalid:
+            self.assertEqual(self.post(spiders=["CrawlFybeca"], **options).status_code, 400, options)
+        self.assertIsNone(self.store.claim_next())
+
+    def test_identical_request_returns_the_queued_job(self):
+        first = self.post(spiders=["CrawlFybeca", "CrawlMedicity"], discovery="sitemap", max_requests=100)
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.get_json()["duplicate"], False)
+        again = self.post(spiders=["CrawlMedicity", "CrawlFybeca"], discovery="sitemap", max_requests=100)
+        self.assertEqual(again.get_json(), dict(first.get_json(), duplicate=True))
+
+        job = self.status(first.get_json()["id"])
+        self.assertEqual(job["options"], {"discovery": "sitemap", "max_requests": 100})
+
+    def test_reports_the_status_transitions_of_a_job(self):
+        job_id = self.post(spiders=["CrawlFybeca"]).get_json()["id"]
+        self.assertEqual(self.status(job_id)["status"], STATUS_QUEUED)
+
+        self.store.claim_next()
+        self.store.report_progress(job_id, "CrawlFybeca", {"item_scraped_count": 7})
+        with open(self.store.log_path(job_id), "w") as f:
+            f.write("first\nsecond\nthird\n")
+        job = self.client.get(f"/scraper/{job_id}", query_string={"token": TOKEN, "lines": 2}).get_json()
+        self.assertEqual((job["status"], job["attempts"], job["items"]), (STATUS_RUNNING, 1, 7))
+        self.assertEqual(job["log"], ["second", "third"])
+
+        self.store.finish(job_id, 0)
+        job = self.status(job_id)
+        self.assertEqual((job["status"], job["returncode"]), (STATUS_FINISHED, 0))
+        self.assertIsNotNone(job["finished_at"])
+
+        # Un trabajo terminado no absorbe una solicitud nueva; si falla, queda como fallido
+        retry_id = self.post(spiders=["CrawlFybeca"]).get_json()["id"]
+        self.assertNotEqual(retry_id, job_id)
+        self.store.claim_next()
+        self.store.finish(retry_id, 1)
+        self.assertEqual(self.status(retry_id)["status"], STATUS_FAILED)
+
+    def test_unknown_job_and_invalid_lines(self):
+        self.assertEqual(self.client.get("/scraper/missing", query_string={"token": TOKEN}).status_code, 404)
+        response = self.client.get("/scraper/missing", query_string={"token": TOKEN, "lines": "all"})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+
+from scrapy.http import HtmlResponse, Request
+from scrapy.spiders import Spider
+from scrapy.utils.test import get_crawler
+from w3lib.url import add_or_replace_parameter
+
+from medifacil_backend.middlewares import DuplicateListingMiddleware, MedifacilBackendSpiderMiddleware
+from medifacil_backend.spiders.CrawlerFybeca import CrawlFybeca
+
+
+class UrlFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        crawler = get_crawler(CrawlFybeca, {"URL_IGNORED_QUERY_PARAMS": ["utm_source"]})
+        self.spider = CrawlFybeca.from_crawler(crawler)
+        self.middleware = MedifacilBackendSpiderMiddleware.from_crawler(crawler)
+        self.middleware.spider_opened(self.spider)
+        self.stats = crawler.stats
+
+    def filtered(self, requests):
+        response = HtmlResponse("https://www.fybeca.com/medicamentos", body=b"")
+        return [r.url for r in self.middleware.process_spider_output(response, requests, self.spider)]
+
+    def test_drop_reasons(self):
+        drop_reason = self.middleware._drop_reason
+        self.assertEqual(drop_reason("https://www.fybeca.com/folleto.pdf"), "asset")
+        self.assertEqual(drop_reason("https://cdn.example.com/medicamentos"), "offsite")
+        self.assertEqual(drop_reason("https://www.fybeca.com/cuidado personal"), "pattern")
+        # Rutas que terminan como una extensión ("ps", "ra", "ai") sin ser archivos
+        self.assertIsNone(drop_reason("https://www.fybeca.com/tips"))
+        self.assertIsNone(drop_reason("https://www.fybeca.com/camara"))
+        # Listados de categorías anidadas
+        self.assertIsNone(drop_reason("https://www.fybeca.com/medicamentos/dolor-y-fiebre/analgesicos"))
+        self.assertIsNone(drop_reason("https://www.fybeca.com/paracetamol-500mg/FY_100234.html"))
+
+    def test_filters_followed_links(self):
+        urls = self.filtered([
+            Request("https://www.fybeca.com/medicamentos?utm_source=x#top"),
+            Request("https://www.fybeca.com/medicamentos"),
+            Request("https://www.fybeca.com/logo.png"),
+        ])
+        self.assertEqual(urls, ["https://www.fybeca.com/medicamentos"])
+        self.assertEqual(self.stats.get_value("urlfilter/dropped/duplicate"), 1)
+        self.assertEqual(self.stats.get_value("urlfilter/dropped/asset"), 1)
+
+    def test_shards_split_followed_products(self):
+        products = [f"https://www.fybeca.com/producto-{n}/FY_{n}.html" for n in range(20)]
+        links = [Request(url) for url in products + ["https://www.fybeca.com/medicamentos"]]
+        kept = []
+        for index in range(3):
+            self.spider.shard = f"{index}/3"
+            self.middleware.spider_opened(self.spider)
+            urls = self.filtered(list(links))
+            # Todas las partes siguen los listados; cada producto queda en una sola parte
+            self.assertIn("https://www.fybeca.com/medicamentos", urls)
+            kept += [url for url in urls if url in products]
+        self.assertEqual(sorted(kept), sorted(products))
+        self.assertEqual(self.stats.get_value("urlfilter/dropped/shard"), 2 * len(products))
+
+    def test_product_requests_are_not_filtered(self):
+        # Las URLs de sitemaps o de la base de datos llegan tal cual a parse_item
+        url = "https://www.fybeca.com/producto-retirado/FY_1.html?utm_source=sitemap"
+        self.assertEqual(self.filtered([Request(url, callback=self.spider.parse_item)]), [url])
+
+
+class ListingSpider(Spider):
+    name = "listings"
+    item_url_pattern = r"https://www\.fybeca\.com/p/\d+$"
+
+    def parse_listing(self, response, listing, page):
+        pass
+
+
+class DuplicateListingTest(unittest.TestCase):
+
+    def setUp(self):
+        crawler = get_crawler(ListingSpider, {"DUPLICATE_LISTING_ENABLED": True, "DUPLICATE_LISTING_OVERLAP": 0.9})
+        self.spider = ListingSpider.from_crawler(crawler)
+        self.middleware = DuplicateListingMiddleware.from_crawler(crawler)
+        self.stats = crawler.stats
+
+    def listing_page(self, listing, page, products):
+        """
+        Procesa una página de listado con esos productos y devuelve si se pidió la página siguiente.
+        """
+        request = self.page_request(listing, page)
+        response = HtmlResponse(request.url, body=b"", request=request)
+        links = [Request(f"https://www.fybeca.com/p/{n}") for n in products]
+        output = list(self.middleware.process_spider_output(response, links + [self.page_request(listing, page + 1)], self.spider))
+        # Los enlaces de producto siempre se siguen; solo se retiene la página siguiente
+        self.assertEqual(output[:len(links)], links)
+        return len(output) > len(links)
+
+    def page_request(self, listing, page):
+        url = add_or_replace_parameter(listing, "page", str(page))
+        return Request(url, callback=self.spider.parse_listing, cb_kwargs={"listing": listing, "page": page})
+
+    def test_reordered_listing_is_stopped(self):
+        listing = "https://www.fybeca.com/medicina?order="
+        variant = "https://www.fybeca.com/medicina?order=OrderByBestDiscountDESC"
+        self.assertTrue(self.listing_page(listing, 1, range(10)))
+        self.assertFalse(self.listing_page(variant, 1, reversed(range(10))))
+        self.assertTrue(self.listing_page(listing, 2, range(10, 20)))
+        self.assertTrue(self.listing_page(listing, 3, range(20, 30)))
+        self.middleware.spider_closed(self.spider)
+        self.assertEqual(self.stats.get_value("listingdedup/stopped_chains"), 1)
+        # La variante habría recorrido las dos páginas que le quedaban al listado original
+        self.assertEqual(self.stats.get_value("listingdedup/saved_requests"), 2)
+
+    def test_shifted_pages_of_the_same_listing_are_stopped(self):
+        listing = "https://www.fybeca.com/medicina"
+        self.assertTrue(self.listing_page(listing, 1, range(0, 10)))
+        # Cada página corre los productos en uno: siempre hay uno nuevo, pero la cadena no termina
+        self.assertFalse(self.listing_page(listing, 2, range(1, 11)))
+        self.assertEqual(self.stats.get_value("listingdedup/duplicate_pages"), 1)
+
+    def test_partial_overlap_keeps_paginating(self):
+        self.assertTrue(self.listing_page("https://www.fybeca.com/medicina", 1, range(10)))
+        self.assertTrue(self.listing_page("https://www.fybeca.com/dolor", 1, range(5, 15)))
+        self.assertIsNone(self.stats.get_value("listingdedup/duplicate_pages"))
+
+    def test_products_of_a_stopped_chain_do_not_stop_another(self):
+        listing = "https://www.fybeca.com/medicina?order="
+        variant = "https://www.fybeca.com/medicina?order=OrderByNameASC"
+        self.assertTrue(self.listing_page(listing, 1, range(10)))
+        self.assertFalse(self.listing_page(variant, 1, range(1, 11)))
+        # El producto 10 lo trajo primero la variante cortada: para el listado original es nuevo
+        self.assertTrue(self.listing_page(listing, 2, range(10, 20)))
+        self.assertEqual(self.stats.get_value("listingdedup/stopped_chains"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
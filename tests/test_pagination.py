@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+from scrapy.http import HtmlResponse, Request
+from scrapy.spiders import Spider
+from scrapy.utils.test import get_crawler
+from w3lib.url import url_query_parameter
+
+from medifacil_backend.pagination import AdaptivePaginationMixin, PaginationStore
+
+LISTING = "https://www.fybeca.com/medicamentos"
+
+
+class PaginatedSpider(AdaptivePaginationMixin, Spider):
+    name = "paginated"
+    listings = [LISTING]
+    item_url_pattern = r"^https://www\.fybeca\.com/p/\d+$"
+    catalog = {}  # Productos de cada página del listado en la tienda
+
+    def parse_page(self, response):
+        page = int(url_query_parameter(response.url, self.page_param))
+        for product in self.catalog.get(page, ()):
+            yield Request(f"https://www.fybeca.com/p/{product}")
+        # Enlace de paginación de la propia página, que la cadena ignora
+        yield Request(f"{LISTING}?page={page + 1}")
+
+
+class AdaptivePaginationTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "pagination.sqlite3")
+
+    def crawl(self, catalog, reason="finished"):
+        """
+        Recorre el listado con la tienda `catalog` y devuelve las páginas pedidas, en orden.
+        """
+        crawler = get_crawler(PaginatedSpider, {"PAGINATION_STATE_PATH": self.path})
+        spider = PaginatedSpider.from_crawler(crawler, catalog=catalog)
+        pending = list(spider.listing_requests())
+        requested = []
+        while pending:
+            request = pending.pop(0)
+            requested.append(request.cb_kwargs["page"])
+            response = HtmlResponse(request.url, body=b"", request=request)
+            for result in spider.parse_listing(response, **request.cb_kwargs):
+                if result.callback == spider.parse_listing:
+                    pending.append(result)
+                else:
+                    # Los enlaces de paginación de la página no se siguen; solo los productos
+                    self.assertRegex(result.url, spider.item_url_pattern)
+        spider.closed(reason)
+        return requested
+
+    def learned(self):
+        return PaginationStore(self.path).pages("paginated").get(LISTING)
+
+    def test_first_crawl_learns_the_last_page(self):
+        catalog = {1: range(0, 10), 2: range(10, 20), 3: range(20, 25)}
+        # La página 4 no trae productos y cierra la cadena
+        self.assertEqual(self.crawl(catalog), [1, 2, 3, 4])
+        self.assertEqual(self.learned(), 3)
+
+    def test_learned_pages_are_requested_at_once_and_the_chain_stops_at_the_last_one(self):
+        PaginationStore(self.path).save("paginated", {LISTING: 3})
+        catalog = {1: range(0, 10), 2: range(10, 20), 3: range(20, 25)}
+        # Solo la última página aprendida sigue la cadena, y la siguiente vacía la cierra
+        self.assertEqual(self.crawl(catalog), [1, 2, 3, 4])
+        self.assertEqual(self.learned(), 3)
+
+    def test_stored_value_follows_a_listing_that_grew_or_shrank(self):
+        PaginationStore(self.path).save("paginated", {LISTING: 2})
+        grown = {1: range(0, 10), 2: range(10, 20), 3: range(20, 30), 4: range(30, 35)}
+        self.assertEqual(self.crawl(grown), [1, 2, 3, 4, 5])
+        self.assertEqual(self.learned(), 4)
+
+        # La tienda repite la última página en lugar de devolver una vacía: la página 4 ya no sigue la cadena
+        shrunk = {1: range(0, 10), 2: range(10, 15), 3: range(10, 15), 4: range(10, 15)}
+        self.assertEqual(self.crawl(shrunk), [1, 2, 3, 4])
+        self.assertEqual(self.learned(), 2)
+
+    def test_interrupted_crawl_keeps_the_stored_value(self):
+        PaginationStore(self.path).save("paginated", {LISTING: 3})
+        self.crawl({1: range(0, 10)}, reason="shutdown")
+        self.assertEqual(self.learned(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
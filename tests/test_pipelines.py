@@ -0,0 +1,272 @@
+import queue
+import unittest
+from unittest import mock
+
+import psycopg2
+from scrapy.exceptions import DropItem
+from scrapy.spiders import Spider
+from twisted.trial import unittest as trial_unittest
+
+from medifacil_backend import pipelines
+from medifacil_backend.items import MedicineItem
+from medifacil_backend.pipelines import PostgresPipeline, content_fingerprint
+
+
+class PharmaSpider(Spider):
+    name = "pharma"
+    pharma = "Fybeca"
+
+
+def medicine(url, price="2.35", name="Paracetamol 500 mg x 20 tabletas"):
+    return MedicineItem(
+        url=url,
+        pharma="Fybeca",
+        name=name,
+        price=price,
+        url_image="",
+        availability="Disponible",
+        ingest_date="2026-10-18",
+    )
+
+
+class FakeCursor:
+    """
+    Cursor que registra las sentencias; el cursor con nombre devuelve las huellas guardadas.
+    """
+
+    def __init__(self, connection, rows=()):
+        self.connection = connection
+        self.rows = list(rows)
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append((" ".join(sql.split()), params))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """
+    Conexión de psycopg2 en memoria: guarda los lotes de execute_values, los commits y los rollbacks.
+
+    Un lote que contiene una URL de `failing_urls` falla, como una fila que viola una restricción.
+    """
+
+    def __init__(self, fingerprints=None, failing_urls=()):
+        self.fingerprints = dict(fingerprints or {})
+        self.failing_urls = set(failing_urls)
+        self.batches = []
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, *args, **kwargs):
+        if kwargs.get("name"):
+            return FakeCursor(self, self.fingerprints.items())
+        return FakeCursor(self)
+
+    def execute_values(self, cursor, sql, rows, template=None, page_size=100):
+        if self.failing_urls.intersection(row[0] for row in rows):
+            raise psycopg2.IntegrityError("null value in column \"price\" violates not-null constraint")
+        self.batches.append([row[0] for row in rows])
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+def run_pipeline(connection, items, batch_size=2):
+    """
+    Abre el pipeline con la conexión falsa, procesa los items y lo cierra, como lo haría Scrapy.
+    """
+    pipeline = PostgresPipeline(batch_size=batch_size, flush_interval=60)
+    with mock.patch.object(pipelines.psycopg2, "connect", return_value=connection), \
+            mock.patch.object(pipelines, "execute_values", connection.execute_values):
+        pipeline.open_spider(PharmaSpider())
+        for item in items:
+            pipeline.process_item(item, None)
+        pipeline._shutdown()
+    return pipeline
+
+
+class BatchWriteTest(unittest.TestCase):
+
+    def test_items_are_written_in_batches(self):
+        urls = [f"https://www.fybeca.com/p/FY_{n}.html" for n in range(5)]
+        connection = FakeConnection()
+        pipeline = run_pipeline(connection, [medicine(url) for url in urls])
+        # Dos lotes completos y el resto al cerrar, cada uno en un solo INSERT
+        self.assertEqual(connection.batches, [urls[:2], urls[2:4], urls[4:]])
+        self.assertEqual(connection.rollbacks, 0)
+        self.assertEqual(pipeline.rows_changed, 5)
+
+    def test_repeated_url_in_a_batch_keeps_the_last_version(self):
+        url = "https://www.fybeca.com/p/FY_1.html"
+        connection = FakeConnection()
+        run_pipeline(connection, [medicine(url, price="2.35"), medicine(url, price="2.10")], batch_size=5)
+        self.assertEqual(connection.batches, [[url]])
+
+    def test_failed_batch_is_retried_row_by_row(self):
+        good, bad, other = (f"https://www.fybeca.com/p/FY_{n}.html" for n in range(3))
+        connection = FakeConnection(failing_urls=[bad])
+        pipeline = run_pipeline(connection, [medicine(good), medicine(bad), medicine(other)], batch_size=3)
+        # El lote se revierte y solo se descarta la fila con error
+        self.assertEqual(connection.batches, [[good], [other]])
+        self.assertEqual(connection.rollbacks, 2)
+        self.assertEqual(pipeline.rows_changed, 2)
+        # Sin huella, la fila descartada se vuelve a intentar si el producto llega de nuevo
+        self.assertNotIn(bad, pipeline.fingerprints)
+        self.assertIn(good, pipeline.fingerprints)
+
+    def test_each_batch_is_committed(self):
+        connection = FakeConnection()
+        run_pipeline(connection, [medicine(f"https://www.fybeca.com/p/FY_{n}.html") for n in range(4)])
+        # Huellas, dos lotes y la generación del catálogo
+        self.assertEqual(connection.commits, 4)
+
+
+def statements(connection, prefix):
+    return [params for sql, params in connection.statements if sql.startswith(prefix)]
+
+
+class UnchangedContentTest(unittest.TestCase):
+
+    url = "https://www.fybeca.com/paracetamol/FY_1.html"
+
+    def stored(self, item):
+        return FakeConnection(fingerprints={item["url"]: content_fingerprint(item)})
+
+    def test_fingerprint_covers_the_stored_content(self):
+        self.assertEqual(content_fingerprint(medicine(self.url)), content_fingerprint(medicine(self.url)))
+        self.assertNotEqual(content_fingerprint(medicine(self.url)), content_fingerprint(medicine(self.url, price="2.10")))
+        # La fecha de ingesta no es contenido: un producto visto otro día no cambió
+        later = medicine(self.url)
+        later["ingest_date"] = "2026-10-19"
+        self.assertEqual(content_fingerprint(later), content_fingerprint(medicine(self.url)))
+
+    def test_unchanged_item_only_touches_ingest_date(self):
+        connection = self.stored(medicine(self.url))
+        pipeline = run_pipeline(connection, [medicine(self.url)])
+        self.assertEqual(connection.batches, [])
+        self.assertEqual(statements(connection, "UPDATE medicines SET ingest_date"), [("2026-10-18", [self.url], "2026-10-18")])
+        self.assertEqual(pipeline.rows_changed, 0)
+        # Los resultados de /search no cambiaron: la caché sigue siendo válida
+        self.assertEqual(statements(connection, "UPDATE public.catalog_generation"), [])
+
+    def test_changed_item_is_written_and_bumps_the_generation(self):
+        connection = self.stored(medicine(self.url))
+        run_pipeline(connection, [medicine(self.url, price="2.10")])
+        self.assertEqual(connection.batches, [[self.url]])
+        self.assertEqual(statements(connection, "UPDATE medicines SET ingest_date"), [])
+        self.assertEqual(len(statements(connection, "UPDATE public.catalog_generation")), 1)
+
+    def test_unchanged_page_is_touched_without_bumping_the_generation(self):
+        connection = FakeConnection()
+        pipeline = PostgresPipeline(batch_size=10, flush_interval=60)
+        with mock.patch.object(pipelines.psycopg2, "connect", return_value=connection):
+            pipeline.open_spider(PharmaSpider())
+            pipeline.page_unchanged(self.url, None)
+            pipeline._shutdown()
+        self.assertEqual(len(statements(connection, "UPDATE medicines SET ingest_date")), 1)
+        self.assertEqual(statements(connection, "UPDATE public.catalog_generation"), [])
+
+    def test_gone_product_bumps_the_generation(self):
+        connection = self.stored(medicine(self.url))
+        pipeline = PostgresPipeline(batch_size=10, flush_interval=60)
+        with mock.patch.object(pipelines.psycopg2, "connect", return_value=connection):
+            pipeline.open_spider(PharmaSpider())
+            pipeline.product_gone(self.url, None)
+            pipeline._shutdown()
+        gone = statements(connection, "UPDATE medicines SET availability")
+        self.assertEqual([(availability, urls) for availability, _, urls in gone], [("No available", [self.url])])
+        self.assertNotIn(self.url, pipeline.fingerprints)
+        self.assertEqual(len(statements(connection, "UPDATE public.catalog_generation")), 1)
+
+
+class BrokenConnection:
+    """
+    Conexión que falla en cada uso, como una base que se cayó justo después de conectar.
+    """
+
+    def cursor(self, *args, **kwargs):
+        if kwargs.get("name"):
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        return mock.MagicMock()
+
+    def rollback(self):
+        raise psycopg2.InterfaceError("connection already closed")
+
+    def commit(self):
+        raise psycopg2.InterfaceError("connection already closed")
+
+    def close(self):
+        pass
+
+
+class WriterFailureTest(trial_unittest.TestCase):
+
+    def open_pipeline(self, connection, queue_size=1):
+        pipeline = PostgresPipeline(batch_size=10, flush_interval=60, queue_size=queue_size)
+        with mock.patch.object(pipelines.psycopg2, "connect", return_value=connection):
+            pipeline.open_spider(PharmaSpider())
+        return pipeline
+
+    def test_connection_failure_does_not_open_the_spider(self):
+        pipeline = PostgresPipeline()
+        error = psycopg2.OperationalError("could not connect to server")
+        with mock.patch.object(pipelines.psycopg2, "connect", side_effect=error):
+            self.assertRaises(psycopg2.OperationalError, pipeline.open_spider, PharmaSpider())
+        self.assertIsNone(pipeline.writer)
+        # close_spider no queda esperando a un hilo escritor que nunca arrancó
+        pipeline._shutdown()
+
+    def test_dead_writer_drops_items_and_shutdown_returns(self):
+        pipeline = self.open_pipeline(BrokenConnection())
+        pipeline.writer.join(5)
+        self.assertFalse(pipeline.writer.is_alive())
+        self.assertIsInstance(pipeline.writer_error, psycopg2.InterfaceError)
+
+        self.assertRaises(DropItem, pipeline.process_item, medicine("https://www.fybeca.com/a/FY_1.html"), None)
+        # Las señales de productos vistos o retirados no esperan una cola que nadie vacía
+        pipeline.queue.put_nowait("fila pendiente")
+        pipeline.page_unchanged("https://www.fybeca.com/b/FY_2.html", None)
+        pipeline.product_gone("https://www.fybeca.com/c/FY_3.html", None)
+
+        pipeline._shutdown()
+        self.assertEqual(pipeline.queue.get_nowait(), "fila pendiente")
+
+    def test_item_waiting_for_space_is_dropped_when_writer_dies(self):
+        pipeline = self.open_pipeline(BrokenConnection())
+        pipeline.writer.join(5)
+        pipeline.writer_error = None
+        pipeline.queue.put_nowait("fila pendiente")
+
+        # Con la cola llena el item espera su turno; el escritor muere mientras tanto
+        deferred = pipeline.process_item(medicine("https://www.fybeca.com/a/FY_1.html"), None)
+        pipeline.writer_error = RuntimeError("writer stopped")
+        return self.assertFailure(deferred, DropItem)
+
+    def test_writer_failure_closes_the_spider(self):
+        pipeline = PostgresPipeline()
+        pipeline.crawler = mock.MagicMock()
+        pipeline._close_spider_after_failure()
+        pipeline.crawler.engine.close_spider.assert_called_once_with(pipeline.crawler.spider, "postgres_writer_failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from scrapy.http import Request
+from scrapy.spiders import Spider
+from scrapy.utils.test import get_crawler
+
+from medifacil_backend.scheduler import CHECKPOINT_FILE, CheckpointScheduler
+
+
+class CheckpointSpider(Spider):
+    name = "checkpoint"
+
+
+class CheckpointTest(unittest.TestCase):
+    """
+    Un rastreo que muere sin cerrar el scheduler se reanuda desde su último punto de control.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.jobdir = directory.name
+
+    def open_scheduler(self, inprogress=()):
+        crawler = get_crawler(CheckpointSpider, {
+            "JOBDIR": self.jobdir,
+            "SCHEDULER": "medifacil_backend.scheduler.CheckpointScheduler",
+            "SCHEDULER_DISK_QUEUE": "medifacil_backend.scheduler.CheckpointDiskQueue",
+            "DUPEFILTER_CLASS": "medifacil_backend.dupefilters.CompactDupeFilter",
+            "FRONTIER_CHECKPOINT_INTERVAL": 0,
+            "REQUEST_FINGERPRINTER_IMPLEMENTATION": "2.7",
+        })
+        crawler.engine = SimpleNamespace(slot=SimpleNamespace(inprogress=list(inprogress)))
+        scheduler = CheckpointScheduler.from_crawler(crawler)
+        scheduler.open(CheckpointSpider())
+        self.addCleanup(self.close_files, scheduler)
+        return scheduler
+
+    @staticmethod
+    def close_files(scheduler):
+        scheduler.df.file.close()
+        for queue in scheduler.dqs.queues.values():
+            queue.headf.close()
+            queue.tailf.close()
+
+    def kill(self, scheduler):
+        # Lo escrito después del punto de control llegó al disco, pero el scheduler no se cerró
+        scheduler.df.file.flush()
+        for queue in scheduler.dqs.queues.values():
+            queue.headf.flush()
+
+    @staticmethod
+    def pending(scheduler):
+        urls = []
+        while (request := scheduler.next_request()) is not None:
+            urls.append(request.url)
+        return urls
+
+    def test_resume_restores_the_queue_and_seen_requests_of_the_checkpoint(self):
+        urls = [f"https://www.fybeca.com/p/FY_{n}.html" for n in range(4)]
+        scheduler = self.open_scheduler()
+        for url in urls[:3]:
+            scheduler.enqueue_request(Request(url))
+        downloading = scheduler.next_request()
+        self.assertEqual(downloading.url, urls[0])
+        scheduler.crawler.engine.slot.inprogress = [downloading]
+        scheduler.checkpoint()
+        self.assertTrue(Path(self.jobdir, CHECKPOINT_FILE).exists())
+
+        # Trabajo posterior al punto de control, que se pierde con el proceso
+        scheduler.enqueue_request(Request(urls[3]))
+        self.assertEqual(scheduler.next_request().url, urls[1])
+        self.kill(scheduler)
+
+        resumed = self.open_scheduler()
+        # La cola del punto de control y la solicitud que estaba en curso, sin lo posterior
+        self.assertEqual(self.pending(resumed), [urls[1], urls[2], urls[0]])
+        self.assertTrue(resumed.df.request_seen(Request(urls[2])))
+        self.assertFalse(resumed.df.request_seen(Request(urls[3])))
+
+    def test_clean_close_removes_the_checkpoint(self):
+        url = "https://www.fybeca.com/p/FY_1.html"
+        scheduler = self.open_scheduler()
+        scheduler.enqueue_request(Request(url))
+        scheduler.close("shutdown")
+        self.assertFalse(Path(self.jobdir, CHECKPOINT_FILE).exists())
+
+        # Scrapy reanuda con su propio estado de la cola
+        resumed = self.open_scheduler()
+        self.assertEqual(self.pending(resumed), [url])
+        self.assertTrue(resumed.df.request_seen(Request(url)))
+
+    def test_crash_without_checkpoint_starts_over(self):
+        scheduler = self.open_scheduler()
+        Path(self.jobdir, CHECKPOINT_FILE).unlink()
+        scheduler.enqueue_request(Request("https://www.fybeca.com/p/FY_1.html"))
+        self.kill(scheduler)
+
+        resumed = self.open_scheduler()
+        self.assertEqual(self.pending(resumed), [])
+        self.assertFalse(resumed.df.request_seen(Request("https://www.fybeca.com/p/FY_1.html")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import unittest
+from pathlib import Path
+
+from scrapy.http import Request, TextResponse
+from scrapy.utils.test import get_crawler
+
+from medifacil_backend import vtex
+from medifacil_backend.spiders.CrawlerMedicity import CrawlMedicity
+
+FIXTURES = Path(__file__).parent / "fixtures" / "vtex"
+
+
+def fixture_json(name):
+    return json.loads((FIXTURES / name).read_text())
+
+
+def json_response(url, body, headers=None):
+    return TextResponse(url, body=body, headers=headers, encoding="utf-8", request=Request(url))
+
+
+def api_spider():
+    crawler = get_crawler(CrawlMedicity, {"DISCOVERY_MODE": "api"})
+    spider = CrawlMedicity.from_crawler(crawler)
+    spider._api_products = set()
+    spider._in_stock_text = "Disponible"
+    return spider
+
+
+class VtexParsingTest(unittest.TestCase):
+
+    def test_category_paths_are_leaves(self):
+        self.assertEqual(vtex.category_paths(fixture_json("category_tree.json")), ["/1/15/", "/1/16/161/", "/2/"])
+
+    def test_search_params(self):
+        self.assertEqual(vtex.search_params("/1/15/", 50), {"fq": "C:/1/15/", "_from": "50", "_to": "99"})
+
+    def test_parse_resources(self):
+        self.assertEqual(vtex.parse_resources("0-49/1234"), 1234)
+        self.assertIsNone(vtex.parse_resources(None))
+        self.assertIsNone(vtex.parse_resources("bytes */1234"))
+
+    def test_product_data(self):
+        available, unavailable, no_images, no_skus = fixture_json("search_page.json")
+        self.assertEqual(vtex.product_data(available, "Disponible"), {
+            "url": "https://www.farmaciasmedicity.com/paracetamol-500-mg-x-20-tabletas/p",
+            "name": "Paracetamol 500 mg x 20 tabletas",
+            "price": "2.35",
+            "url_image": "https://farmaciasmedicity.vteximg.com.br/arquivos/ids/1551/10231.jpg",
+            "availability": "Disponible",
+        })
+        # Igual que el modo HTML, que guarda '' cuando la página no muestra stock
+        self.assertEqual(vtex.product_data(unavailable, "Disponible")["availability"], "")
+        self.assertEqual(vtex.product_data(no_images, "Disponible")["url_image"], "")
+        self.assertIsNone(vtex.product_data(no_skus, "Disponible"))
+
+
+class CatalogApiSpiderTest(unittest.TestCase):
+
+    tree_url = f"https://www.farmaciasmedicity.com{vtex.CATEGORY_TREE_PATH.format(depth=3)}"
+
+    def test_category_tree_requests_first_page_of_each_leaf(self):
+        spider = api_spider()
+        body = (FIXTURES / "category_tree.json").read_bytes()
+        requests = list(spider.parse_category_tree(json_response(self.tree_url, body)))
+        self.assertEqual([r.cb_kwargs for r in requests], [
+            {"category_path": path, "offset": 0} for path in ("/1/15/", "/1/16/161/", "/2/")
+        ])
+
+    def test_invalid_category_tree_falls_back_to_links(self):
+        spider = api_spider()
+        response = json_response(self.tree_url, b"<html><body>Estamos en mantenimiento</body></html>")
+        requests = list(spider.parse_category_tree(response))
+        self.assertTrue(requests)
+        self.assertTrue(all(r.callback != spider.parse_search_page for r in requests))
+        self.assertTrue(spider.crawler.stats.get_value("discovery/fallback"))
+
+    def test_search_page_builds_items_and_requests_remaining_pages(self):
+        spider = api_spider()
+        url = f"https://www.farmaciasmedicity.com{vtex.PRODUCT_SEARCH_PATH}?fq=C:/1/15/&_from=0&_to=49"
+        response = json_response(url, (FIXTURES / "search_page.json").read_bytes(), {"resources": "0-49/120"})
+        output = list(spider.parse_search_page(response, category_path="/1/15/", offset=0))
+
+        items = [o for o in output if not isinstance(o, Request)]
+        self.assertEqual([item.get("availability", "") for item in items], ["Disponible", ""])
+        self.assertEqual([item["pharma"] for item in items], ["Medicity", "Medicity"])
+
+        pages = [o.cb_kwargs["offset"] for o in output if isinstance(o, Request)]
+        self.assertEqual(pages, [50, 100])
+
+
+if __name__ == "__main__":
+    unittest.main()